@@ -0,0 +1,129 @@
+"""
+Badge engine benchmark.
+
+Replays a synthetic month of activity for many users against a rule set,
+comparing incremental evaluation (fold each activity into compact
+per-user state and check only the rules its metrics feed) with the naive
+approach of re-scanning the user's whole history against every rule on
+each write. Runs in memory; Mongo round trips are not included. Run from
+the backend directory:
+
+    python benchmarks/badges.py --users 100000 --rules 50
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'octofit_tracker.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from octofit_tracker.badges import BadgeEngine, Rule, advance, new_state, rebuild  # noqa: E402
+
+ACTIVITY_TYPES = ['Running', 'Swimming', 'Cycling', 'Weightlifting', 'Martial Arts', 'Yoga']
+
+
+def make_rules(count):
+    """``count`` rules spread over every metric with staggered thresholds"""
+    rules = []
+    metrics = [('activities', None), ('calories', None), ('minutes', None), ('streak', None)]
+    metrics += [('type_count', activity_type) for activity_type in ACTIVITY_TYPES]
+    for i in range(count):
+        metric, activity_type = metrics[i % len(metrics)]
+        level = i // len(metrics) + 1
+        threshold = {
+            'activities': 5 * level,
+            'calories': 2000 * level,
+            'minutes': 200 * level,
+            'streak': 2 * level,
+            'type_count': 2 * level,
+        }[metric]
+        rules.append(Rule(f'rule-{i}', f'Rule {i}', '', metric, threshold, activity_type))
+    return rules
+
+
+def make_activities(users, per_user, days, seed):
+    rng = random.Random(seed)
+    start = date.today() - timedelta(days=days)
+    activities = []
+    for user in range(users):
+        email = f'user{user}@school.edu'
+        for day in sorted(rng.sample(range(days), per_user)):
+            duration = rng.randint(15, 90)
+            activities.append({
+                'user_email': email,
+                'activity_type': rng.choice(ACTIVITY_TYPES),
+                'duration': duration,
+                'calories_burned': duration * rng.randint(5, 12),
+                'date': start + timedelta(days=day),
+            })
+    # Interleave users the way writes arrive, keeping each user's days in order
+    activities.sort(key=lambda activity: activity['date'])
+    return activities
+
+
+def run_incremental(engine, activities):
+    states = defaultdict(new_state)
+    awards = 0
+    started = time.perf_counter()
+    for activity in activities:
+        before = states[activity['user_email']]
+        after, keys = advance(before, [activity])
+        awards += len(engine.crossed(before, after, keys))
+        states[activity['user_email']] = after
+    return time.perf_counter() - started, awards
+
+
+def run_naive(engine, activities, sample, seed):
+    """
+    Time ``sample`` writes drawn uniformly from the whole replay, each
+    re-scanning the user's history as it stood at that write
+    """
+    timed = set(random.Random(seed).sample(range(len(activities)), sample))
+    history = defaultdict(list)
+    elapsed = 0.0
+    for i, activity in enumerate(activities):
+        user_history = history[activity['user_email']]
+        user_history.append(activity)
+        if i in timed:
+            started = time.perf_counter()
+            engine.earned(rebuild(user_history))
+            elapsed += time.perf_counter() - started
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--rules', type=int, default=50)
+    parser.add_argument('--per-user', type=int, default=20, help='Activities per user')
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--naive-sample', type=int, default=100000,
+                        help='Writes to time for the naive re-scan, which is extrapolated')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    engine = BadgeEngine(make_rules(args.rules))
+    activities = make_activities(args.users, args.per_user, args.days, args.seed)
+    print(f'{args.users} users, {len(engine.rules)} rules, {len(activities)} activities')
+
+    elapsed, awards = run_incremental(engine, activities)
+    print(f'incremental: {elapsed:6.2f}s  {len(activities) / elapsed:10.0f} writes/s  {awards} awards')
+
+    sample = min(args.naive_sample, len(activities))
+    naive = run_naive(engine, activities, sample, args.seed)
+    print(f'naive:       {naive * len(activities) / sample:6.2f}s  '
+          f'{sample / naive:10.0f} writes/s  (timed on {sample} writes sampled uniformly)')
+
+
+if __name__ == '__main__':
+    main()
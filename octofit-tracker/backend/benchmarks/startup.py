@@ -0,0 +1,86 @@
+"""
+Start-up benchmark for the octofit_tracker WSGI entry points.
+
+Each run starts a fresh interpreter, imports the WSGI module (which loads
+settings, apps and the URLconf and warms the Mongo connection) and then
+serves one request, reporting both timings. Run from the backend directory:
+
+    python benchmarks/startup.py --profile api --profile full --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+PROFILES = {
+    'full': ('octofit_tracker.wsgi', 'octofit_tracker.settings'),
+    'api': ('octofit_tracker.wsgi_api', 'octofit_tracker.settings_api'),
+}
+
+CHILD = '''
+import importlib, io, json, sys, time
+
+started = time.perf_counter()
+application = importlib.import_module(sys.argv[1]).application
+imported = time.perf_counter()
+
+statuses = []
+environ = {
+    'REQUEST_METHOD': 'GET',
+    'PATH_INFO': sys.argv[2],
+    'QUERY_STRING': '',
+    'SERVER_NAME': 'localhost',
+    'SERVER_PORT': '8000',
+    'HTTP_HOST': 'localhost',
+    'HTTP_ACCEPT': 'application/json',
+    'wsgi.url_scheme': 'http',
+    'wsgi.input': io.BytesIO(),
+    'wsgi.errors': sys.stderr,
+}
+body = b''.join(application(environ, lambda status, headers: statuses.append(status)))
+served = time.perf_counter()
+
+print(json.dumps({
+    'import': imported - started,
+    'first_request': served - imported,
+    'status': statuses[0],
+    'modules': len(sys.modules),
+}))
+'''
+
+
+def run_once(profile, path):
+    module, settings_module = PROFILES[profile]
+    env = dict(os.environ)
+    env['DJANGO_SETTINGS_MODULE'] = settings_module
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD, module, path],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--profile', action='append', choices=sorted(PROFILES))
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--path', default='/api/workouts/')
+    args = parser.parse_args()
+
+    for profile in args.profile or ['full', 'api']:
+        samples = [run_once(profile, args.path) for _ in range(args.runs)]
+        print(
+            f"{profile:>5}: import {statistics.median(s['import'] for s in samples) * 1000:7.1f} ms"
+            f"  first request {statistics.median(s['first_request'] for s in samples) * 1000:7.1f} ms"
+            f"  modules {samples[-1]['modules']}  status {samples[-1]['status']}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""
+Storage engine benchmark.
+
+Seeds users, activities and leaderboard entries with the indexes the
+models declare, then times the queries the viewsets and signals issue
+against plain mongomock (every query a full scan), the indexed in-memory
+store of OCTOFIT_STORAGE=memory and, given --mongo, a Mongo server. Each
+query runs for about --seconds and reports operations per second. Run
+from the backend directory:
+
+    python benchmarks/storage.py --users 10000 --per-user 10
+    python benchmarks/storage.py --mongo mongodb://localhost:27017
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'octofit_tracker.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+import mongomock  # noqa: E402
+from bson import ObjectId  # noqa: E402
+
+from octofit_tracker.leaderboard import POSITION_ORDER  # noqa: E402
+from octofit_tracker.memorydb.indexes import IndexedMongoClient  # noqa: E402
+from octofit_tracker.models import Activity, Leaderboard, User  # noqa: E402
+
+ACTIVITY_TYPES = ['Running', 'Swimming', 'Cycling', 'Weightlifting', 'Martial Arts', 'Yoga']
+TEAMS = [f'Team {i}' for i in range(20)]
+DATABASE = 'octofit_storage_benchmark'
+
+
+def index_specs(model):
+    """The index keys, and whether they are unique, a model's migrations create"""
+    specs = [
+        ([(name.lstrip('-'), -1 if name.startswith('-') else 1) for name in index.fields], False)
+        for index in model._meta.indexes
+    ]
+    specs += [
+        ([(field.column, 1)], True) for field in model._meta.fields if field.unique and not field.primary_key
+    ]
+    return specs
+
+
+def make_data(users, per_user, seed):
+    rng = random.Random(seed)
+    today = datetime.combine(datetime.today(), datetime.min.time())
+    user_documents, activity_documents, entries = [], [], []
+    for user in range(users):
+        email = f'user{user}@school.edu'
+        team = rng.choice(TEAMS)
+        user_documents.append({'_id': ObjectId(), 'name': f'User {user}', 'email': email, 'team': team})
+        total = 0
+        for day in range(per_user):
+            calories = rng.randint(100, 900)
+            total += calories
+            activity_documents.append({
+                '_id': ObjectId(),
+                'user_email': email,
+                'activity_type': rng.choice(ACTIVITY_TYPES),
+                'duration': rng.randint(15, 90),
+                'calories_burned': calories,
+                'date': today - timedelta(days=day),
+            })
+        entries.append({
+            '_id': ObjectId(), 'user_email': email, 'user_name': f'User {user}', 'team': team,
+            'total_calories': total, 'total_activities': per_user, 'rank': 0,
+        })
+    entries.sort(key=lambda entry: -entry['total_calories'])
+    for rank, entry in enumerate(entries, 1):
+        entry['rank'] = rank
+    return user_documents, activity_documents, entries
+
+
+def seed(database, data):
+    """Load the documents, then build the indexes, as a restore does"""
+    for model, documents in zip((User, Activity, Leaderboard), data):
+        collection = database[model._meta.db_table]
+        collection.drop()
+        collection.insert_many([dict(document) for document in documents])
+        for keys, unique in index_specs(model):
+            collection.create_index(keys, unique=unique)
+
+
+def scenarios(database, data, rng):
+    users, activities, leaderboard = (database[model._meta.db_table] for model in (User, Activity, Leaderboard))
+    user_documents, _, entries = data
+
+    def some_user():
+        return rng.choice(user_documents)
+
+    def some_entry():
+        return rng.choice(entries)
+
+    def neighbours():
+        entry = some_entry()
+        total, email = entry['total_calories'], entry['user_email']
+        reverse = [(field, -direction) for field, direction in POSITION_ORDER]
+        list(leaderboard.find({'$or': [
+            {'total_calories': {'$gt': total}},
+            {'total_calories': total, 'user_email': {'$lt': email}},
+        ]}).sort(reverse).limit(5))
+        list(leaderboard.find({'$or': [
+            {'total_calories': {'$lt': total}},
+            {'total_calories': total, 'user_email': {'$gt': email}},
+        ]}).sort(POSITION_ORDER).limit(5))
+
+    def log_activity():
+        user = some_user()
+        activities.insert_one({
+            'user_email': user['email'], 'activity_type': 'Running', 'duration': 30,
+            'calories_burned': 300, 'date': datetime.today(),
+        })
+        leaderboard.update_one({'user_email': user['email']}, {'$inc': {'total_calories': 300}})
+
+    counter = iter(range(10 ** 9))
+    return [
+        ('user by email', lambda: users.find_one({'email': some_user()['email']})),
+        ('team members', lambda: list(users.find({'team': rng.choice(TEAMS)}))),
+        ('user activities', lambda: list(activities.find({'user_email': some_user()['email']}).sort('date', -1))),
+        ('user totals', lambda: list(activities.aggregate([
+            {'$match': {'user_email': some_user()['email']}},
+            {'$group': {'_id': '$user_email', 'calories': {'$sum': '$calories_burned'}}},
+        ]))),
+        ('leaderboard rank', lambda: leaderboard.count_documents(
+            {'total_calories': {'$gt': some_entry()['total_calories']}}
+        )),
+        ('leaderboard neighbours', neighbours),
+        ('create user', lambda: users.insert_one(
+            {'name': 'New', 'email': f'new{next(counter)}@school.edu', 'team': rng.choice(TEAMS)}
+        )),
+        ('log activity', log_activity),
+    ]
+
+
+def measure(operation, seconds):
+    count = 0
+    started = time.perf_counter()
+    while True:
+        operation()
+        count += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= seconds and count >= 3:
+            return count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--per-user', type=int, default=10, help='Activities per user')
+    parser.add_argument('--seconds', type=float, default=1.0, help='Time spent on each query per engine')
+    parser.add_argument('--mongo', help='Also run against the Mongo server at this URL')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    data = make_data(args.users, args.per_user, args.seed)
+    engines = [
+        ('scan', mongomock.MongoClient()[DATABASE]),
+        ('indexed', IndexedMongoClient()[DATABASE]),
+    ]
+    if args.mongo:
+        import pymongo
+        engines.append(('mongo', pymongo.MongoClient(args.mongo)[DATABASE]))
+    print(f'{args.users} users, {len(data[1])} activities')
+
+    results = {}
+    for name, database in engines:
+        started = time.perf_counter()
+        seed(database, data)
+        print(f'{name}: seeded in {time.perf_counter() - started:.2f}s')
+        for scenario, operation in scenarios(database, data, random.Random(args.seed)):
+            results.setdefault(scenario, {})[name] = measure(operation, args.seconds)
+        if name == 'mongo':
+            database.client.drop_database(DATABASE)
+
+    names = [name for name, _ in engines]
+    print(f"{'ops/s':24s}" + ''.join(f'{name:>12s}' for name in names) + f"{'indexed/scan':>14s}")
+    for scenario, rates in results.items():
+        print(
+            f'{scenario:24s}' + ''.join(f'{rates[name]:12.1f}' for name in names)
+            + f"{rates['indexed'] / rates['scan']:13.0f}x"
+        )
+
+
+if __name__ == '__main__':
+    main()
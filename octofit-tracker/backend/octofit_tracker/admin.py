@@ -1,9 +1,59 @@
+from bson import ObjectId
+from django.conf import settings
 from django.contrib import admin
-from .models import User, Team, Activity, Leaderboard, Workout
+from django.core.cache import cache
+from .models import User, Team, Activity, Leaderboard, Workout, Challenge
+from .paginators import KeysetPaginator
+from .search import index_for_model
+
+
+class IndexedSearchMixin:
+    """
+    Answers changelist searches from the in-process prefix index instead
+    of case-insensitive regex scans over the collection
+    """
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return super().get_search_results(request, queryset, search_term)
+        ids = index_for_model[self.model].search_ids(search_term, limit=None)
+        return queryset.filter(pk__in=[ObjectId(doc_id) for doc_id in ids]), False
+
+
+class CachedAllValuesFieldListFilter(admin.AllValuesFieldListFilter):
+    """
+    Facet filter whose choices come from a cached Mongo distinct instead
+    of a distinct scan on every changelist load
+    """
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        super().__init__(field, request, params, model, model_admin, field_path)
+        key = f'admin-facets:{model._meta.db_table}:{field_path}'
+        choices = cache.get(key)
+        if choices is None:
+            choices = sorted(
+                value for value in model.objects.mongo_distinct(field_path) if value is not None
+            )
+            cache.set(key, choices, settings.ADMIN_FACET_CACHE_TIMEOUT)
+        self.lookup_choices = choices
+
+
+class LargeCollectionAdminMixin:
+    """
+    Changelist mode for collections with millions of documents: estimated
+    counts, keyset pagination and no second full COUNT
+    """
+    paginator = KeysetPaginator
+    show_full_result_count = False
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        return self.paginator(
+            queryset, per_page, orphans, allow_empty_first_page, client=request.session.session_key,
+        )
 
 
 @admin.register(User)
-class UserAdmin(admin.ModelAdmin):
+class UserAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ['name', 'email', 'team', 'created_at']
     list_filter = ['team', 'created_at']
     search_fields = ['name', 'email']
@@ -11,31 +61,39 @@ class UserAdmin(admin.ModelAdmin):
 
 
 @admin.register(Team)
-class TeamAdmin(admin.ModelAdmin):
+class TeamAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ['name', 'description', 'created_at']
     search_fields = ['name', 'description']
     ordering = ['name']
 
 
 @admin.register(Activity)
-class ActivityAdmin(admin.ModelAdmin):
+class ActivityAdmin(LargeCollectionAdminMixin, admin.ModelAdmin):
     list_display = ['user_email', 'activity_type', 'duration', 'calories_burned', 'date', 'created_at']
-    list_filter = ['activity_type', 'date', 'created_at']
+    list_filter = [('activity_type', CachedAllValuesFieldListFilter), 'date', 'created_at']
     search_fields = ['user_email', 'activity_type']
-    ordering = ['-date', '-created_at']
+    ordering = ['-date']
 
 
 @admin.register(Leaderboard)
-class LeaderboardAdmin(admin.ModelAdmin):
+class LeaderboardAdmin(LargeCollectionAdminMixin, admin.ModelAdmin):
     list_display = ['rank', 'user_name', 'team', 'total_calories', 'total_activities', 'updated_at']
-    list_filter = ['team']
+    list_filter = [('team', CachedAllValuesFieldListFilter)]
     search_fields = ['user_name', 'user_email']
     ordering = ['rank']
 
 
 @admin.register(Workout)
-class WorkoutAdmin(admin.ModelAdmin):
+class WorkoutAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ['name', 'activity_type', 'difficulty', 'duration', 'estimated_calories', 'created_at']
     list_filter = ['activity_type', 'difficulty', 'created_at']
     search_fields = ['name', 'description', 'activity_type']
     ordering = ['name']
+
+
+@admin.register(Challenge)
+class ChallengeAdmin(admin.ModelAdmin):
+    list_display = ['name', 'metric', 'activity_type', 'scope', 'start', 'end', 'created_at']
+    list_filter = ['metric', 'scope', 'start', 'end']
+    search_fields = ['name', 'description']
+    ordering = ['-start']
@@ -0,0 +1,192 @@
+import hashlib
+from datetime import date, datetime
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import User, Activity, Leaderboard
+
+
+ACTIVITY_COLUMNS = ['user_email', 'activity_type', 'duration', 'calories_burned', 'date']
+DEFAULT_TREND_WEEKS = 8
+
+
+class ActivityColumns:
+    """
+    Activity history held as parallel NumPy arrays
+    """
+
+    def __init__(self, emails, types, durations, calories, dates):
+        self.emails = emails
+        self.types = types
+        self.durations = durations
+        self.calories = calories
+        self.dates = dates
+
+    def __len__(self):
+        return len(self.calories)
+
+    @classmethod
+    def load(cls, emails, since=None):
+        """
+        Load the activity columns of the given users with one Mongo query,
+        only activities dated on or after ``since`` if it is given
+        """
+        projection = {'_id': 0}
+        projection.update({name: 1 for name in ACTIVITY_COLUMNS})
+        query = {'user_email': {'$in': list(emails)}}
+        if since is not None:
+            # Dates are stored as midnight datetimes
+            query['date'] = {'$gte': datetime.combine(since, datetime.min.time())}
+        cursor = Activity.objects.mongo_find(query, projection)
+        columns = {name: [] for name in ACTIVITY_COLUMNS}
+        for document in cursor:
+            for name in ACTIVITY_COLUMNS:
+                columns[name].append(document.get(name))
+        return cls(
+            np.array(columns['user_email'], dtype=object),
+            np.array(columns['activity_type'], dtype=object),
+            np.array(columns['duration'], dtype=np.int64),
+            np.array(columns['calories_burned'], dtype=np.int64),
+            np.array(columns['date'], dtype='datetime64[D]'),
+        )
+
+
+def team_calorie_totals():
+    """Total calories per team, summed over the maintained leaderboard entries"""
+    pipeline = [{'$group': {'_id': '$team', 'total': {'$sum': '$total_calories'}}}]
+    return {row['_id']: row['total'] for row in Leaderboard.objects.mongo_aggregate(pipeline)}
+
+
+def leaderboard_percentile(total):
+    """
+    ``percentile_rank`` of a calorie total among the leaderboard entries,
+    from counts on the total_calories index rather than a pass over every
+    activity
+    """
+    size = Leaderboard.objects.mongo_estimated_document_count()
+    if not size:
+        return None
+    below = Leaderboard.objects.mongo_count_documents({'total_calories': {'$lt': total}})
+    equal = Leaderboard.objects.mongo_count_documents({'total_calories': total})
+    return round(100.0 * (below + 0.5 * equal) / size, 1)
+
+
+def percentile_rank(value, population):
+    """Percentage of the population below ``value``, counting ties as half"""
+    population = np.asarray(population)
+    if population.size == 0:
+        return None
+    below = np.count_nonzero(population < value)
+    equal = np.count_nonzero(population == value)
+    return round(100.0 * (below + 0.5 * equal) / population.size, 1)
+
+
+def type_breakdown(columns):
+    if not len(columns):
+        return []
+    types, inverse = np.unique(columns.types, return_inverse=True)
+    counts = np.bincount(inverse)
+    durations = np.bincount(inverse, weights=columns.durations)
+    calories = np.bincount(inverse, weights=columns.calories)
+    return [
+        {
+            'activity_type': str(activity_type),
+            'count': int(count),
+            'avg_duration': round(float(duration / count), 1),
+            'avg_calories': round(float(calorie / count), 1),
+        }
+        for activity_type, count, duration, calorie in zip(types, counts, durations, calories)
+    ]
+
+
+def streaks(columns, today=None):
+    """Longest and current runs of consecutive active days"""
+    if not len(columns):
+        return {'current': 0, 'longest': 0}
+    today = np.datetime64(today or date.today(), 'D')
+    days = np.unique(columns.dates)
+    breaks = np.flatnonzero(np.diff(days).astype(np.int64) != 1)
+    starts = np.concatenate(([0], breaks + 1))
+    ends = np.concatenate((breaks, [days.size - 1]))
+    lengths = ends - starts + 1
+    gap = int((today - days[-1]).astype(np.int64))
+    current = int(lengths[-1]) if gap <= 1 else 0
+    return {'current': current, 'longest': int(lengths.max())}
+
+
+def weekly_trend(columns, weeks=DEFAULT_TREND_WEEKS, today=None):
+    """Calories and minutes per week for the last ``weeks`` weeks, oldest first"""
+    today = np.datetime64(today or date.today(), 'D')
+    # 1970-01-01 was a Thursday, so shifting by three days aligns weeks to Monday
+    this_week = (today.astype(np.int64) + 3) // 7
+    week_numbers = (columns.dates.astype(np.int64) + 3) // 7
+    offsets = this_week - week_numbers
+    mask = (offsets >= 0) & (offsets < weeks)
+    index = (weeks - 1) - offsets[mask]
+    calories = np.bincount(index, weights=columns.calories[mask], minlength=weeks)
+    durations = np.bincount(index, weights=columns.durations[mask], minlength=weeks)
+    previous = np.concatenate(([np.nan], calories[:-1]))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change = np.where(previous > 0, (calories - previous) / previous * 100.0, np.nan)
+    week_starts = (np.arange(this_week - weeks + 1, this_week + 1) * 7 - 3).astype('datetime64[D]')
+    return [
+        {
+            'week_start': str(week_start),
+            'calories': int(calorie),
+            'duration': int(duration),
+            'change_pct': None if np.isnan(pct) else round(float(pct), 1),
+        }
+        for week_start, calorie, duration, pct in zip(week_starts, calories, durations, change)
+    ]
+
+
+def summarize(columns):
+    return {
+        'total_activities': len(columns),
+        'total_duration': int(columns.durations.sum()),
+        'total_calories': int(columns.calories.sum()),
+        'by_type': type_breakdown(columns),
+        'streaks': streaks(columns),
+        'weekly_trend': weekly_trend(columns),
+    }
+
+
+def _cache_key(scope, value):
+    return f'analytics:{scope}:{hashlib.md5(value.encode()).hexdigest()}'
+
+
+def user_analytics(email):
+    key = _cache_key('user', email)
+    result = cache.get(key)
+    if result is None:
+        result = summarize(ActivityColumns.load([email]))
+        result['email'] = email
+        result['percentile'] = leaderboard_percentile(result['total_calories'])
+        cache.set(key, result, settings.ANALYTICS_CACHE_TIMEOUT)
+    return result
+
+
+def team_analytics(team):
+    key = _cache_key('team', team)
+    result = cache.get(key)
+    if result is None:
+        emails = list(User.objects.filter(team=team).values_list('email', flat=True))
+        columns = ActivityColumns.load(emails)
+        result = summarize(columns)
+        result['team'] = team
+        result['members'] = len(emails)
+        team_totals = team_calorie_totals()
+        result['percentile'] = percentile_rank(team_totals.get(team, 0), list(team_totals.values()))
+        cache.set(key, result, settings.ANALYTICS_CACHE_TIMEOUT)
+    return result
+
+
+def invalidate(email):
+    """Drop cached analytics for a user and their team"""
+    keys = [_cache_key('user', email)]
+    team = User.objects.filter(email=email).values_list('team', flat=True).first()
+    if team is not None:
+        keys.append(_cache_key('team', team))
+    cache.delete_many(keys)
@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+
+
+class OctofitTrackerConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'octofit_tracker'
+
+    def ready(self):
+        from pymongo import monitoring
+        from . import signals  # noqa: F401
+        from .slowlog import recorder
+        from .throttling import pool_monitor
+
+        monitoring.register(pool_monitor)
+        monitoring.register(recorder)
@@ -2,6 +2,8 @@
 ASGI config for octofit_tracker project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Requests for the leaderboard event stream are served by a Server-Sent Events
+app; everything else goes to Django.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
@@ -13,4 +15,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'octofit_tracker.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from .streaming import LEADERBOARD_STREAM_PATH, leaderboard_stream, watch_change_stream  # noqa: E402
+from .warmup import warm  # noqa: E402
+
+warm()
+watch_change_stream()
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] == LEADERBOARD_STREAM_PATH:
+        await leaderboard_stream(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -0,0 +1,13 @@
+"""
+ASGI config for the API-only runtime profile of octofit_tracker.
+
+It exposes the ASGI callable as a module-level variable named ``application``
+using ``octofit_tracker.settings_api``, with the same leaderboard event
+stream routing as ``octofit_tracker.asgi``.
+"""
+
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'octofit_tracker.settings_api')
+
+from .asgi import application  # noqa: E402,F401
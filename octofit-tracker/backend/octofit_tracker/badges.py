@@ -0,0 +1,351 @@
+import bisect
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from .models import Activity, BadgeState, BadgeAward
+
+
+DUPLICATE_KEY = 11000
+MAX_ATTEMPTS = 5
+
+# Metrics a rule can set a threshold on, and the activity field each follows
+METRIC_FIELDS = {
+    'activities': None,
+    'calories': 'calories_burned',
+    'minutes': 'duration',
+    'type_count': 'activity_type',
+    'streak': 'date',
+}
+# The activity fields badge state is computed from
+HISTORY_FIELDS = ['date', 'calories_burned', 'duration', 'activity_type']
+
+
+class Rule:
+    """
+    A badge earned when a per-user metric reaches a threshold
+
+    ``type_count`` rules also name the activity type they count.
+    """
+
+    def __init__(self, slug, name, description, metric, threshold, activity_type=None):
+        if metric not in METRIC_FIELDS:
+            raise ValueError(f'unknown badge metric: {metric}')
+        if (metric == 'type_count') != (activity_type is not None):
+            raise ValueError('activity_type is required for, and only for, type_count rules')
+        self.slug = slug
+        self.name = name
+        self.description = description
+        self.metric = metric
+        self.threshold = threshold
+        self.activity_type = activity_type
+
+    @property
+    def key(self):
+        return f'type_count:{self.activity_type}' if self.activity_type else self.metric
+
+    def as_dict(self):
+        return {
+            'slug': self.slug,
+            'name': self.name,
+            'description': self.description,
+            'metric': self.metric,
+            'threshold': self.threshold,
+            'activity_type': self.activity_type,
+        }
+
+
+RULES = [
+    Rule('first-steps', 'First Steps', 'Log your first activity', 'activities', 1),
+    Rule('regular', 'Regular', 'Log 10 activities', 'activities', 10),
+    Rule('committed', 'Committed', 'Log 50 activities', 'activities', 50),
+    Rule('centurion', 'Centurion', 'Log 100 activities', 'activities', 100),
+    Rule('spark', 'Spark', 'Burn 1,000 calories', 'calories', 1000),
+    Rule('furnace', 'Furnace', 'Burn 10,000 calories', 'calories', 10000),
+    Rule('inferno', 'Inferno', 'Burn 50,000 calories', 'calories', 50000),
+    Rule('hour-of-power', 'Hour of Power', 'Train for 60 minutes in total', 'minutes', 60),
+    Rule('marathoner', 'Marathoner', 'Train for 1,000 minutes in total', 'minutes', 1000),
+    Rule('on-a-roll', 'On a Roll', 'Train 3 days in a row', 'streak', 3),
+    Rule('week-warrior', 'Week Warrior', 'Train 7 days in a row', 'streak', 7),
+    Rule('unstoppable', 'Unstoppable', 'Train 30 days in a row', 'streak', 30),
+    Rule('runner', 'Runner', 'Log 10 runs', 'type_count', 10, 'Running'),
+    Rule('swimmer', 'Swimmer', 'Log 10 swims', 'type_count', 10, 'Swimming'),
+    Rule('cyclist', 'Cyclist', 'Log 10 rides', 'type_count', 10, 'Cycling'),
+    Rule('lifter', 'Lifter', 'Log 10 weightlifting sessions', 'type_count', 10, 'Weightlifting'),
+    Rule('yogi', 'Yogi', 'Log 10 yoga sessions', 'type_count', 10, 'Yoga'),
+    Rule('fighter', 'Fighter', 'Log 10 martial arts sessions', 'type_count', 10, 'Martial Arts'),
+]
+
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def new_state():
+    return {
+        'activities': 0,
+        'calories': 0,
+        'minutes': 0,
+        'type_counts': {},
+        'streak': 0,
+        'longest_streak': 0,
+        'last_date': None,
+    }
+
+
+def metric_value(state, key):
+    if key == 'streak':
+        return state['longest_streak']
+    if key.startswith('type_count:'):
+        return state['type_counts'].get(key.split(':', 1)[1], 0)
+    return state[key]
+
+
+def advance(state, activities):
+    """
+    Fold new activities into a user's state
+
+    Returns the new state and the rule keys whose metric may have grown, or
+    None when an activity predates the user's last activity day, since the
+    streak then has to be rebuilt from history.
+    """
+    state = dict(state, type_counts=dict(state['type_counts']))
+    keys = {'activities'}
+    for activity in sorted(activities, key=lambda activity: activity['date']):
+        day = _as_date(activity['date'])
+        last = state['last_date']
+        if last is not None and day < last:
+            return None, None
+        state['activities'] += 1
+        if activity['calories_burned'] > 0:
+            state['calories'] += activity['calories_burned']
+            keys.add('calories')
+        if activity['duration'] > 0:
+            state['minutes'] += activity['duration']
+            keys.add('minutes')
+        activity_type = activity['activity_type']
+        state['type_counts'][activity_type] = state['type_counts'].get(activity_type, 0) + 1
+        keys.add(f'type_count:{activity_type}')
+        if day != last:
+            state['streak'] = state['streak'] + 1 if last == day - timedelta(days=1) else 1
+            state['last_date'] = day
+            if state['streak'] > state['longest_streak']:
+                state['longest_streak'] = state['streak']
+                keys.add('streak')
+    return state, keys
+
+
+def rebuild(activities):
+    """A user's state computed from their whole activity history"""
+    state = new_state()
+    if activities:
+        state, _ = advance(state, activities)
+    return state
+
+
+class BadgeEngine:
+    """
+    Evaluates badge rules against changes in per-user state
+
+    Rules are indexed by the metric they follow, and each metric's rules
+    are sorted by threshold, so an update only looks at the metrics its
+    activities touched and finds newly crossed thresholds by bisection.
+    """
+
+    def __init__(self, rules):
+        self.rules = {rule.slug: rule for rule in rules}
+        by_key = defaultdict(list)
+        for rule in rules:
+            by_key[rule.key].append(rule)
+        self._index = {}
+        for key, key_rules in by_key.items():
+            key_rules.sort(key=lambda rule: rule.threshold)
+            self._index[key] = ([rule.threshold for rule in key_rules], key_rules)
+
+    def crossed(self, before, after, keys):
+        """Rules whose thresholds lie in (before, after] for the given keys"""
+        earned = []
+        for key in keys:
+            indexed = self._index.get(key)
+            if indexed is None:
+                continue
+            thresholds, rules = indexed
+            old, new = metric_value(before, key), metric_value(after, key)
+            if new > old:
+                earned.extend(rules[bisect.bisect_right(thresholds, old):bisect.bisect_right(thresholds, new)])
+        return earned
+
+    def earned(self, state):
+        """Every rule a state satisfies"""
+        return [
+            rule
+            for key, (thresholds, rules) in self._index.items()
+            for rule in rules[:bisect.bisect_right(thresholds, metric_value(state, key))]
+        ]
+
+
+engine = BadgeEngine(RULES)
+
+
+def _decode_type_counts(stored):
+    # Stored as [{type, count}] pairs; activity types are free text and may
+    # hold '.' or a leading '$', which Mongo rejects in field names
+    if isinstance(stored, dict):
+        return dict(stored)
+    return {pair['type']: pair['count'] for pair in stored}
+
+
+def _load_states(emails):
+    states = {}
+    for document in BadgeState.objects.mongo_find({'user_email': {'$in': list(emails)}}):
+        state = {field: document.get(field, default) for field, default in new_state().items()}
+        state['last_date'] = _as_date(state['last_date'])
+        state['type_counts'] = _decode_type_counts(state['type_counts'])
+        states[document['user_email']] = (state, document['version'])
+    return states
+
+
+def _history(email):
+    return list(Activity.objects.mongo_find(
+        {'user_email': email}, {'_id': 0, **dict.fromkeys(HISTORY_FIELDS, 1)}
+    ))
+
+
+def _document(state):
+    document = dict(state)
+    document['type_counts'] = [
+        {'type': activity_type, 'count': count} for activity_type, count in sorted(state['type_counts'].items())
+    ]
+    if document['last_date'] is not None:
+        document['last_date'] = datetime.combine(document['last_date'], datetime.min.time())
+    return document
+
+
+def _save_state(email, state, version):
+    """Write a state unless another process changed it since it was read"""
+    document = dict(_document(state), version=version + 1)
+    if not version:
+        try:
+            BadgeState.objects.mongo_insert_one(dict(document, user_email=email))
+        except DuplicateKeyError:
+            return False
+        return True
+    result = BadgeState.objects.mongo_update_one({'user_email': email, 'version': version}, {'$set': document})
+    return result.matched_count == 1
+
+
+def _award(pairs):
+    """Store (email, rule) awards, ignoring ones already held"""
+    if not pairs:
+        return
+    now = timezone.now().replace(tzinfo=None)
+    try:
+        BadgeAward.objects.mongo_insert_many(
+            [{'user_email': email, 'badge': rule.slug, 'awarded_at': now} for email, rule in pairs],
+            ordered=False,
+        )
+    except BulkWriteError as exc:
+        if any(error['code'] != DUPLICATE_KEY for error in exc.details['writeErrors']):
+            raise
+
+
+def apply_activities(activities):
+    """
+    Update badge state for newly created activities and award any badges
+    they earn
+
+    Activities are grouped by user, so a batch costs one state read, one
+    conditional state write per user and one award insert.
+    """
+    by_user = defaultdict(list)
+    for activity in activities:
+        by_user[activity['user_email']].append(activity)
+    pending = dict(by_user)
+    awards = []
+    for _ in range(MAX_ATTEMPTS):
+        if not pending:
+            break
+        states = _load_states(pending)
+        lost = {}
+        for email, user_activities in pending.items():
+            before, version = states.get(email, (new_state(), 0))
+            after, keys = advance(before, user_activities)
+            if after is None:
+                # Backdated activity; its history already includes it
+                after = rebuild(_history(email))
+                earned = engine.earned(after)
+            else:
+                earned = engine.crossed(before, after, keys)
+            if _save_state(email, after, version):
+                awards.extend((email, rule) for rule in earned)
+            else:
+                lost[email] = user_activities
+        pending = lost
+    for email in pending:
+        refresh(email)
+    _award(awards)
+
+
+def apply_activity(activity):
+    apply_activities([{
+        'user_email': activity.user_email,
+        'activity_type': activity.activity_type,
+        'duration': activity.duration,
+        'calories_burned': activity.calories_burned,
+        'date': activity.date,
+    }])
+
+
+def refresh(email):
+    """
+    Recompute a user's state from their activity history
+
+    Used after activities are edited or deleted. Badges already awarded
+    are kept.
+    """
+    for _ in range(MAX_ATTEMPTS):
+        state = rebuild(_history(email))
+        version = _load_states([email]).get(email, (None, 0))[1]
+        if _save_state(email, state, version):
+            _award([(email, rule) for rule in engine.earned(state)])
+            return state
+    raise RuntimeError(f'could not refresh badge state for {email}')
+
+
+def rebuild_all():
+    """
+    Compute every user's state and badges from the activity history, after
+    badge state was cleared
+
+    The history is grouped by user in one aggregation rather than read
+    with a query per user. Returns the number of users.
+    """
+    histories = Activity.objects.mongo_aggregate([
+        {'$group': {
+            '_id': '$user_email',
+            'activities': {'$push': {field: f'${field}' for field in HISTORY_FIELDS}},
+        }},
+    ], allowDiskUse=True)
+    states, awards = [], []
+    for history in histories:
+        state = rebuild(history['activities'])
+        states.append(dict(_document(state), user_email=history['_id'], version=1))
+        awards.extend((history['_id'], rule) for rule in engine.earned(state))
+    if states:
+        BadgeState.objects.mongo_insert_many(states, ordered=False)
+    _award(awards)
+    return len(states)
+
+
+def awards_for(email):
+    """A user's badges, most recent first"""
+    awards = BadgeAward.objects.mongo_find(
+        {'user_email': email}, {'_id': 0, 'badge': 1, 'awarded_at': 1}
+    ).sort('awarded_at', -1)
+    return [
+        dict(engine.rules[award['badge']].as_dict(), awarded_at=award['awarded_at'])
+        for award in awards
+        if award['badge'] in engine.rules
+    ]
@@ -0,0 +1,73 @@
+import threading
+
+from rest_framework.renderers import JSONRenderer
+
+from . import versions
+from .models import Workout
+from .serializers import WorkoutSerializer
+from .sharedcache import SharedCache
+
+
+VERSION_NAME = 'workouts'
+
+
+def _encode():
+    return JSONRenderer().render(WorkoutSerializer(Workout.objects.all(), many=True).data)
+
+
+class CatalogSnapshot:
+    """
+    Immutable view of the workout catalog with lookup indexes
+
+    Rows are shared by every request reading the snapshot and must not be
+    mutated; copy a row before adding to it.
+    """
+
+    def __init__(self, workouts, version, payload=None):
+        self.workouts = tuple(workouts)
+        self.version = version
+        # JSON encoding of ``workouts``, shared with the other workers
+        self.payload = payload
+        by_difficulty = {}
+        by_type = {}
+        for workout in self.workouts:
+            by_difficulty.setdefault(workout['difficulty'], []).append(workout)
+            by_type.setdefault(workout['activity_type'], []).append(workout)
+        self.by_difficulty = {key: tuple(rows) for key, rows in by_difficulty.items()}
+        self.by_type = {key: tuple(rows) for key, rows in by_type.items()}
+
+
+class WorkoutCatalog:
+    """
+    Holds the current catalog snapshot
+
+    Readers take the current snapshot without locking. A write replaces
+    the snapshot in one assignment and bumps the shared version stamp, so
+    other worker processes reload on their next read. Reloads decode the
+    shared segment, so only one worker per version queries Mongo.
+    """
+
+    def __init__(self):
+        self._snapshot = None
+        self._load_lock = threading.Lock()
+        self.shared = SharedCache(VERSION_NAME, _encode)
+
+    def load(self):
+        with self._load_lock:
+            segment = self.shared.get()
+            self._snapshot = CatalogSnapshot(segment.value(), segment.version, segment.payload)
+        return self._snapshot
+
+    def snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != versions.current(VERSION_NAME):
+            snapshot = self.load()
+        return snapshot
+
+    def changed(self):
+        """Publish a catalog change to this and every other worker"""
+        self.shared.changed()
+        self.load()
+
+
+catalog = WorkoutCatalog()
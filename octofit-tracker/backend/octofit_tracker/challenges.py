@@ -0,0 +1,251 @@
+import threading
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from bson import ObjectId
+from django.utils import timezone
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from . import versions
+from .models import User, Activity, Challenge, ChallengeProgress
+
+
+VERSION_NAME = 'challenges'
+INDIVIDUAL = 'individual'
+TEAM = 'team'
+DUPLICATE_KEY = 11000
+# Longest allowed challenge window, in days
+MAX_DAYS = 366
+# Activities logged this many days after a challenge ends still count
+LATE_DAYS = 31
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 500
+
+CHALLENGE_FIELDS = ['_id', 'name', 'start', 'end', 'metric', 'activity_type', 'scope']
+
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _now():
+    return timezone.now().replace(tzinfo=None)
+
+
+def contribution(challenge, activity):
+    """What an activity adds to a participant's progress in a challenge"""
+    metric = challenge['metric']
+    if metric == 'calories':
+        return activity['calories_burned']
+    if metric == 'minutes':
+        return activity['duration']
+    if metric == 'type_count':
+        return 1 if activity['activity_type'] == challenge['activity_type'] else 0
+    return 1
+
+
+class ChallengeIndex:
+    """
+    Open challenges bucketed by day
+
+    Finding the challenges an activity counts towards is one dict lookup
+    on its date, however many challenges run at once. The index is rebuilt
+    when any process changes a challenge (via a shared version stamp) and
+    when the date rolls over.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+
+    def load(self, version=None):
+        version = versions.current(VERSION_NAME) if version is None else version
+        today = date.today()
+        cutoff = datetime.combine(today - timedelta(days=LATE_DAYS), datetime.min.time())
+        by_day = defaultdict(list)
+        for row in Challenge.objects.mongo_find({'end': {'$gte': cutoff}}, dict.fromkeys(CHALLENGE_FIELDS, 1)):
+            row['_id'] = str(row['_id'])
+            row['start'], row['end'] = _as_date(row['start']), _as_date(row['end'])
+            day = row['start']
+            while day <= row['end']:
+                by_day[day].append(row)
+                day += timedelta(days=1)
+        with self._lock:
+            self._state = (version, today, dict(by_day))
+
+    def _current(self):
+        state = self._state
+        if state is None or state[0] != versions.current(VERSION_NAME) or state[1] != date.today():
+            self.load()
+            state = self._state
+        return state
+
+    def on(self, day):
+        """Challenges whose window contains ``day``"""
+        return self._current()[2].get(_as_date(day), ())
+
+    def changed(self):
+        self.load(versions.bump(VERSION_NAME))
+
+
+index = ChallengeIndex()
+
+
+def _teams(emails):
+    return {
+        user['email']: user['team']
+        for user in User.objects.mongo_find({'email': {'$in': list(emails)}}, {'email': 1, 'team': 1})
+    }
+
+
+def _upsert(operations):
+    """Run upserts of progress entries in one unordered bulk write"""
+    if not operations:
+        return
+    try:
+        ChallengeProgress.objects.mongo_bulk_write(operations, ordered=False)
+    except BulkWriteError as exc:
+        errors = exc.details['writeErrors']
+        if any(error['code'] != DUPLICATE_KEY for error in errors):
+            raise
+        # Concurrent upserts of a new participant; the entry exists now
+        ChallengeProgress.objects.mongo_bulk_write([operations[error['index']] for error in errors], ordered=False)
+
+
+def _write(deltas):
+    """Apply summed (challenge id, participant) deltas in one bulk write"""
+    now = _now()
+    _upsert([
+        UpdateOne(
+            {'challenge_id': challenge_id, 'participant': participant},
+            {'$inc': {'value': delta}, '$set': {'updated_at': now}},
+            upsert=True,
+        )
+        for (challenge_id, participant), delta in deltas.items()
+        if delta
+    ])
+
+
+def apply_activities(activities, sign=1):
+    """
+    Add (or with ``sign=-1`` remove) activities' contributions to the
+    progress of every challenge open on their dates
+
+    A batch costs at most one user lookup for team challenges and one bulk
+    write, with one $inc per (challenge, participant).
+    """
+    matched = []
+    needs_team = set()
+    for activity in activities:
+        for challenge in index.on(activity['date']):
+            amount = contribution(challenge, activity)
+            if amount:
+                matched.append((challenge, activity['user_email'], amount))
+                if challenge['scope'] == TEAM:
+                    needs_team.add(activity['user_email'])
+    if not matched:
+        return
+    teams = _teams(needs_team) if needs_team else {}
+    deltas = defaultdict(int)
+    for challenge, email, amount in matched:
+        participant = teams.get(email) if challenge['scope'] == TEAM else email
+        if participant:
+            deltas[challenge['_id'], participant] += sign * amount
+    _write(deltas)
+
+
+def activity_fields(activity):
+    return {
+        'user_email': activity.user_email,
+        'activity_type': activity.activity_type,
+        'duration': activity.duration,
+        'calories_burned': activity.calories_burned,
+        'date': activity.date,
+    }
+
+
+def rebuild(challenge):
+    """
+    Recompute a challenge's progress from the activities in its window;
+    used when a challenge is created or its definition changes
+    """
+    challenge_id = str(challenge.pk)
+    match = {
+        'date': {
+            '$gte': datetime.combine(challenge.start, datetime.min.time()),
+            '$lte': datetime.combine(challenge.end, datetime.min.time()),
+        },
+    }
+    if challenge.metric == 'type_count':
+        match['activity_type'] = challenge.activity_type
+    amount = {'calories': '$calories_burned', 'minutes': '$duration'}.get(challenge.metric, 1)
+    totals = {
+        row['_id']: row['value']
+        for row in Activity.objects.mongo_aggregate([
+            {'$match': match},
+            {'$group': {'_id': '$user_email', 'value': {'$sum': amount}}},
+        ])
+    }
+    if challenge.scope == TEAM:
+        teams = _teams(totals)
+        team_totals = defaultdict(int)
+        for email, value in totals.items():
+            if teams.get(email):
+                team_totals[teams[email]] += value
+        totals = team_totals
+    # Entries are overwritten in place rather than deleted and reinserted,
+    # since other processes may already be $inc-ing them. An increment for
+    # an activity written after the aggregate ran but applied before this
+    # write is overwritten or removed; the next rebuild restores it.
+    now = _now()
+    _upsert([
+        UpdateOne(
+            {'challenge_id': challenge_id, 'participant': participant},
+            {'$set': {'value': value, 'updated_at': now}},
+            upsert=True,
+        )
+        for participant, value in totals.items()
+    ])
+    ChallengeProgress.objects.mongo_delete_many(
+        {'challenge_id': challenge_id, 'participant': {'$nin': list(totals)}}
+    )
+
+
+def rebuild_on(days):
+    """Rebuild every challenge open on any of ``days``; used when activities
+    reached Mongo without their progress being applied"""
+    ids = {challenge['_id'] for day in days for challenge in index.on(day)}
+    for challenge in Challenge.objects.filter(pk__in=[ObjectId(challenge_id) for challenge_id in ids]):
+        rebuild(challenge)
+
+
+def standings(challenge, offset=0, limit=DEFAULT_LIMIT):
+    """
+    A page of a challenge's standings with competition ranks
+
+    Read in order from the (challenge_id, value) index; only the rank of
+    the first row on a later page needs a count.
+    """
+    challenge_id = str(challenge.pk)
+    scope = {'challenge_id': challenge_id, 'value': {'$gt': 0}}
+    rows = list(
+        ChallengeProgress.objects.mongo_find(scope, {'_id': 0, 'participant': 1, 'value': 1})
+        .sort([('value', -1), ('participant', 1)])
+        .skip(offset)
+        .limit(limit)
+    )
+    entries = []
+    rank = None
+    for position, row in enumerate(rows):
+        if position == 0:
+            rank = 1 if offset == 0 else 1 + ChallengeProgress.objects.mongo_count_documents(
+                {'challenge_id': challenge_id, 'value': {'$gt': row['value']}}
+            )
+        elif row['value'] != rows[position - 1]['value']:
+            rank = offset + position + 1
+        entries.append({'rank': rank, 'participant': row['participant'], 'value': row['value']})
+    return {
+        'participants': ChallengeProgress.objects.mongo_count_documents(scope),
+        'results': entries,
+    }
@@ -0,0 +1,112 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from .models import User, Team, Activity, Leaderboard, Workout, Sequence, Change
+
+
+UPSERT = 'upsert'
+DELETE = 'delete'
+SEQUENCE_NAME = 'changes'
+PRUNED_NAME = 'changes.pruned'
+
+TRACKED_MODELS = {model._meta.db_table: model for model in (User, Team, Activity, Leaderboard, Workout)}
+
+
+def _now():
+    # Stored the way Django stores datetimes in Mongo, as naive UTC
+    return timezone.now().replace(tzinfo=None)
+
+
+def allocate(name, count=1):
+    """Reserve ``count`` consecutive values of a named counter; returns the first"""
+    try:
+        sequence = Sequence.objects.mongo_find_one_and_update(
+            {'name': name},
+            {'$inc': {'value': count}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        # Another process created the counter between our lookup and insert
+        return allocate(name, count)
+    return sequence['value'] - count + 1
+
+
+def current(name=SEQUENCE_NAME):
+    sequence = Sequence.objects.mongo_find_one({'name': name})
+    return sequence['value'] if sequence else 0
+
+
+def record(model, object_ids, op=UPSERT):
+    """
+    Append changes to the feed, one sequence number per object
+
+    ORM saves and deletes are recorded by signals; code that writes to Mongo
+    directly must call this for the documents it touched.
+    """
+    object_ids = [str(object_id) for object_id in object_ids]
+    if not object_ids:
+        return
+    first = allocate(SEQUENCE_NAME, len(object_ids))
+    now = _now()
+    Change.objects.mongo_insert_many([
+        {
+            'seq': first + i,
+            'collection': model._meta.db_table,
+            'object_id': object_id,
+            'op': op,
+            'created_at': now,
+        }
+        for i, object_id in enumerate(object_ids)
+    ])
+
+
+def read(since, limit):
+    """
+    Changes after ``since`` in sequence order, and whether more follow
+
+    Sequence numbers are reserved before their changes are written, so a
+    change can land after a later one. Reading stops at a gap until the
+    change after it is older than CHANGE_FEED_SETTLE_SECONDS; a gap that
+    persists that long belongs to a writer that failed.
+    """
+    changes = list(
+        Change.objects.mongo_find({'seq': {'$gt': since}}, {'_id': 0}).sort('seq', 1).limit(limit + 1)
+    )
+    settled = _now() - timedelta(seconds=settings.CHANGE_FEED_SETTLE_SECONDS)
+    expected = since + 1
+    taken = []
+    for change in changes[:limit]:
+        if change['seq'] != expected and change['created_at'] > settled:
+            break
+        taken.append(change)
+        expected = change['seq'] + 1
+    return taken, len(changes) > len(taken)
+
+
+def is_expired(since):
+    """Whether changes after ``since`` have been pruned from the feed"""
+    return since < current(PRUNED_NAME)
+
+
+def prune(older_than):
+    """Drop changes older than a timedelta; clients behind them must resync"""
+    cutoff = _now() - older_than
+    newest = Change.objects.mongo_find_one({'created_at': {'$lte': cutoff}}, sort=[('seq', -1)])
+    if newest is None:
+        return 0
+    Sequence.objects.mongo_update_one(
+        {'name': PRUNED_NAME}, {'$max': {'value': newest['seq']}}, upsert=True
+    )
+    return Change.objects.mongo_delete_many({'seq': {'$lte': newest['seq']}}).deleted_count
+
+
+def expire_all():
+    """Expire every sync token issued so far, e.g. after a bulk restore"""
+    Sequence.objects.mongo_update_one(
+        {'name': PRUNED_NAME}, {'$max': {'value': allocate(SEQUENCE_NAME)}}, upsert=True
+    )
@@ -0,0 +1,85 @@
+import hashlib
+import json
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from pymongo.errors import DuplicateKeyError
+
+from .models import IdempotencyKey
+
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def fingerprint(data):
+    """Stable hash of a request payload"""
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _now():
+    # Stored the way Django stores datetimes in Mongo, as naive UTC
+    return timezone.now().replace(tzinfo=None)
+
+
+def claim(scope, key, request_hash):
+    """
+    Claim an idempotency key for a request
+
+    The insert is checked by the unique index on ``key``, so a retry is
+    detected with one index lookup. Returns ``(lease, None)`` when the key
+    was claimed and ``(None, record)`` when it is already in use; the
+    lease identifies this claim to ``complete`` and ``release``.
+
+    A claim still unfinished IDEMPOTENCY_LEASE_SECONDS after it was taken
+    belongs to a request that died before releasing it, and a retry with
+    the same payload takes it over.
+    """
+    lease = uuid.uuid4().hex
+    now = _now()
+    try:
+        IdempotencyKey.objects.mongo_insert_one({
+            'key': f'{scope}:{key}',
+            'request_hash': request_hash,
+            'status_code': None,
+            'response_body': None,
+            'lease': lease,
+            'leased_at': now,
+            'created_at': now,
+        })
+    except DuplicateKeyError:
+        record = IdempotencyKey.objects.mongo_find_one({'key': f'{scope}:{key}'})
+        if record is None:
+            # The key expired between the insert and the lookup
+            return claim(scope, key, request_hash)
+        expires = now - timedelta(seconds=settings.IDEMPOTENCY_LEASE_SECONDS)
+        if (
+            record['status_code'] is None
+            and record['request_hash'] == request_hash
+            and (record.get('leased_at') or record['created_at']) < expires
+        ):
+            # Only one retry can swap out the lease it read
+            taken = IdempotencyKey.objects.mongo_find_one_and_update(
+                {'key': f'{scope}:{key}', 'status_code': None, 'lease': record.get('lease')},
+                {'$set': {'lease': lease, 'leased_at': now}},
+            )
+            if taken is not None:
+                return lease, None
+            return claim(scope, key, request_hash)
+        return None, record
+    return lease, None
+
+
+def complete(scope, key, lease, status_code, data):
+    """Store the response of a claimed request, unless its lease was taken over"""
+    IdempotencyKey.objects.mongo_update_one(
+        {'key': f'{scope}:{key}', 'lease': lease},
+        {'$set': {'status_code': status_code, 'response_body': json.dumps(data, default=str)}},
+    )
+
+
+def release(scope, key, lease):
+    """Give up a claim so the request can be retried, unless its lease was taken over"""
+    IdempotencyKey.objects.mongo_delete_one({'key': f'{scope}:{key}', 'lease': lease})
@@ -0,0 +1,279 @@
+import atexit
+import fcntl
+import glob
+import logging
+import os
+import threading
+import uuid
+from collections import defaultdict
+from datetime import datetime, time
+
+from bson import ObjectId, json_util
+from django.conf import settings
+from django.utils import timezone
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from . import badges, challenges, changes, leaderboard
+from .models import Activity
+from .streaming import broadcaster
+
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+RETRY_SECONDS = 1.0
+
+
+def _journal_dir():
+    return os.path.join(settings.OCTOFIT_RUNTIME_DIR, 'journal')
+
+
+def _invalidate_analytics(emails):
+    from .analytics import invalidate
+    for email in emails:
+        invalidate(email)
+
+
+def _insert(documents):
+    """
+    Insert documents, skipping ones already in Mongo; returns those inserted
+
+    Every document is recorded in the change feed, including ones an earlier,
+    failed attempt already wrote, since that attempt never got to record them.
+    """
+    inserted = documents
+    try:
+        Activity.objects.mongo_insert_many(documents, ordered=False)
+    except BulkWriteError as exc:
+        errors = exc.details['writeErrors']
+        if any(error['code'] != DUPLICATE_KEY for error in errors):
+            raise
+        duplicates = {error['index'] for error in errors}
+        inserted = [document for i, document in enumerate(documents) if i not in duplicates]
+    changes.record(Activity, [document['_id'] for document in documents])
+    return inserted
+
+
+def _publish(emails):
+    if emails:
+        _invalidate_analytics(emails)
+        broadcaster.notify()
+
+
+class ActivityJournal:
+    """
+    Write-behind buffer for activity creation
+
+    Each write is appended to a journal file owned by this process and
+    acknowledged once the file is fsynced; concurrent writers share a
+    single fsync. A background thread group-commits the buffered activities
+    to Mongo every few milliseconds with one insert_many and one merged
+    leaderboard update per user.
+
+    Journals are locked by their process. On start-up, journals whose lock
+    can be taken belonged to a process that died, and their un-flushed
+    entries are inserted and the affected leaderboard entries reconciled.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._file = None
+        self._thread = None
+        self._stopping = False
+        self._seq = 0
+        self._synced = 0
+        self._pending = []
+        self._unreconciled = set()
+        self._stale_days = set()
+
+    @property
+    def is_open(self):
+        return self._file is not None
+
+    def open(self):
+        with self._lock:
+            if self._file is not None:
+                return
+            directory = _journal_dir()
+            os.makedirs(directory, exist_ok=True)
+            self.replay_orphans(directory)
+            path = os.path.join(directory, f'activities-{os.getpid()}-{uuid.uuid4().hex[:8]}.journal')
+            journal = open(path, 'a+b')
+            fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            self._file = journal
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='activity-journal', daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    def close(self):
+        """Flush everything buffered and remove this process's journal"""
+        with self._lock:
+            journal, thread = self._file, self._thread
+            if journal is None:
+                return
+            self._stopping = True
+        self._wake.set()
+        thread.join()
+        try:
+            while self.flush():
+                pass
+        except PyMongoError as exc:
+            logger.warning('Activity journal %s left for replay: %s', journal.name, exc)
+        with self._lock:
+            if not self._pending:
+                os.unlink(journal.name)
+            journal.close()
+            self._file = self._thread = None
+
+    def append(self, data):
+        """Journal a validated activity and return it as an unsaved instance"""
+        if not self.is_open:
+            self.open()
+        activity = Activity(_id=ObjectId(), created_at=timezone.now(), **data)
+        document = {
+            '_id': activity._id,
+            'user_email': activity.user_email,
+            'activity_type': activity.activity_type,
+            'duration': activity.duration,
+            'calories_burned': activity.calories_burned,
+            'date': datetime.combine(activity.date, time()),
+            'created_at': activity.created_at.replace(tzinfo=None),
+        }
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            self._file.write(json_util.dumps({'seq': seq, 'doc': document}).encode() + b'\n')
+            self._pending.append((seq, document))
+        self._sync(seq)
+        self._wake.set()
+        return activity
+
+    def _sync(self, seq):
+        # Whoever takes the sync lock fsyncs every write appended so far, so
+        # writers that queued behind it find their entry already durable
+        with self._sync_lock:
+            if self._synced >= seq:
+                return
+            with self._lock:
+                self._file.flush()
+                target = self._seq
+            os.fsync(self._file.fileno())
+            self._synced = target
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(settings.ACTIVITY_JOURNAL_FLUSH_INTERVAL)
+            self._wake.clear()
+            try:
+                while self.flush() >= settings.ACTIVITY_JOURNAL_BATCH_SIZE:
+                    pass
+            except PyMongoError as exc:
+                logger.warning('Activity group commit failed, retrying: %s', exc)
+                self._wake.wait(RETRY_SECONDS)
+            except Exception:
+                logger.exception('Activity group commit failed')
+                self._wake.wait(RETRY_SECONDS)
+
+    def flush(self):
+        """Group-commit one batch of durable entries; returns its size"""
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self):
+        if self._unreconciled:
+            _publish(leaderboard.reconcile(self._unreconciled))
+            for email in self._unreconciled:
+                badges.refresh(email)
+            self._unreconciled.clear()
+        if self._stale_days:
+            challenges.rebuild_on(self._stale_days)
+            self._stale_days.clear()
+        with self._lock:
+            batch = [
+                entry for entry in self._pending[:settings.ACTIVITY_JOURNAL_BATCH_SIZE]
+                if entry[0] <= self._synced
+            ]
+        if not batch:
+            return 0
+        documents = [document for _, document in batch]
+        try:
+            inserted = _insert(documents)
+        except Exception:
+            # Part of the batch may have been written; those documents come
+            # back as duplicates on the retry, so recompute their users instead
+            self._unreconciled.update(document['user_email'] for document in documents)
+            self._stale_days.update(document['date'] for document in documents)
+            raise
+        through = batch[-1][0]
+        with self._lock:
+            del self._pending[:len(batch)]
+        deltas = defaultdict(lambda: [0, 0])
+        for document in inserted:
+            delta = deltas[document['user_email']]
+            delta[0] += document['calories_burned']
+            delta[1] += 1
+        try:
+            _publish(leaderboard.apply_activities(deltas))
+            badges.apply_activities(inserted)
+            challenges.apply_activities(inserted)
+        except PyMongoError:
+            # The batch is in Mongo; recompute these users on the next flush
+            self._unreconciled.update(deltas)
+            self._stale_days.update(document['date'] for document in inserted)
+            raise
+        with self._lock:
+            self._file.write(json_util.dumps({'flushed': through}).encode() + b'\n')
+            self._file.flush()
+            if not self._pending and self._file.tell() > settings.ACTIVITY_JOURNAL_COMPACT_BYTES:
+                self._file.truncate(0)
+        return len(batch)
+
+    @staticmethod
+    def read(path):
+        """Entries of a journal that were not flushed to Mongo"""
+        entries = {}
+        with open(path, 'rb') as journal:
+            for line in journal:
+                try:
+                    record = json_util.loads(line)
+                except ValueError:
+                    # A torn final write was never acknowledged
+                    break
+                if 'flushed' in record:
+                    for seq in [seq for seq in entries if seq <= record['flushed']]:
+                        del entries[seq]
+                else:
+                    entries[record['seq']] = record['doc']
+        return [entries[seq] for seq in sorted(entries)]
+
+    def replay_orphans(self, directory=None):
+        """Recover the journals of processes that exited without flushing"""
+        recovered = 0
+        for path in sorted(glob.glob(os.path.join(directory or _journal_dir(), '*.journal'))):
+            if self._file is not None and path == self._file.name:
+                continue
+            with open(path, 'rb') as journal:
+                try:
+                    fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # still owned by a live process
+                documents = self.read(path)
+                if documents:
+                    _insert(documents)
+                    emails = {document['user_email'] for document in documents}
+                    _publish(leaderboard.reconcile(emails))
+                    for email in emails:
+                        badges.refresh(email)
+                    challenges.rebuild_on({document['date'] for document in documents})
+                    recovered += len(documents)
+                os.unlink(path)
+        if recovered:
+            logger.info('Replayed %d journaled activities', recovered)
+        return recovered
+
+
+activity_journal = ActivityJournal()
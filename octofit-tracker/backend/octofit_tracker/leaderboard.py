@@ -0,0 +1,255 @@
+from django.conf import settings
+from django.utils import timezone
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from rest_framework.renderers import JSONRenderer
+
+from . import changes
+from .loaders import UserLoader
+from .models import Activity, Leaderboard
+from .serializers import LeaderboardSerializer
+from .sharedcache import SharedCache
+
+
+VERSION_NAME = 'leaderboard'
+DEFAULT_NEIGHBOURS = 5
+MAX_NEIGHBOURS = 50
+STANDING_FIELDS = ['user_email', 'user_name', 'team', 'total_calories', 'total_activities', 'rank']
+STANDING_PROJECTION = {**dict.fromkeys(STANDING_FIELDS, 1), '_id': 0}
+# Board order, the key order of the position indexes; sorts on the board
+# use it or its exact reverse so Mongo walks the index instead of sorting
+POSITION_ORDER = [('total_calories', -1), ('user_email', 1)]
+
+
+def _increment(email, calories, activities, upsert=False, users=None):
+    update = {
+        '$inc': {'total_calories': calories, 'total_activities': activities},
+        '$set': {'updated_at': timezone.now()},
+    }
+    if upsert:
+        user = (users or UserLoader()).load(email)
+        update['$setOnInsert'] = {
+            'user_name': user.name if user else email,
+            'team': user.team if user else '',
+        }
+    return Leaderboard.objects.mongo_find_one_and_update(
+        {'user_email': email},
+        update,
+        upsert=upsert,
+        return_document=ReturnDocument.BEFORE,
+    )
+
+
+def apply_activity(email, calories, activities=1, publish=True, users=None):
+    """
+    Add an activity's calories to a user's leaderboard entry and keep
+    competition ranks (1 + number of entries with more calories) current
+
+    Only the entries whose totals lie between the user's old and new
+    total move, so the update is a range shift on the total_calories
+    index rather than a re-rank of the whole board. Returns the old and
+    new totals. With ``publish`` False the caller bumps the board stamp;
+    ``users`` is a UserLoader to resolve the name and team of a new entry.
+
+    The shift, the count and the user's own rank are separate writes, so
+    concurrent updates can leave ranks slightly off; totals are always
+    exact. ``rerank`` (the rerank_leaderboard command) corrects them and
+    is meant to run periodically.
+    """
+    previous = _increment(email, calories, activities)
+    if previous is None:
+        if calories <= 0 and activities <= 0:
+            return 0, 0
+        try:
+            previous = _increment(email, calories, activities, upsert=True, users=users)
+        except DuplicateKeyError:
+            # A concurrent first activity created the entry; add to it
+            previous = _increment(email, calories, activities)
+    old = previous['total_calories'] if previous else 0
+    new = old + calories
+    if new != old:
+        shifted = {
+            'total_calories': {'$gte': min(old, new), '$lt': max(old, new)},
+            'user_email': {'$ne': email},
+        }
+        shifted_ids = [entry['_id'] for entry in Leaderboard.objects.mongo_find(shifted, {'_id': 1})]
+        if shifted_ids:
+            Leaderboard.objects.mongo_update_many(
+                {'_id': {'$in': shifted_ids}}, {'$inc': {'rank': 1 if new > old else -1}}
+            )
+            changes.record(Leaderboard, shifted_ids)
+    rank = 1 + Leaderboard.objects.mongo_count_documents({'total_calories': {'$gt': new}})
+    entry = Leaderboard.objects.mongo_find_one_and_update(
+        {'user_email': email}, {'$set': {'rank': rank}}, projection={'_id': 1}
+    )
+    changes.record(Leaderboard, [entry['_id']])
+    if publish:
+        board.changed(immediate=False)
+    return old, new
+
+
+def apply_activities(deltas):
+    """
+    Apply per-user (calories, activities) deltas, one update per user
+    and one board stamp bump for the batch; users without an entry yet
+    are looked up together, with one query, when the first is created
+
+    Returns the emails whose entries changed.
+    """
+    changed = []
+    users = UserLoader()
+    users.prime(deltas)
+    for email, (calories, activities) in deltas.items():
+        if calories or activities:
+            apply_activity(email, calories, activities, publish=False, users=users)
+            changed.append(email)
+    if changed:
+        board.changed(immediate=False)
+    return changed
+
+
+def reconcile(emails):
+    """
+    Bring the entries of these users back in line with their activities
+
+    Used after replaying journaled writes, where it is not known which
+    leaderboard updates were already applied before a crash.
+    """
+    emails = list(emails)
+    totals = {
+        row['_id']: (row['calories'], row['activities'])
+        for row in Activity.objects.mongo_aggregate([
+            {'$match': {'user_email': {'$in': emails}}},
+            {'$group': {
+                '_id': '$user_email',
+                'calories': {'$sum': '$calories_burned'},
+                'activities': {'$sum': 1},
+            }},
+        ])
+    }
+    current = {
+        entry['user_email']: (entry['total_calories'], entry['total_activities'])
+        for entry in Leaderboard.objects.mongo_find(
+            {'user_email': {'$in': emails}},
+            {'user_email': 1, 'total_calories': 1, 'total_activities': 1},
+        )
+    }
+    deltas = {}
+    for email in emails:
+        calories, activities = totals.get(email, (0, 0))
+        recorded_calories, recorded_activities = current.get(email, (0, 0))
+        deltas[email] = (calories - recorded_calories, activities - recorded_activities)
+    return apply_activities(deltas)
+
+
+def rerank():
+    """
+    Recompute every competition rank from the totals in one ordered scan
+    of the position index, writing only the ranks that changed; returns
+    how many changed
+    """
+    operations = []
+    changed_ids = []
+    rank = position = 0
+    previous_total = None
+    entries = Leaderboard.objects.mongo_find({}, {'_id': 1, 'total_calories': 1, 'rank': 1}).sort(POSITION_ORDER)
+    for entry in entries:
+        position += 1
+        if entry['total_calories'] != previous_total:
+            rank, previous_total = position, entry['total_calories']
+        if entry.get('rank') != rank:
+            operations.append(UpdateOne({'_id': entry['_id']}, {'$set': {'rank': rank}}))
+            changed_ids.append(entry['_id'])
+    if operations:
+        Leaderboard.objects.mongo_bulk_write(operations, ordered=False)
+        changes.record(Leaderboard, changed_ids)
+        board.changed()
+    return len(operations)
+
+
+def _encode():
+    return JSONRenderer().render(LeaderboardSerializer(Leaderboard.objects.all().order_by('rank'), many=True).data)
+
+
+# The full board as served by /api/leaderboard/; activity writes change it
+# constantly, so workers rebuild it at most once per staleness interval
+board = SharedCache(VERSION_NAME, _encode, max_age=lambda: settings.LEADERBOARD_MAX_STALENESS_MS / 1000)
+
+
+def _neighbours(scope, entry, k):
+    """
+    The k entries either side of an entry within a scope, ordered by total
+    calories then email, read by seeking on the position indexes
+    """
+    if k == 0:
+        # Mongo reads limit(0) as no limit at all
+        return [], []
+    total, email = entry['total_calories'], entry['user_email']
+    above = list(
+        Leaderboard.objects.mongo_find(
+            {**scope, '$or': [
+                {'total_calories': {'$gt': total}},
+                {'total_calories': total, 'user_email': {'$lt': email}},
+            ]},
+            STANDING_PROJECTION,
+        ).sort([(field, -direction) for field, direction in POSITION_ORDER]).limit(k)
+    )
+    above.reverse()
+    below = list(
+        Leaderboard.objects.mongo_find(
+            {**scope, '$or': [
+                {'total_calories': {'$lt': total}},
+                {'total_calories': total, 'user_email': {'$gt': email}},
+            ]},
+            STANDING_PROJECTION,
+        ).sort(POSITION_ORDER).limit(k)
+    )
+    return above, below
+
+
+def _percentile(rank, size):
+    """Percentage of the board the user ranks level with or above"""
+    return round(100 * (size - rank + 1) / size, 1)
+
+
+def standing(email, k):
+    """
+    A user's rank, percentile and k neighbours on the whole board and
+    within their team, or None if the user has no leaderboard entry
+
+    The global rank is the maintained ``rank`` field and the board size
+    comes from collection metadata. Within a team the rank is counted on
+    the (team, total_calories) index.
+    """
+    entry = Leaderboard.objects.mongo_find_one({'user_email': email}, STANDING_PROJECTION)
+    if entry is None:
+        return None
+    size = Leaderboard.objects.mongo_estimated_document_count()
+    above, below = _neighbours({}, entry, k)
+    result = {
+        'entry': entry,
+        'global': {
+            'rank': entry['rank'],
+            'size': size,
+            'percentile': _percentile(entry['rank'], size),
+            'above': above,
+            'below': below,
+        },
+        'team': None,
+    }
+    if entry['team']:
+        scope = {'team': entry['team']}
+        rank = 1 + Leaderboard.objects.mongo_count_documents(
+            {**scope, 'total_calories': {'$gt': entry['total_calories']}}
+        )
+        size = Leaderboard.objects.mongo_count_documents(scope)
+        above, below = _neighbours(scope, entry, k)
+        result['team'] = {
+            'name': entry['team'],
+            'rank': rank,
+            'size': size,
+            'percentile': _percentile(rank, size),
+            'above': above,
+            'below': below,
+        }
+    return result
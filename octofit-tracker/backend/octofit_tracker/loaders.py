@@ -0,0 +1,47 @@
+from .models import User
+
+
+class UserLoader:
+    """
+    Request-scoped batching loader for users keyed by email
+
+    Emails are queued with ``prime`` and resolved together with a single
+    ``$in`` query the first time any of them is loaded. Results, including
+    misses, are kept in an identity map so each user is fetched at most
+    once per request and every lookup returns the same instance.
+    """
+
+    def __init__(self):
+        self._users = {}
+        self._queue = set()
+
+    def prime(self, emails):
+        self._queue.update(email for email in emails if email not in self._users)
+
+    def dispatch(self):
+        emails, self._queue = self._queue, set()
+        if not emails:
+            return
+        self._users.update(dict.fromkeys(emails))
+        for user in User.objects.filter(email__in=list(emails)):
+            self._users[user.email] = user
+
+    def load(self, email):
+        """The user with this email, or None"""
+        if email not in self._users:
+            self._queue.add(email)
+            self.dispatch()
+        return self._users[email]
+
+    def load_many(self, emails):
+        self.prime(emails)
+        self.dispatch()
+        return {email: self._users[email] for email in emails}
+
+
+def user_loader(request):
+    """The loader for this request, created on first use"""
+    loader = getattr(request, '_user_loader', None)
+    if loader is None:
+        loader = request._user_loader = UserLoader()
+    return loader
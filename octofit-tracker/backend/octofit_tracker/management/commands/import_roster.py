@@ -0,0 +1,41 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from octofit_tracker import roster
+
+
+class Command(BaseCommand):
+    help = 'Bulk import users or teams from a CSV or NDJSON roster file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Roster file')
+        parser.add_argument('--kind', choices=sorted(roster.RosterImport.kinds), default='users')
+        parser.add_argument('--format', choices=roster.FORMATS, help='Defaults to the file extension')
+        parser.add_argument('--ordered', action='store_true', help='Stop at the first row that fails to insert')
+        parser.add_argument('--report', help='Write the per-row report to this NDJSON file')
+
+    def handle(self, *args, **options):
+        format = options['format'] or ('csv' if options['path'].lower().endswith('.csv') else 'ndjson')
+        importer = roster.RosterImport(options['kind'], ordered=options['ordered'])
+        started = time.monotonic()
+        try:
+            source = open(options['path'], encoding='utf-8-sig', newline='')
+        except OSError as exc:
+            raise CommandError(f"Cannot read {options['path']}: {exc}")
+        report = open(options['report'], 'w') if options['report'] else None
+        try:
+            for entry in importer.run(roster.read_rows(source, format)):
+                if report:
+                    report.write(json.dumps(entry) + '\n')
+                elif entry['status'] != roster.CREATED:
+                    self.stdout.write(json.dumps(entry))
+        finally:
+            source.close()
+            if report:
+                report.close()
+        counts = ', '.join(f'{count} {status}' for status, count in sorted(importer.summary.items()))
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {options["kind"]} in {time.monotonic() - started:.1f}s: {counts or "no rows"}'
+        ))
@@ -1,4 +1,6 @@
+from bson import ObjectId
 from django.core.management.base import BaseCommand
+from django.utils import timezone
 from datetime import date, timedelta
 from octofit_tracker.models import User, Team, Activity, Leaderboard, Workout
 
@@ -11,10 +13,10 @@ class Command(BaseCommand):
 
         # Delete existing data
         self.stdout.write('Deleting existing data...')
+        Leaderboard.objects.all().delete()
         User.objects.all().delete()
         Team.objects.all().delete()
         Activity.objects.all().delete()
-        Leaderboard.objects.all().delete()
         Workout.objects.all().delete()
 
         # Create Teams
@@ -53,7 +55,20 @@ class Command(BaseCommand):
             user = User.objects.create(**hero)
             users.append(user)
 
-        # Create Activities
+        # Seed a leaderboard entry per user from the users just created, so
+        # the activity signals below add to entries instead of looking each
+        # user up to create one
+        now = timezone.now().replace(tzinfo=None)
+        Leaderboard.objects.mongo_insert_many([
+            {
+                '_id': ObjectId(), 'user_email': user.email, 'user_name': user.name,
+                'team': user.team, 'total_calories': 0, 'total_activities': 0,
+                'rank': 1, 'updated_at': now,
+            }
+            for user in users
+        ])
+
+        # Create Activities (this also builds the leaderboard)
         self.stdout.write('Creating activities...')
         activity_types = ['Running', 'Swimming', 'Cycling', 'Weightlifting', 'Martial Arts', 'Yoga']
         
@@ -72,33 +87,6 @@ class Command(BaseCommand):
                     date=activity_date
                 )
 
-        # Create Leaderboard
-        self.stdout.write('Creating leaderboard...')
-        leaderboard_data = []
-        for user in users:
-            activities = Activity.objects.filter(user_email=user.email)
-            total_calories = sum(a.calories_burned for a in activities)
-            total_activities = activities.count()
-            
-            leaderboard_data.append({
-                'user': user,
-                'total_calories': total_calories,
-                'total_activities': total_activities
-            })
-
-        # Sort by calories and assign ranks
-        leaderboard_data.sort(key=lambda x: x['total_calories'], reverse=True)
-        
-        for rank, data in enumerate(leaderboard_data, start=1):
-            Leaderboard.objects.create(
-                user_email=data['user'].email,
-                user_name=data['user'].name,
-                team=data['user'].team,
-                total_calories=data['total_calories'],
-                total_activities=data['total_activities'],
-                rank=rank
-            )
-
         # Create Workouts
         self.stdout.write('Creating workouts...')
         workouts = [
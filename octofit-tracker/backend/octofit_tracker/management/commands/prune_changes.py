@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from octofit_tracker import changes
+
+
+class Command(BaseCommand):
+    help = 'Drop change feed entries older than the given number of days'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Keep changes from this many days')
+
+    def handle(self, *args, **options):
+        removed = changes.prune(timedelta(days=options['days']))
+        self.stdout.write(self.style.SUCCESS(f'Pruned {removed} changes'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from octofit_tracker import leaderboard
+
+
+class Command(BaseCommand):
+    help = 'Recompute leaderboard ranks from totals; run periodically to correct drift from concurrent writes'
+
+    def handle(self, *args, **options):
+        changed = leaderboard.rerank()
+        self.stdout.write(self.style.SUCCESS(f'Corrected {changed} ranks'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from octofit_tracker import snapshots
+
+
+class Command(BaseCommand):
+    help = 'Load a snapshot written by the snapshot command, building indexes after the data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Snapshot directory')
+        parser.add_argument(
+            '--collection', action='append', dest='collections',
+            help='Restore only this collection; repeat for several',
+        )
+        parser.add_argument('--jobs', type=int, default=4, help='Threads inserting chunks')
+        parser.add_argument('--drop', action='store_true', help='Replace collections that already hold documents')
+
+    def handle(self, *args, **options):
+        try:
+            throughput = snapshots.restore(
+                options['directory'], options['collections'], jobs=options['jobs'], drop=options['drop']
+            )
+        except snapshots.SnapshotError as exc:
+            raise CommandError(str(exc))
+        for line in throughput.lines()[:-1]:
+            self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS(f'Restored {throughput.lines()[-1]}'))
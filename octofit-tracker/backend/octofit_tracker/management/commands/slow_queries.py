@@ -0,0 +1,79 @@
+from bson import json_util
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from octofit_tracker import slowlog
+from octofit_tracker.models import SlowQuery
+
+
+SORT_FIELDS = {'total': 'total_ms', 'max': 'max_ms', 'count': 'count'}
+# A plan reading this many documents per document returned needs a better index
+SCAN_RATIO = 10
+
+
+def missing_index(query, indexes):
+    """
+    The index keys a logged query lacks, or None when it scans little or
+    an existing index already starts with them
+    """
+    scanned = 'COLLSCAN' in query['plan'] or (
+        query.get('docs_examined') is not None
+        and query['docs_examined'] > SCAN_RATIO * max(query.get('returned') or 0, 1)
+    )
+    if not scanned:
+        return None
+    shape = json_util.loads(query['shape'])
+    keys = slowlog.suggest_index(shape['filter'], shape['sort'])
+    if not keys:
+        return None
+    fields = [field for field, _ in keys]
+    for index in indexes.values():
+        if [field for field, _ in index['key']][:len(fields)] == fields:
+            return None
+    return keys
+
+
+class Command(BaseCommand):
+    help = 'List the slowest logged Mongo queries, their plans and the indexes they lack'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=10, help='Number of query shapes to list')
+        parser.add_argument('--sort', choices=sorted(SORT_FIELDS), default='total', help='Rank by total time, worst time or count')
+        parser.add_argument('--clear', action='store_true', help='Delete the log instead of listing it')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            removed = SlowQuery.objects.mongo_delete_many({}).deleted_count
+            self.stdout.write(self.style.SUCCESS(f'Cleared {removed} slow query shapes'))
+            return
+        queries = list(
+            SlowQuery.objects.mongo_find({}, {'_id': 0}).sort(SORT_FIELDS[options['sort']], -1).limit(options['limit'])
+        )
+        if not queries:
+            self.stdout.write('No slow queries logged')
+            return
+        connection.ensure_connection()
+        indexes = {}
+        for rank, query in enumerate(queries, 1):
+            collection = query['collection']
+            if collection not in indexes:
+                indexes[collection] = connection.connection[collection].index_information()
+            sources = ', '.join(query.get('sources') or ['(no view)'])
+            self.stdout.write(
+                f"{rank}. {query['operation']} {collection} from {sources}: {query['count']}x, "
+                f"avg {query['total_ms'] / query['count']:.0f} ms, max {query['max_ms']:.0f} ms"
+            )
+            self.stdout.write(f"   shape {query['shape']}")
+            if query.get('explained_at') is None:
+                self.stdout.write('   plan not explained yet')
+                continue
+            self.stdout.write(
+                f"   plan {query['plan'] or '?'}"
+                f"{' using ' + ', '.join(query['indexes_used']) if query.get('indexes_used') else ''}; "
+                f"keys examined {query.get('keys_examined')}, docs examined {query.get('docs_examined')}, "
+                f"returned {query.get('returned')}"
+            )
+            keys = missing_index(query, indexes[collection])
+            if keys:
+                spec = ', '.join(f'{field}: {direction}' for field, direction in keys)
+                self.stdout.write(self.style.WARNING(f'   missing index {{{spec}}}'))
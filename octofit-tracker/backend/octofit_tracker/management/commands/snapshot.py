@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from octofit_tracker import snapshots
+
+
+class Command(BaseCommand):
+    help = 'Write the core collections and their indexes to a directory of compressed BSON chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Directory for the snapshot; must not hold one already')
+        parser.add_argument(
+            '--collection', action='append', choices=snapshots.COLLECTIONS, dest='collections',
+            help='Snapshot only this collection; repeat for several',
+        )
+        parser.add_argument('--jobs', type=int, default=4, help='Threads compressing and writing chunks')
+        parser.add_argument('--chunk-documents', type=int, default=snapshots.CHUNK_DOCUMENTS, help='Documents per chunk file')
+
+    def handle(self, *args, **options):
+        try:
+            manifest, throughput = snapshots.dump(
+                options['directory'],
+                options['collections'] or snapshots.COLLECTIONS,
+                jobs=options['jobs'],
+                chunk_documents=options['chunk_documents'],
+            )
+        except snapshots.SnapshotError as exc:
+            raise CommandError(str(exc))
+        for line in throughput.lines()[:-1]:
+            self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS(f"Snapshot written to {options['directory']}: {throughput.lines()[-1]}"))
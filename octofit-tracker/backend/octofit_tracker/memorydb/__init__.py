@@ -0,0 +1,27 @@
+"""
+In-process storage engine for octofit_tracker
+
+A djongo backend whose client is an in-memory Mongo implementation
+(mongomock) instead of a connection to a server, selected with
+``OCTOFIT_STORAGE=memory``. Data lives in the process and is lost when it
+exits, so use it for tests and single-process demo instances only.
+
+Every operation on the store runs under one process-wide lock, so
+read-modify-write updates stay atomic across request and background
+threads. The indexes created by the migrations are kept too (see
+indexes.py): equality, ``$in`` and range conditions on their leading
+fields read only the matching documents instead of scanning the
+collection. Documents a query returns are still copied, so queries that
+match much of a collection stay as slow as a scan. Run the test suite on
+this engine, and compare it with plain mongomock, with:
+
+    OCTOFIT_STORAGE=memory python manage.py test octofit_tracker
+    python benchmarks/storage.py
+"""
+
+ENGINE = 'octofit_tracker.memorydb'
+
+
+def in_use(connection):
+    """Whether a Django connection stores its data with this engine"""
+    return connection.settings_dict['ENGINE'] == ENGINE
@@ -0,0 +1,124 @@
+import threading
+from collections import OrderedDict
+
+from django.core.exceptions import ImproperlyConfigured
+from djongo import base
+from djongo.base import DjongoClient
+
+
+_client = None
+_client_lock = threading.Lock()
+# mongomock only guards its dicts, so read-modify-write operations such as
+# $inc and find_one_and_update can interleave; every operation holds this lock
+_store_lock = threading.RLock()
+
+
+class _Locked:
+    """
+    A mongomock database, collection or command cursor whose methods run
+    under the store lock
+
+    Databases, collections and cursors they return are wrapped in turn.
+    """
+
+    def __init__(self, target):
+        object.__setattr__(self, '_target', target)
+
+    def __getattr__(self, name):
+        with _store_lock:
+            value = getattr(self._target, name)
+        if not callable(value):
+            return _wrap(value)
+
+        def locked(*args, **kwargs):
+            with _store_lock:
+                result = value(*args, **kwargs)
+            return self if result is self._target else _wrap(result)
+        locked.__name__ = name
+        return locked
+
+    def __getitem__(self, key):
+        with _store_lock:
+            return _wrap(self._target[key])
+
+    def __iter__(self):
+        with _store_lock:
+            return iter(list(self._target))
+
+    def __eq__(self, other):
+        return self._target == getattr(other, '_target', other)
+
+    def __hash__(self):
+        return hash(self._target)
+
+    def __repr__(self):
+        return repr(self._target)
+
+
+class _LockedCursor(_Locked):
+    """
+    A mongomock find cursor; sort, skip and limit chain as usual and the
+    results are read in one go, under the store lock, on first iteration
+    """
+
+    def __init__(self, target):
+        super().__init__(target)
+        object.__setattr__(self, '_results', None)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._results is None:
+            with _store_lock:
+                object.__setattr__(self, '_results', iter(list(self._target)))
+        return next(self._results)
+
+    next = __next__
+
+
+def _wrap(value):
+    import mongomock
+    from mongomock.collection import Cursor
+    from mongomock.command_cursor import CommandCursor
+
+    if isinstance(value, mongomock.MongoClient):
+        return _client
+    if isinstance(value, Cursor):
+        return _LockedCursor(value)
+    if isinstance(value, (mongomock.Database, mongomock.Collection, CommandCursor)):
+        return _Locked(value)
+    return value
+
+
+def client():
+    """
+    The process-wide in-memory client, shared by every connection and
+    thread; operations on it are serialized by a single lock
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                try:
+                    from .indexes import IndexedMongoClient
+                except ImportError:
+                    raise ImproperlyConfigured('OCTOFIT_STORAGE=memory requires the mongomock package')
+                _client = _Locked(IndexedMongoClient(document_class=OrderedDict))
+    return _client
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """djongo, storing collections in this process rather than on a Mongo server"""
+
+    def get_new_connection(self, connection_params):
+        name = connection_params.pop('name')
+        enforce_schema = connection_params.pop('enforce_schema')
+        self.client_connection = client()
+        database = self.client_connection[name]
+        self.djongo_connection = DjongoClient(database, enforce_schema)
+        return database
+
+    def _close(self):
+        # Closing would not free anything; the data belongs to the process
+        pass
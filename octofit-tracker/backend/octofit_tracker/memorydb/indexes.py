@@ -0,0 +1,358 @@
+"""
+Secondary indexes for the in-memory store
+
+mongomock answers every query by testing each document of the collection.
+Here the leading field of every index created on a collection (by a
+migration, a unique constraint or a restore) is kept in a hash of value
+to documents, and its numbers, strings and dates also in a sorted list of
+distinct values. Equality, ``$in`` and range conditions on those fields
+and on ``_id`` narrow a query to candidate documents, which are then
+tested by mongomock as before, in insertion order, so results are the
+same as a full scan; conditions the indexes cannot answer fall back to
+one.
+"""
+
+import bisect
+import itertools
+import math
+from datetime import datetime
+
+import mongomock
+from bson import ObjectId
+from mongomock import helpers, store
+from mongomock.aggregate import process_pipeline
+from mongomock.collection import Collection
+from mongomock.database import Database
+from mongomock.filtering import filter_applies
+
+
+_MISSING = object()
+_RANGE_OPERATORS = {'$gt', '$gte', '$lt', '$lte'}
+# Kinds whose values range conditions compare, each only with its own kind
+_ORDERED_KINDS = {'number', 'string', 'date'}
+
+
+def _kind(value):
+    """How the index files a value, or None for values it leaves loose"""
+    if value is _MISSING:
+        return 'missing'
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, (int, float)):
+        return None if isinstance(value, float) and math.isnan(value) else 'number'
+    if isinstance(value, str):
+        return 'string'
+    if isinstance(value, datetime):
+        return 'date'
+    if isinstance(value, ObjectId):
+        return 'objectid'
+    # Arrays match on their elements, embedded documents field by field
+    return None
+
+
+def _equal_keys(value):
+    """The buckets a document matching ``value`` by equality can be filed in"""
+    kind = _kind(value)
+    if kind is None or kind == 'missing':
+        return None
+    if kind == 'null':
+        return [('null', None), ('missing', None)]
+    keys = [(kind, value)]
+    # mongomock, like Python, treats True and 1 (and False and 0) as equal
+    if kind == 'bool':
+        keys.append(('number', int(value)))
+    elif kind == 'number' and value in (0, 1):
+        keys.append(('bool', bool(value)))
+    return keys
+
+
+class FieldIndex:
+    """Documents of a collection by the value of one top-level field"""
+
+    def __init__(self, field):
+        self.field = field
+        self._keys = {}
+        self._buckets = {}
+        self._loose = set()
+        self._sorted = {kind: [] for kind in _ORDERED_KINDS}
+        self._unordered = set()
+
+    def add(self, doc_id, document):
+        value = document.get(self.field, _MISSING)
+        kind = _kind(value)
+        if kind is None:
+            self._keys[doc_id] = None
+            self._loose.add(doc_id)
+            return
+        key = (kind, None if kind == 'missing' else value)
+        self._keys[doc_id] = key
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = set()
+            if kind in _ORDERED_KINDS and kind not in self._unordered:
+                try:
+                    bisect.insort(self._sorted[kind], value)
+                except TypeError:
+                    # e.g. naive and aware datetimes; range conditions scan
+                    self._unordered.add(kind)
+        bucket.add(doc_id)
+
+    def remove(self, doc_id):
+        if doc_id not in self._keys:
+            return
+        key = self._keys.pop(doc_id)
+        if key is None:
+            self._loose.discard(doc_id)
+            return
+        bucket = self._buckets[key]
+        bucket.discard(doc_id)
+        if not bucket:
+            del self._buckets[key]
+            kind, value = key
+            if kind in _ORDERED_KINDS and kind not in self._unordered:
+                values = self._sorted[kind]
+                del values[bisect.bisect_left(values, value)]
+
+    def lookup(self, condition):
+        """Ids of the documents that may meet a condition, or None if it needs a scan"""
+        if not isinstance(condition, dict):
+            return self._equal(condition)
+        if not condition or not all(operator.startswith('$') for operator in condition):
+            return None
+        if '$eq' in condition:
+            return self._equal(condition['$eq'])
+        if '$in' in condition:
+            values = condition['$in']
+            if not isinstance(values, (list, tuple)):
+                return None
+            matches = set(self._loose)
+            for value in values:
+                found = self._equal(value)
+                if found is None:
+                    return None
+                matches |= found
+            return matches
+        bounds = {operator: value for operator, value in condition.items() if operator in _RANGE_OPERATORS}
+        return self._range(bounds) if bounds else None
+
+    def _equal(self, value):
+        keys = _equal_keys(value)
+        if keys is None:
+            return None
+        matches = set(self._loose)
+        for key in keys:
+            matches |= self._buckets.get(key, set())
+        return matches
+
+    def _range(self, bounds):
+        kinds = {_kind(value) for value in bounds.values()}
+        if len(kinds) != 1 or ('$gt' in bounds and '$gte' in bounds) or ('$lt' in bounds and '$lte' in bounds):
+            return None
+        kind = kinds.pop()
+        if kind not in _ORDERED_KINDS or kind in self._unordered:
+            return None
+        values = self._sorted[kind]
+        try:
+            start, end = 0, len(values)
+            if '$gt' in bounds:
+                start = bisect.bisect_right(values, bounds['$gt'])
+            elif '$gte' in bounds:
+                start = bisect.bisect_left(values, bounds['$gte'])
+            if '$lt' in bounds:
+                end = bisect.bisect_left(values, bounds['$lt'])
+            elif '$lte' in bounds:
+                end = bisect.bisect_right(values, bounds['$lte'])
+        except TypeError:
+            return None
+        matches = set(self._loose)
+        for value in values[start:end]:
+            matches |= self._buckets[(kind, value)]
+        return matches
+
+
+class IndexedCollectionStore(store.CollectionStore):
+    """A collection's documents, with a FieldIndex per leading index field"""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self._order = {}
+        self._sequence = itertools.count()
+        self._fields = {}
+
+    def drop(self):
+        super().drop()
+        self._order = {}
+        self._fields = {}
+
+    def create_index(self, index_name, index_dict):
+        super().create_index(index_name, index_dict)
+        self._index_fields()
+
+    def drop_index(self, index_name):
+        super().drop_index(index_name)
+        self._index_fields()
+
+    def _index_fields(self):
+        leading = {
+            index['key'][0][0] for index in self.indexes.values() if index.get('key')
+        }
+        leading = {field for field in leading if field != '_id' and '.' not in field}
+        for field in set(self._fields) - leading:
+            del self._fields[field]
+        for field in leading - set(self._fields):
+            index = self._fields[field] = FieldIndex(field)
+            for doc_id, document in self._documents.items():
+                index.add(doc_id, document)
+
+    def __setitem__(self, key, val):
+        super().__setitem__(key, val)
+        if key not in self._order:
+            self._order[key] = next(self._sequence)
+        self.reindex(key)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._order.pop(key, None)
+        for index in self._fields.values():
+            index.remove(key)
+
+    def reindex(self, key):
+        """File a stored document again after it was changed in place"""
+        if isinstance(key, dict):
+            key = helpers.hashdict(key)
+        document = self._documents.get(key)
+        if document is None:
+            return
+        for index in self._fields.values():
+            index.remove(key)
+            index.add(key, document)
+
+    def candidates(self, filter):
+        """
+        The stored documents that may match a filter, in insertion order, or
+        None if the indexes cannot narrow it
+        """
+        self._remove_expired_documents()
+        keys = self._plan(filter)
+        if keys is None:
+            return None
+        order = self._order
+        keys = sorted((key for key in keys if key in order), key=order.__getitem__)
+        return [self._documents[key] for key in keys]
+
+    def _plan(self, filter):
+        if not isinstance(filter, dict):
+            return None
+        best = None
+        for name, condition in filter.items():
+            if name == '$and' and isinstance(condition, list):
+                plans = [plan for plan in map(self._plan, condition) if plan is not None]
+                keys = min(plans, key=len, default=None)
+            elif name == '$or' and isinstance(condition, list):
+                plans = [self._plan(part) for part in condition]
+                keys = None if not plans or None in plans else set().union(*plans)
+            elif name.startswith('$'):
+                continue
+            elif name == '_id':
+                keys = self._ids(condition)
+            elif name in self._fields:
+                keys = self._fields[name].lookup(condition)
+            else:
+                continue
+            if keys is not None and (best is None or len(keys) < len(best)):
+                best = keys
+        return best
+
+    @staticmethod
+    def _ids(condition):
+        if isinstance(condition, dict):
+            if set(condition) == {'$eq'}:
+                condition = condition['$eq']
+            elif set(condition) == {'$in'} and isinstance(condition['$in'], (list, tuple)):
+                values = condition['$in']
+                return set(values) if all(_kind(value) not in (None, 'null') for value in values) else None
+            else:
+                return None
+        return {condition} if _kind(condition) not in (None, 'null', 'missing') else None
+
+
+class IndexedDatabaseStore(store.DatabaseStore):
+
+    def __getitem__(self, col_name):
+        try:
+            return self._collections[col_name]
+        except KeyError:
+            col = self._collections[col_name] = IndexedCollectionStore(col_name)
+            return col
+
+    def rename(self, name, new_name):
+        col = self._collections.pop(name, None) or IndexedCollectionStore(new_name)
+        col.name = new_name
+        self._collections[new_name] = col
+
+
+class IndexedServerStore(store.ServerStore):
+
+    def __getitem__(self, db_name):
+        try:
+            return self._databases[db_name]
+        except KeyError:
+            db = self._databases[db_name] = IndexedDatabaseStore()
+            return db
+
+
+class IndexedCollection(Collection):
+    """A mongomock collection that reads through its store's indexes"""
+
+    def _iter_documents(self, filter):
+        documents = self._store.candidates(filter)
+        if documents is None:
+            return super()._iter_documents(filter)
+        if not documents:
+            # Validate the filter even if no documents can be returned
+            filter_applies(filter, {})
+        return (document for document in documents if filter_applies(filter, document))
+
+    def _apply_update_document(self, existing_document, *args, **kwargs):
+        try:
+            return super()._apply_update_document(existing_document, *args, **kwargs)
+        finally:
+            self._store.reindex(existing_document.get('_id'))
+
+    def _apply_update_pipeline(self, existing_document, *args, **kwargs):
+        try:
+            return super()._apply_update_pipeline(existing_document, *args, **kwargs)
+        finally:
+            self._store.reindex(existing_document.get('_id'))
+
+    def aggregate(self, pipeline, session=None, **kwargs):
+        if pipeline and isinstance(pipeline[0], dict) and list(pipeline[0]) == ['$match']:
+            # Narrow the input with the leading $match; the stage still runs
+            in_collection = list(self.find(pipeline[0]['$match']))
+            return process_pipeline(in_collection, self.database, pipeline, session)
+        return super().aggregate(pipeline, session=session, **kwargs)
+
+
+class IndexedDatabase(Database):
+
+    def get_collection(self, *args, **kwargs):
+        collection = super().get_collection(*args, **kwargs)
+        # mongomock builds plain collections, also from with_options
+        if type(collection) is Collection:
+            collection.__class__ = IndexedCollection
+        return collection
+
+
+class IndexedMongoClient(mongomock.MongoClient):
+    """A mongomock client whose collections keep secondary indexes"""
+
+    def __init__(self, **kwargs):
+        super().__init__(_store=IndexedServerStore(), **kwargs)
+
+    def get_database(self, *args, **kwargs):
+        database = super().get_database(*args, **kwargs)
+        if type(database) is Database:
+            database.__class__ = IndexedDatabase
+        return database
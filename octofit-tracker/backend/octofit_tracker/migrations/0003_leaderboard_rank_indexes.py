@@ -0,0 +1,21 @@
+# Generated by Django 4.1.7 on 2026-10-19 16:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0002_activity_leaderboard_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='leaderboard',
+            index=models.Index(fields=['total_calories'], name='leaderboard_calories_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaderboard',
+            index=models.Index(fields=['user_email'], name='leaderboard_email_idx'),
+        ),
+    ]
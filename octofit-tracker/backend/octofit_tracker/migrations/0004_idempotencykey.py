@@ -0,0 +1,42 @@
+# Generated by Django 4.1.7 on 2026-10-19 16:30
+
+from django.conf import settings
+from django.db import migrations, models
+import djongo.models.fields
+
+
+def create_ttl_index(apps, schema_editor):
+    schema_editor.connection.connection['idempotency_keys'].create_index(
+        'created_at',
+        name='idempotency_key_ttl_idx',
+        expireAfterSeconds=settings.IDEMPOTENCY_KEY_TTL,
+    )
+
+
+def drop_ttl_index(apps, schema_editor):
+    schema_editor.connection.connection['idempotency_keys'].drop_index('idempotency_key_ttl_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0003_leaderboard_rank_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('_id', djongo.models.fields.ObjectIdField(auto_created=True, primary_key=True, serialize=False)),
+                ('key', models.CharField(max_length=300, unique=True)),
+                ('request_hash', models.CharField(max_length=64)),
+                ('status_code', models.IntegerField(null=True)),
+                ('response_body', models.TextField(null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'idempotency_keys',
+            },
+        ),
+        migrations.RunPython(create_ttl_index, drop_ttl_index),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.1.7 on 2026-10-19 16:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0004_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='leaderboard',
+            index=models.Index(fields=['total_calories', 'user_email'], name='leaderboard_position_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaderboard',
+            index=models.Index(fields=['team', 'total_calories', 'user_email'], name='leaderboard_team_position_idx'),
+        ),
+    ]
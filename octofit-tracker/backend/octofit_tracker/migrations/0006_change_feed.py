@@ -0,0 +1,39 @@
+# Generated by Django 4.1.7 on 2026-10-19 16:42
+
+from django.db import migrations, models
+import djongo.models.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0005_leaderboard_position_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('_id', djongo.models.fields.ObjectIdField(auto_created=True, primary_key=True, serialize=False)),
+                ('seq', models.BigIntegerField(unique=True)),
+                ('collection', models.CharField(max_length=100)),
+                ('object_id', models.CharField(max_length=24)),
+                ('op', models.CharField(max_length=10)),
+                ('created_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'changes',
+            },
+        ),
+        migrations.CreateModel(
+            name='Sequence',
+            fields=[
+                ('_id', djongo.models.fields.ObjectIdField(auto_created=True, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'sequences',
+            },
+        ),
+    ]
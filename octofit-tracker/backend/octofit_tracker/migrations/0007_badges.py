@@ -0,0 +1,52 @@
+# Generated by Django 4.1.7 on 2026-10-19 16:52
+
+from django.db import migrations, models
+import djongo.models.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0006_change_feed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BadgeAward',
+            fields=[
+                ('_id', djongo.models.fields.ObjectIdField(auto_created=True, primary_key=True, serialize=False)),
+                ('user_email', models.EmailField(max_length=254)),
+                ('badge', models.CharField(max_length=100)),
+                ('awarded_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'badge_awards',
+            },
+        ),
+        migrations.CreateModel(
+            name='BadgeState',
+            fields=[
+                ('_id', djongo.models.fields.ObjectIdField(auto_created=True, primary_key=True, serialize=False)),
+                ('user_email', models.EmailField(max_length=254, unique=True)),
+                ('calories', models.IntegerField(default=0)),
+                ('minutes', models.IntegerField(default=0)),
+                ('activities', models.IntegerField(default=0)),
+                ('type_counts', djongo.models.fields.JSONField(default=dict)),
+                ('streak', models.IntegerField(default=0)),
+                ('longest_streak', models.IntegerField(default=0)),
+                ('last_date', models.DateField(null=True)),
+                ('version', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'badge_states',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='badgeaward',
+            index=models.Index(fields=['badge'], name='badge_award_badge_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='badgeaward',
+            unique_together={('user_email', 'badge')},
+        ),
+    ]
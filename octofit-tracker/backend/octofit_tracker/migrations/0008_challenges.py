@@ -0,0 +1,56 @@
+# Generated by Django 4.1.7 on 2026-10-19 16:55
+
+from django.db import migrations, models
+import djongo.models.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0007_badges'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Challenge',
+            fields=[
+                ('_id', djongo.models.fields.ObjectIdField(auto_created=True, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=200)),
+                ('description', models.TextField(blank=True)),
+                ('start', models.DateField()),
+                ('end', models.DateField()),
+                ('metric', models.CharField(choices=[('calories', 'Calories burned'), ('minutes', 'Minutes trained'), ('activities', 'Activities logged'), ('type_count', 'Activities of one type')], max_length=20)),
+                ('activity_type', models.CharField(blank=True, max_length=100)),
+                ('scope', models.CharField(choices=[('individual', 'Individual'), ('team', 'Team')], default='individual', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'challenges',
+            },
+        ),
+        migrations.CreateModel(
+            name='ChallengeProgress',
+            fields=[
+                ('_id', djongo.models.fields.ObjectIdField(auto_created=True, primary_key=True, serialize=False)),
+                ('challenge_id', models.CharField(max_length=24)),
+                ('participant', models.CharField(max_length=254)),
+                ('value', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'challenge_progress',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='challengeprogress',
+            index=models.Index(fields=['challenge_id', '-value', 'participant'], name='challenge_standings_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='challengeprogress',
+            unique_together={('challenge_id', 'participant')},
+        ),
+        migrations.AddIndex(
+            model_name='challenge',
+            index=models.Index(fields=['end', 'start'], name='challenge_window_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.1.7 on 2026-10-19 17:03
+
+from django.db import migrations, models
+import djongo.models.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0008_challenges'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('_id', djongo.models.fields.ObjectIdField(auto_created=True, primary_key=True, serialize=False)),
+                ('fingerprint', models.CharField(max_length=40, unique=True)),
+                ('collection', models.CharField(max_length=100)),
+                ('operation', models.CharField(max_length=50)),
+                ('shape', models.TextField()),
+                ('sample', models.TextField()),
+                ('sources', djongo.models.fields.JSONField(default=list)),
+                ('count', models.IntegerField(default=0)),
+                ('total_ms', models.FloatField(default=0)),
+                ('max_ms', models.FloatField(default=0)),
+                ('first_seen', models.DateTimeField()),
+                ('last_seen', models.DateTimeField()),
+                ('plan', models.CharField(blank=True, max_length=200)),
+                ('indexes_used', djongo.models.fields.JSONField(default=list)),
+                ('keys_examined', models.IntegerField(null=True)),
+                ('docs_examined', models.IntegerField(null=True)),
+                ('returned', models.IntegerField(null=True)),
+                ('explained_at', models.DateTimeField(null=True)),
+            ],
+            options={
+                'db_table': 'slow_queries',
+            },
+        ),
+    ]
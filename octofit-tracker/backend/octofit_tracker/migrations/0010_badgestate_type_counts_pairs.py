@@ -0,0 +1,24 @@
+# Generated by Django 4.1.7 on 2026-10-19 18:10
+
+from django.db import migrations
+import djongo.models.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0009_slow_queries'),
+    ]
+
+    # Only the default changes, and Mongo has no column to alter
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='badgestate',
+                    name='type_counts',
+                    field=djongo.models.fields.JSONField(default=list),
+                ),
+            ],
+        ),
+    ]
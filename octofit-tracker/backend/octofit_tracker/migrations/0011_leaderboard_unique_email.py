@@ -0,0 +1,46 @@
+# Generated by Django 4.1.7 on 2026-10-19 18:20
+
+from django.db import migrations, models
+
+
+def merge_duplicate_entries(apps, schema_editor):
+    # Concurrent first activities could each create an entry for a user;
+    # each holds part of the user's totals, so fold them into one. Ranks
+    # are corrected by the next rerank_leaderboard run.
+    collection = schema_editor.connection.connection['leaderboard']
+    duplicates = collection.aggregate([
+        {'$group': {
+            '_id': '$user_email',
+            'ids': {'$push': '$_id'},
+            'calories': {'$sum': '$total_calories'},
+            'activities': {'$sum': '$total_activities'},
+        }},
+        {'$match': {'ids.1': {'$exists': True}}},
+    ])
+    for duplicate in duplicates:
+        keep, *extra = duplicate['ids']
+        collection.update_one({'_id': keep}, {'$set': {
+            'total_calories': duplicate['calories'],
+            'total_activities': duplicate['activities'],
+        }})
+        collection.delete_many({'_id': {'$in': extra}})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0010_badgestate_type_counts_pairs'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_entries, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='leaderboard',
+            name='leaderboard_email_idx',
+        ),
+        migrations.AlterField(
+            model_name='leaderboard',
+            name='user_email',
+            field=models.EmailField(max_length=254, unique=True),
+        ),
+    ]
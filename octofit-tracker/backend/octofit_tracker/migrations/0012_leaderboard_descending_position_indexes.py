@@ -0,0 +1,66 @@
+# Generated by Django 4.1.7 on 2026-10-19 18:04
+
+from django.db import migrations, models
+from pymongo import ASCENDING, DESCENDING
+
+
+POSITION_INDEXES = {
+    'leaderboard_position_idx': ['total_calories', 'user_email'],
+    'leaderboard_team_position_idx': ['team', 'total_calories', 'user_email'],
+}
+
+
+def _recreate(schema_editor, calories_direction):
+    # djongo writes a descending field into the key name ('total_calories"
+    # DESC'), so the indexes are built with pymongo directly
+    collection = schema_editor.connection.connection['leaderboard']
+    for name, fields in POSITION_INDEXES.items():
+        if name in collection.index_information():
+            collection.drop_index(name)
+        collection.create_index(
+            [(field, calories_direction if field == 'total_calories' else ASCENDING) for field in fields],
+            name=name,
+        )
+
+
+def descending(apps, schema_editor):
+    _recreate(schema_editor, DESCENDING)
+
+
+def ascending(apps, schema_editor):
+    _recreate(schema_editor, ASCENDING)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0011_leaderboard_unique_email'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(descending, ascending),
+            ],
+            state_operations=[
+                migrations.RemoveIndex(
+                    model_name='leaderboard',
+                    name='leaderboard_position_idx',
+                ),
+                migrations.RemoveIndex(
+                    model_name='leaderboard',
+                    name='leaderboard_team_position_idx',
+                ),
+                migrations.AddIndex(
+                    model_name='leaderboard',
+                    index=models.Index(fields=['-total_calories', 'user_email'], name='leaderboard_position_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='leaderboard',
+                    index=models.Index(
+                        fields=['team', '-total_calories', 'user_email'], name='leaderboard_team_position_idx'
+                    ),
+                ),
+            ],
+        ),
+    ]
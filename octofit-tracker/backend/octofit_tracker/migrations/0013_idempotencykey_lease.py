@@ -0,0 +1,23 @@
+# Generated by Django 4.1.7 on 2026-10-19 18:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0012_leaderboard_descending_position_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='lease',
+            field=models.CharField(max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='leased_at',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
@@ -8,8 +8,13 @@ class User(models.Model):
     team = models.CharField(max_length=100)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = models.DjongoManager()
+
     class Meta:
         db_table = 'users'
+        indexes = [
+            models.Index(fields=['team'], name='user_team_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -21,6 +26,8 @@ class Team(models.Model):
     description = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = models.DjongoManager()
+
     class Meta:
         db_table = 'teams'
 
@@ -37,8 +44,16 @@ class Activity(models.Model):
     date = models.DateField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = models.DjongoManager()
+
     class Meta:
         db_table = 'activities'
+        indexes = [
+            models.Index(fields=['-date', '-_id'], name='activity_date_idx'),
+            models.Index(fields=['activity_type'], name='activity_type_idx'),
+            models.Index(fields=['created_at'], name='activity_created_idx'),
+            models.Index(fields=['user_email', 'date'], name='activity_user_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user_email} - {self.activity_type}"
@@ -46,7 +61,7 @@ class Activity(models.Model):
 
 class Leaderboard(models.Model):
     _id = models.ObjectIdField(primary_key=True)
-    user_email = models.EmailField()
+    user_email = models.EmailField(unique=True)
     user_name = models.CharField(max_length=200)
     team = models.CharField(max_length=100)
     total_calories = models.IntegerField()
@@ -54,9 +69,18 @@ class Leaderboard(models.Model):
     rank = models.IntegerField()
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = models.DjongoManager()
+
     class Meta:
         db_table = 'leaderboard'
         ordering = ['rank']
+        indexes = [
+            models.Index(fields=['rank'], name='leaderboard_rank_idx'),
+            models.Index(fields=['team'], name='leaderboard_team_idx'),
+            models.Index(fields=['total_calories'], name='leaderboard_calories_idx'),
+            models.Index(fields=['-total_calories', 'user_email'], name='leaderboard_position_idx'),
+            models.Index(fields=['team', '-total_calories', 'user_email'], name='leaderboard_team_position_idx'),
+        ]
 
     def __str__(self):
         return f"{self.rank}. {self.user_name} - {self.total_calories} cal"
@@ -72,8 +96,183 @@ class Workout(models.Model):
     duration = models.IntegerField()  # in minutes
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = models.DjongoManager()
+
     class Meta:
         db_table = 'workouts'
 
     def __str__(self):
         return self.name
+
+
+class IdempotencyKey(models.Model):
+    _id = models.ObjectIdField(primary_key=True)
+    key = models.CharField(max_length=300, unique=True)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.IntegerField(null=True)
+    response_body = models.TextField(null=True)
+    lease = models.CharField(max_length=32, null=True)
+    leased_at = models.DateTimeField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = models.DjongoManager()
+
+    class Meta:
+        db_table = 'idempotency_keys'
+
+    def __str__(self):
+        return self.key
+
+
+class Sequence(models.Model):
+    _id = models.ObjectIdField(primary_key=True)
+    name = models.CharField(max_length=100, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    objects = models.DjongoManager()
+
+    class Meta:
+        db_table = 'sequences'
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
+
+
+class Change(models.Model):
+    _id = models.ObjectIdField(primary_key=True)
+    seq = models.BigIntegerField(unique=True)
+    collection = models.CharField(max_length=100)
+    object_id = models.CharField(max_length=24)
+    op = models.CharField(max_length=10)
+    created_at = models.DateTimeField()
+
+    objects = models.DjongoManager()
+
+    class Meta:
+        db_table = 'changes'
+
+    def __str__(self):
+        return f"{self.seq} {self.op} {self.collection}/{self.object_id}"
+
+
+class BadgeState(models.Model):
+    _id = models.ObjectIdField(primary_key=True)
+    user_email = models.EmailField(unique=True)
+    calories = models.IntegerField(default=0)
+    minutes = models.IntegerField(default=0)
+    activities = models.IntegerField(default=0)
+    type_counts = models.JSONField(default=list)
+    streak = models.IntegerField(default=0)
+    longest_streak = models.IntegerField(default=0)
+    last_date = models.DateField(null=True)
+    version = models.IntegerField(default=0)
+
+    objects = models.DjongoManager()
+
+    class Meta:
+        db_table = 'badge_states'
+
+    def __str__(self):
+        return self.user_email
+
+
+class BadgeAward(models.Model):
+    _id = models.ObjectIdField(primary_key=True)
+    user_email = models.EmailField()
+    badge = models.CharField(max_length=100)
+    awarded_at = models.DateTimeField()
+
+    objects = models.DjongoManager()
+
+    class Meta:
+        db_table = 'badge_awards'
+        unique_together = [('user_email', 'badge')]
+        indexes = [
+            models.Index(fields=['badge'], name='badge_award_badge_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_email} - {self.badge}"
+
+
+class Challenge(models.Model):
+    METRIC_CHOICES = [
+        ('calories', 'Calories burned'),
+        ('minutes', 'Minutes trained'),
+        ('activities', 'Activities logged'),
+        ('type_count', 'Activities of one type'),
+    ]
+    SCOPE_CHOICES = [
+        ('individual', 'Individual'),
+        ('team', 'Team'),
+    ]
+
+    _id = models.ObjectIdField(primary_key=True)
+    name = models.CharField(max_length=200)
+    description = models.TextField(blank=True)
+    start = models.DateField()
+    end = models.DateField()
+    metric = models.CharField(max_length=20, choices=METRIC_CHOICES)
+    activity_type = models.CharField(max_length=100, blank=True)
+    scope = models.CharField(max_length=20, choices=SCOPE_CHOICES, default='individual')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = models.DjongoManager()
+
+    class Meta:
+        db_table = 'challenges'
+        indexes = [
+            models.Index(fields=['end', 'start'], name='challenge_window_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class ChallengeProgress(models.Model):
+    _id = models.ObjectIdField(primary_key=True)
+    challenge_id = models.CharField(max_length=24)
+    participant = models.CharField(max_length=254)
+    value = models.IntegerField(default=0)
+    updated_at = models.DateTimeField()
+
+    objects = models.DjongoManager()
+
+    class Meta:
+        db_table = 'challenge_progress'
+        unique_together = [('challenge_id', 'participant')]
+        indexes = [
+            models.Index(fields=['challenge_id', '-value', 'participant'], name='challenge_standings_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.challenge_id} - {self.participant}: {self.value}"
+
+
+class SlowQuery(models.Model):
+    _id = models.ObjectIdField(primary_key=True)
+    fingerprint = models.CharField(max_length=40, unique=True)
+    collection = models.CharField(max_length=100)
+    operation = models.CharField(max_length=50)
+    shape = models.TextField()
+    sample = models.TextField()
+    sources = models.JSONField(default=list)
+    count = models.IntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    first_seen = models.DateTimeField()
+    last_seen = models.DateTimeField()
+    plan = models.CharField(max_length=200, blank=True)
+    indexes_used = models.JSONField(default=list)
+    keys_examined = models.IntegerField(null=True)
+    docs_examined = models.IntegerField(null=True)
+    returned = models.IntegerField(null=True)
+    explained_at = models.DateTimeField(null=True)
+
+    objects = models.DjongoManager()
+
+    class Meta:
+        db_table = 'slow_queries'
+
+    def __str__(self):
+        return f"{self.operation} {self.collection} ({self.count}x, max {self.max_ms:.0f} ms)"
@@ -0,0 +1,83 @@
+import hashlib
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+ANCHOR_TIMEOUT = 600
+
+
+class KeysetPaginator(Paginator):
+    """
+    Paginator for very large collections
+
+    The total comes from the collection metadata when the queryset is
+    unfiltered, and a page that follows an already served page seeks past
+    that page's last row on the ordering index instead of skipping over
+    every earlier row.
+
+    Anchors belong to the client that was served the earlier page, so a
+    next page continues from the rows that client saw; without a client
+    every page is read by offset.
+    """
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True, client=None):
+        super().__init__(object_list, per_page, orphans, allow_empty_first_page)
+        self.client = client
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            return queryset.model.objects.mongo_estimated_document_count()
+        return super().count
+
+    @cached_property
+    def _ordering(self):
+        ordering = self.object_list.query.order_by
+        if not ordering or not all(isinstance(name, str) for name in ordering):
+            return None
+        return [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+    @cached_property
+    def _query_key(self):
+        try:
+            sql = str(self.object_list.query)
+        except EmptyResultSet:
+            return None
+        return hashlib.md5(sql.encode()).hexdigest()
+
+    def _anchor_key(self, number):
+        return f'keyset:{self.client}:{self._query_key}:{self.per_page}:{number}'
+
+    def _after(self, anchor):
+        """Q matching rows that sort after the anchor row"""
+        condition = Q()
+        equal = {}
+        for (field, descending), value in zip(self._ordering, anchor):
+            lookup = 'lt' if descending else 'gt'
+            condition |= Q(**equal, **{f'{field}__{lookup}': value})
+            equal[field] = value
+        return condition
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if self.client is None or self._ordering is None or self._query_key is None:
+            return super().page(number)
+        anchor = cache.get(self._anchor_key(number - 1)) if number > 1 else None
+        if anchor is not None:
+            object_list = list(self.object_list.filter(self._after(anchor))[:self.per_page])
+        else:
+            bottom = (number - 1) * self.per_page
+            object_list = list(self.object_list[bottom:bottom + self.per_page])
+        if object_list:
+            last = object_list[-1]
+            cache.set(
+                self._anchor_key(number),
+                [last.pk if field == 'pk' else getattr(last, field) for field, _ in self._ordering],
+                ANCHOR_TIMEOUT,
+            )
+        return self._get_page(object_list, number, self)
@@ -0,0 +1,103 @@
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+
+from .analytics import ActivityColumns
+from .catalog import catalog
+
+
+DIFFICULTY_LEVELS = {'Beginner': 0, 'Intermediate': 1, 'Advanced': 2, 'Expert': 3}
+RECENT_DAYS = 30
+DEFAULT_K = 5
+
+
+class UserProfile:
+    """
+    Summary of a user's recent activity used to score workouts
+    """
+
+    def __init__(self, type_counts, avg_duration, avg_calories):
+        self.type_counts = type_counts
+        self.avg_duration = avg_duration
+        self.avg_calories = avg_calories
+
+    @property
+    def is_empty(self):
+        return not self.type_counts
+
+    @classmethod
+    def for_user(cls, email, days=RECENT_DAYS, today=None):
+        columns = ActivityColumns.load([email], since=(today or date.today()) - timedelta(days=days))
+        if not len(columns):
+            return cls({}, None, None)
+        types, counts = np.unique(columns.types, return_counts=True)
+        return cls(
+            dict(zip(types.tolist(), counts.tolist())),
+            float(columns.durations.mean()),
+            float(columns.calories.mean()),
+        )
+
+
+class WorkoutIndex:
+    """
+    Precomputed feature matrix over the workout catalog
+
+    The matrix is rebuilt from the catalog snapshot whenever a new snapshot
+    is published, so a recommendation is a single vectorized scoring pass.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+
+    def _build(self, snapshot):
+        workouts = snapshot.workouts
+        types = sorted({workout['activity_type'] for workout in workouts})
+        type_index = {activity_type: i for i, activity_type in enumerate(types)}
+        one_hot = np.zeros((len(workouts), len(types)))
+        for row, workout in enumerate(workouts):
+            one_hot[row, type_index[workout['activity_type']]] = 1.0
+        log_duration = np.log1p([workout['duration'] for workout in workouts])
+        log_calories = np.log1p([workout['estimated_calories'] for workout in workouts])
+        difficulty = np.array(
+            [DIFFICULTY_LEVELS.get(workout['difficulty'], 1) for workout in workouts], dtype=float
+        )
+        return snapshot, workouts, type_index, one_hot, log_duration, log_calories, difficulty
+
+    def _get_state(self):
+        snapshot = catalog.snapshot()
+        state = self._state
+        if state is None or state[0] is not snapshot:
+            with self._lock:
+                if self._state is None or self._state[0] is not snapshot:
+                    self._state = self._build(snapshot)
+                state = self._state
+        return state[1:]
+
+    def recommend(self, profile, k=DEFAULT_K):
+        """Return the top ``k`` (workout row, score) pairs for a profile"""
+        workouts, type_index, one_hot, log_duration, log_calories, difficulty = self._get_state()
+        if not workouts:
+            return []
+        if profile.is_empty:
+            # Cold start: favour approachable workouts
+            scores = -difficulty
+        else:
+            affinity = np.zeros(len(type_index))
+            total = sum(profile.type_counts.values())
+            for activity_type, count in profile.type_counts.items():
+                if activity_type in type_index:
+                    affinity[type_index[activity_type]] = count / total
+            scores = (
+                one_hot @ affinity
+                + 0.5 * np.exp(-np.abs(log_duration - np.log1p(profile.avg_duration)))
+                + 0.5 * np.exp(-np.abs(log_calories - np.log1p(profile.avg_calories)))
+            )
+        k = min(k, len(workouts))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(workouts[i], round(float(scores[i]), 4)) for i in top]
+
+
+workout_index = WorkoutIndex()
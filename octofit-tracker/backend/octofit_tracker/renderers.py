@@ -0,0 +1,207 @@
+import datetime
+
+import msgpack
+from bson import ObjectId
+from django.http import StreamingHttpResponse
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.response import Response
+from rest_framework.exceptions import ParseError
+
+
+ARROW_STREAM_MEDIA_TYPE = 'application/vnd.apache.arrow.stream'
+ARROW_BATCH_SIZE = 10000
+
+
+def _msgpack_default(obj):
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    return str(obj)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Renders serialized data as MessagePack
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_msgpack_default, use_bin_type=True)
+
+
+class MessagePackParser(BaseParser):
+    """
+    Parses MessagePack request bodies
+    """
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
+
+
+class ArrowStreamRenderer(BaseRenderer):
+    """
+    Renders serialized data as an Apache Arrow IPC stream
+
+    List endpoints that mix in ArrowStreamMixin bypass this renderer and
+    stream record batches straight from the Mongo cursor instead.
+    """
+    media_type = ARROW_STREAM_MEDIA_TYPE
+    format = 'arrow'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        import pyarrow as pa
+
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        table = pa.Table.from_pylist(rows)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+
+class _ChunkSink:
+    """File-like object collecting the bytes an Arrow writer emits"""
+
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return b''.join(chunks)
+
+
+def _arrow_type(field):
+    import pyarrow as pa
+
+    internal_type = field.get_internal_type()
+    if internal_type in ('IntegerField', 'BigIntegerField', 'PositiveIntegerField'):
+        return pa.int64()
+    if internal_type == 'DateField':
+        return pa.date32()
+    if internal_type == 'DateTimeField':
+        return pa.timestamp('us', tz='UTC')
+    return pa.string()
+
+
+def _arrow_value(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime.datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=datetime.timezone.utc)
+    return value
+
+
+def arrow_schema(model, field_names):
+    import pyarrow as pa
+
+    return pa.schema([
+        (name, _arrow_type(model._meta.get_field(name))) for name in field_names
+    ])
+
+
+def iter_arrow_batches(model, field_names, sort=None, batch_size=ARROW_BATCH_SIZE):
+    """
+    Yields an Arrow IPC stream for a collection, built column by column in
+    batches of ``batch_size`` documents read directly from a Mongo cursor
+    """
+    import pyarrow as pa
+
+    schema = arrow_schema(model, field_names)
+    date_fields = {
+        name for name in field_names
+        if model._meta.get_field(name).get_internal_type() == 'DateField'
+    }
+    projection = {name: 1 for name in field_names}
+    cursor = model.objects.mongo_find({}, projection, sort=sort, batch_size=batch_size)
+
+    sink = _ChunkSink()
+    writer = pa.ipc.new_stream(pa.PythonFile(sink, mode='w'), schema)
+
+    def flush(columns):
+        arrays = []
+        for name, field in zip(field_names, schema):
+            values = columns[name]
+            if name in date_fields:
+                values = [v.date() if isinstance(v, datetime.datetime) else v for v in values]
+            arrays.append(pa.array(values, type=field.type))
+        writer.write_batch(pa.record_batch(arrays, schema=schema))
+        return sink.drain()
+
+    columns = {name: [] for name in field_names}
+    count = 0
+    for document in cursor:
+        for name in field_names:
+            columns[name].append(_arrow_value(document.get(name)))
+        count += 1
+        if count == batch_size:
+            yield flush(columns)
+            columns = {name: [] for name in field_names}
+            count = 0
+    if count:
+        yield flush(columns)
+    writer.close()
+    yield sink.drain()
+
+
+def arrow_stream_response(model, field_names, sort=None):
+    return StreamingHttpResponse(
+        iter_arrow_batches(model, field_names, sort=sort),
+        content_type=ARROW_STREAM_MEDIA_TYPE,
+    )
+
+
+class PrerenderedResponse(Response):
+    """
+    Response whose JSON body was encoded ahead of time
+
+    A plain JSON request gets ``content`` as is. Other formats, and
+    ``data`` itself, come from ``decode``, called only when needed.
+    """
+
+    def __init__(self, content, decode, **kwargs):
+        super().__init__(None, **kwargs)
+        self.prerendered = content
+        self._decode = decode
+
+    @property
+    def data(self):
+        if self._data is None and self._decode is not None:
+            self._data = self._decode()
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+    @property
+    def rendered_content(self):
+        renderer = getattr(self, 'accepted_renderer', None)
+        # An Accept header asking for indentation needs the renderer
+        if type(renderer) is not JSONRenderer or 'indent' in (self.accepted_media_type or ''):
+            return super().rendered_content
+        self['Content-Type'] = self.content_type or renderer.media_type
+        return bytes(self.prerendered)
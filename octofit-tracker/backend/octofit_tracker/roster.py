@@ -0,0 +1,221 @@
+import csv
+import json
+from collections import Counter
+
+from bson import ObjectId
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.utils import timezone
+from pymongo.errors import BulkWriteError
+
+from . import changes, search
+from .models import User, Team
+
+
+CHUNK_SIZE = 1000
+DUPLICATE_KEY = 11000
+FORMATS = ('csv', 'ndjson')
+CONTENT_TYPES = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+}
+
+CREATED = 'created'
+EXISTS = 'exists'
+DUPLICATE = 'duplicate'
+INVALID = 'invalid'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+def read_rows(lines, format):
+    """
+    ``(line number, row)`` for each record of a CSV or NDJSON roster
+
+    A record that cannot be parsed is yielded as a ValueError.
+    """
+    if format == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield number, ValueError(f'invalid JSON: {exc}')
+            continue
+        if not isinstance(row, dict):
+            yield number, ValueError('each line must be a JSON object')
+        else:
+            yield number, row
+
+
+def _text(row, field, max_length, required=True):
+    value = row.get(field)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise ValidationError(f'{field} is required')
+    if len(value) > max_length:
+        raise ValidationError(f'{field} must be at most {max_length} characters')
+    return value
+
+
+def _clean_user(row):
+    email = _text(row, 'email', 254)
+    validate_email(email)
+    return {'name': _text(row, 'name', 200), 'email': email, 'team': _text(row, 'team', 100)}
+
+
+def _clean_team(row):
+    return {'name': _text(row, 'name', 100), 'description': _text(row, 'description', 10000, required=False)}
+
+
+def _now():
+    return timezone.now().replace(tzinfo=None)
+
+
+def _insert(model, documents, ordered):
+    """
+    Bulk insert; returns the inserted documents and the index and message
+    of each failed one
+    """
+    if not documents:
+        return [], {}
+    try:
+        model.objects.mongo_insert_many(documents, ordered=ordered)
+    except BulkWriteError as exc:
+        failed = {error['index']: error for error in exc.details['writeErrors']}
+        if ordered:
+            inserted = documents[:min(failed)]
+        else:
+            inserted = [document for i, document in enumerate(documents) if i not in failed]
+        return inserted, failed
+    return documents, {}
+
+
+def _created(model, documents):
+    """Publish inserted documents to the search index and change feed"""
+    if documents:
+        search.index_for_model[model].update_many(documents)
+        changes.record(model, [document['_id'] for document in documents])
+
+
+class RosterImport:
+    """
+    Bulk import of users or teams from CSV or NDJSON rows
+
+    Rows are handled in chunks. Each chunk costs one ``$in`` query for
+    existing keys and one insert_many; a user import also creates the teams
+    it references with one more ``$in`` and insert_many. ``run`` yields a
+    report entry per row as its chunk completes. An ordered import stops at
+    the first row that fails to insert and reports the rest as skipped.
+    """
+
+    kinds = {
+        'users': (User, 'email', _clean_user),
+        'teams': (Team, 'name', _clean_team),
+    }
+
+    def __init__(self, kind, ordered=False, chunk_size=CHUNK_SIZE):
+        self.model, self.key, self.clean = self.kinds[kind]
+        self.ordered = ordered
+        self.chunk_size = chunk_size
+        self.summary = Counter()
+        self._seen = set()
+        self._stopped = False
+
+    def run(self, rows):
+        chunk = []
+        for number, row in rows:
+            if self._stopped:
+                yield self._report(number, SKIPPED)
+                continue
+            chunk.append((number, row))
+            if len(chunk) >= self.chunk_size:
+                yield from self._import(chunk)
+                chunk = []
+        if chunk:
+            yield from self._import(chunk)
+
+    def _report(self, line, status, key=None, object_id=None, error=None):
+        self.summary[status] += 1
+        entry = {'line': line, 'status': status}
+        if key is not None:
+            entry[self.key] = key
+        if object_id is not None:
+            entry['_id'] = str(object_id)
+        if error is not None:
+            entry['error'] = error
+        return entry
+
+    def _import(self, chunk):
+        reports = {}
+        accepted = []
+        for number, row in chunk:
+            if isinstance(row, Exception):
+                reports[number] = self._report(number, INVALID, error=str(row))
+                continue
+            try:
+                document = self.clean(row)
+            except ValidationError as exc:
+                reports[number] = self._report(number, INVALID, error='; '.join(exc.messages))
+                continue
+            key = document[self.key]
+            if key in self._seen:
+                reports[number] = self._report(number, DUPLICATE, key=key, error='repeated earlier in the import')
+                continue
+            self._seen.add(key)
+            accepted.append((number, document))
+
+        keys = [document[self.key] for _, document in accepted]
+        existing = {
+            found[self.key]
+            for found in self.model.objects.mongo_find({self.key: {'$in': keys}}, {self.key: 1})
+        } if keys else set()
+        pending = []
+        for number, document in accepted:
+            if document[self.key] in existing:
+                reports[number] = self._report(number, EXISTS, key=document[self.key])
+            else:
+                document.update(_id=ObjectId(), created_at=_now())
+                pending.append((number, document))
+
+        if self.model is User:
+            self._create_teams({document['team'] for _, document in pending})
+
+        documents = [document for _, document in pending]
+        inserted, failed = _insert(self.model, documents, self.ordered)
+        stop_at = min(failed) if self.ordered and failed else None
+        for i, (number, document) in enumerate(pending):
+            key = document[self.key]
+            if i in failed:
+                error = failed[i]
+                if error['code'] == DUPLICATE_KEY:
+                    reports[number] = self._report(number, EXISTS, key=key)
+                else:
+                    reports[number] = self._report(number, FAILED, key=key, error=error['errmsg'])
+            elif stop_at is not None and i > stop_at:
+                reports[number] = self._report(number, SKIPPED, key=key)
+            else:
+                reports[number] = self._report(number, CREATED, key=key, object_id=document['_id'])
+        _created(self.model, inserted)
+        if stop_at is not None:
+            self._stopped = True
+        for number, _ in chunk:
+            yield reports[number]
+
+    def _create_teams(self, names):
+        if not names:
+            return
+        existing = {team['name'] for team in Team.objects.mongo_find({'name': {'$in': list(names)}}, {'name': 1})}
+        teams = [
+            {'_id': ObjectId(), 'name': name, 'description': '', 'created_at': _now()}
+            for name in sorted(names - existing)
+        ]
+        # Unordered so a team created concurrently does not block the others
+        inserted, _ = _insert(Team, teams, ordered=False)
+        _created(Team, inserted)
@@ -0,0 +1,200 @@
+import bisect
+import re
+import threading
+
+from . import versions
+from .models import User, Team, Workout
+
+
+TOKEN_RE = re.compile(r'\w+')
+DEFAULT_LIMIT = 10
+
+
+def tokenize(text):
+    """Lowercased word tokens of ``text``"""
+    return set(TOKEN_RE.findall((text or '').lower()))
+
+
+class PrefixIndex:
+    """
+    Inverted index of tokens kept in one sorted list
+
+    Prefix lookups are two bisections, so the cost of a query grows with
+    log(tokens) plus the number of results read, not with the collection.
+    """
+
+    def __init__(self):
+        self._entries = []
+        self._doc_tokens = {}
+
+    def __len__(self):
+        return len(self._doc_tokens)
+
+    def add(self, doc_id, tokens):
+        self.remove(doc_id)
+        for token in tokens:
+            bisect.insort(self._entries, (token, doc_id))
+        self._doc_tokens[doc_id] = tokens
+
+    def load(self, documents):
+        """Bulk-load (doc_id, tokens) pairs with a single sort"""
+        for doc_id, tokens in documents:
+            self._doc_tokens[doc_id] = tokens
+            self._entries.extend((token, doc_id) for token in tokens)
+        self._entries.sort()
+
+    def remove(self, doc_id):
+        for token in self._doc_tokens.pop(doc_id, ()):
+            i = bisect.bisect_left(self._entries, (token, doc_id))
+            if i < len(self._entries) and self._entries[i] == (token, doc_id):
+                del self._entries[i]
+
+    def _range(self, prefix):
+        lo = bisect.bisect_left(self._entries, (prefix,))
+        hi = bisect.bisect_left(self._entries, (prefix + '\uffff',))
+        return lo, hi
+
+    def _has_prefix(self, doc_id, prefix):
+        return any(token.startswith(prefix) for token in self._doc_tokens[doc_id])
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """Ids of documents with a token starting with every query term"""
+        if limit is not None and limit < 1:
+            raise ValueError('limit must be at least 1')
+        terms = tokenize(query)
+        if not terms:
+            return []
+        # Walk the narrowest term's range and check the others per document
+        ranges = [(self._range(term), term) for term in terms]
+        ranges.sort(key=lambda item: item[0][1] - item[0][0])
+        (lo, hi), _ = ranges[0]
+        others = [term for _, term in ranges[1:]]
+        results = []
+        seen = set()
+        for i in range(lo, hi):
+            doc_id = self._entries[i][1]
+            if doc_id in seen:
+                continue
+            seen.add(doc_id)
+            if all(self._has_prefix(doc_id, term) for term in others):
+                results.append(doc_id)
+                if limit is not None and len(results) >= limit:
+                    break
+        return results
+
+
+class SearchIndex:
+    """
+    Prefix index over the text fields of one model
+
+    Built from a single query on first use and kept current on save and
+    delete, so lookups never go to the database. Every write also advances
+    a shared version stamp; a worker whose index was built before another
+    process's write rebuilds it on its next search.
+    """
+
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = fields
+        self.version_name = f'search:{model._meta.db_table}'
+        self._lock = threading.Lock()
+        self._index = None
+        self._version = None
+        self._documents = {}
+
+    def _ensure_built(self):
+        if self._index is None or self._version != versions.current(self.version_name):
+            with self._lock:
+                # Read before the collection, so a write published while it
+                # is read leaves the index behind the stamp
+                version = versions.current(self.version_name)
+                if self._index is None or self._version != version:
+                    documents = {
+                        str(row[0]): dict(zip(self.fields, row[1:]))
+                        for row in self.model.objects.values_list('_id', *self.fields)
+                    }
+                    index = PrefixIndex()
+                    index.load((doc_id, self._tokens(document)) for doc_id, document in documents.items())
+                    self._documents = documents
+                    self._index = index
+                    self._version = version
+        return self._index
+
+    def _tokens(self, document):
+        tokens = set()
+        for field in self.fields:
+            tokens |= tokenize(document[field])
+        return tokens
+
+    # Writes take the lock before checking for an index, so one landing
+    # while _ensure_built reads the collection waits for the build and is
+    # applied to it rather than dropped. Each then publishes itself; the
+    # index stays current only if no other process published in between.
+
+    def _published(self):
+        self._version = versions.advance(self.version_name, self._version)
+
+    def update(self, instance):
+        with self._lock:
+            if self._index is not None:
+                doc_id = str(instance.pk)
+                document = {field: getattr(instance, field) for field in self.fields}
+                self._documents[doc_id] = document
+                self._index.add(doc_id, self._tokens(document))
+            self._published()
+
+    def update_many(self, documents):
+        """Index new raw documents (dicts with ``_id`` and the fields) with one sort"""
+        with self._lock:
+            if self._index is not None:
+                loaded = []
+                for raw in documents:
+                    doc_id = str(raw['_id'])
+                    document = {field: raw.get(field) for field in self.fields}
+                    self._documents[doc_id] = document
+                    loaded.append((doc_id, self._tokens(document)))
+                self._index.load(loaded)
+            self._published()
+
+    def remove(self, instance):
+        with self._lock:
+            if self._index is not None:
+                doc_id = str(instance.pk)
+                self._documents.pop(doc_id, None)
+                self._index.remove(doc_id)
+            self._published()
+
+    def changed(self):
+        """Publish writes made without the model's signals, e.g. a restore, to every worker"""
+        with self._lock:
+            versions.advance(self.version_name, None)
+            self._version = None
+
+    def reset(self):
+        with self._lock:
+            self._index = None
+            self._version = None
+            self._documents = {}
+
+    def search_ids(self, query, limit=DEFAULT_LIMIT):
+        index = self._ensure_built()
+        with self._lock:
+            return index.search(query, limit)
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """Matching documents as dicts of their indexed fields"""
+        index = self._ensure_built()
+        with self._lock:
+            return [
+                dict(_id=doc_id, **self._documents[doc_id])
+                for doc_id in index.search(query, limit)
+            ]
+
+
+indexes = {
+    'users': SearchIndex(User, ['name', 'email']),
+    'teams': SearchIndex(Team, ['name', 'description']),
+    'workouts': SearchIndex(Workout, ['name', 'description', 'activity_type']),
+}
+
+index_for_model = {index.model: index for index in indexes.values()}
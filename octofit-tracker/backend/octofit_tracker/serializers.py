@@ -1,5 +1,8 @@
+from django.db import models
 from rest_framework import serializers
-from .models import User, Team, Activity, Leaderboard, Workout
+from .models import User, Team, Activity, Leaderboard, Workout, Challenge
+from .challenges import MAX_DAYS
+from .loaders import user_loader
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -16,18 +19,51 @@ class TeamSerializer(serializers.ModelSerializer):
         read_only_fields = ['_id', 'created_at']
 
 
-class ActivitySerializer(serializers.ModelSerializer):
+class UserExpansionListSerializer(serializers.ListSerializer):
+    """Queues every referenced email so expansion costs one user query"""
+
+    def to_representation(self, data):
+        if self.child.expand_user:
+            data = list(data.all() if isinstance(data, models.Manager) else data)
+            user_loader(self.context['request']).prime(item.user_email for item in data)
+        return super().to_representation(data)
+
+
+class UserExpansionMixin:
+    """
+    Adds the referenced user under ``user`` when the request asks for
+    ``?expand=user``
+    """
+
+    @property
+    def expand_user(self):
+        request = self.context.get('request')
+        if request is None:
+            return False
+        return 'user' in request.query_params.get('expand', '').split(',')
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if self.expand_user:
+            user = user_loader(self.context['request']).load(instance.user_email)
+            data['user'] = UserSerializer(user).data if user is not None else None
+        return data
+
+
+class ActivitySerializer(UserExpansionMixin, serializers.ModelSerializer):
     class Meta:
         model = Activity
         fields = ['_id', 'user_email', 'activity_type', 'duration', 'calories_burned', 'date', 'created_at']
         read_only_fields = ['_id', 'created_at']
+        list_serializer_class = UserExpansionListSerializer
 
 
-class LeaderboardSerializer(serializers.ModelSerializer):
+class LeaderboardSerializer(UserExpansionMixin, serializers.ModelSerializer):
     class Meta:
         model = Leaderboard
         fields = ['_id', 'user_email', 'user_name', 'team', 'total_calories', 'total_activities', 'rank', 'updated_at']
         read_only_fields = ['_id', 'updated_at']
+        list_serializer_class = UserExpansionListSerializer
 
 
 class WorkoutSerializer(serializers.ModelSerializer):
@@ -35,3 +71,26 @@ class WorkoutSerializer(serializers.ModelSerializer):
         model = Workout
         fields = ['_id', 'name', 'description', 'activity_type', 'difficulty', 'estimated_calories', 'duration', 'created_at']
         read_only_fields = ['_id', 'created_at']
+
+
+class ChallengeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Challenge
+        fields = ['_id', 'name', 'description', 'start', 'end', 'metric', 'activity_type', 'scope', 'created_at']
+        read_only_fields = ['_id', 'created_at']
+
+    def validate(self, data):
+        start = data.get('start', getattr(self.instance, 'start', None))
+        end = data.get('end', getattr(self.instance, 'end', None))
+        if start and end:
+            if end < start:
+                raise serializers.ValidationError({'end': 'end must not be before start'})
+            if (end - start).days >= MAX_DAYS:
+                raise serializers.ValidationError({'end': f'a challenge can run for at most {MAX_DAYS} days'})
+        metric = data.get('metric', getattr(self.instance, 'metric', None))
+        activity_type = data.get('activity_type', getattr(self.instance, 'activity_type', ''))
+        if metric == 'type_count' and not activity_type:
+            raise serializers.ValidationError({'activity_type': 'activity_type is required for type_count challenges'})
+        if metric != 'type_count' and activity_type:
+            raise serializers.ValidationError({'activity_type': 'activity_type only applies to type_count challenges'})
+        return data
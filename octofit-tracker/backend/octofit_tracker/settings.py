@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -59,6 +60,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'octofit_tracker.slowlog.SlowQueryMiddleware',
 ]
 
 ROOT_URLCONF = 'octofit_tracker.urls'
@@ -85,9 +87,18 @@ WSGI_APPLICATION = 'octofit_tracker.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# Storage engine: 'mongo' (a MongoDB server) or 'memory', an in-process
+# store for tests and single-process demo instances whose data is lost
+# when the process exits
+STORAGE_ENGINES = {
+    'mongo': 'djongo',
+    'memory': 'octofit_tracker.memorydb',
+}
+OCTOFIT_STORAGE = os.environ.get('OCTOFIT_STORAGE', 'mongo')
+
 DATABASES = {
     'default': {
-        'ENGINE': 'djongo',
+        'ENGINE': STORAGE_ENGINES[OCTOFIT_STORAGE],
         'NAME': 'octofit_db',
         'ENFORCE_SCHEMA': False,
         'CLIENT': {
@@ -97,6 +108,116 @@ DATABASES = {
     }
 }
 
+# Django REST framework settings
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'octofit_tracker.renderers.MessagePackRenderer',
+        'octofit_tracker.renderers.ArrowStreamRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        'octofit_tracker.renderers.MessagePackParser',
+    ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'octofit_tracker.throttling.ClientWriteThrottle',
+        'octofit_tracker.throttling.EndpointWriteThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'writes': '600/min',
+        'activities': '120/min',
+    },
+}
+
+# Caches
+# Throttle buckets must be shared by every worker; set REDIS_URL in
+# multi-process deployments so they are not kept per process.
+REDIS_URL = os.environ.get('REDIS_URL')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'throttle': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'throttle',
+    },
+}
+if REDIS_URL:
+    CACHES['throttle'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    }
+
+THROTTLE_CACHE = 'throttle'
+
+# Admission control for write requests
+WRITE_CONCURRENCY_LIMIT = 32
+# Writes are shed with 503 while the average Mongo pool wait exceeds this (seconds)
+MONGO_POOL_WAIT_SHED_THRESHOLD = 0.25
+# Seconds for the average to halve while no connections are checked out
+MONGO_POOL_WAIT_HALF_LIFE = 2
+OVERLOAD_RETRY_AFTER = 2
+
+# Seconds that computed /api/analytics/ results stay cached
+ANALYTICS_CACHE_TIMEOUT = 300
+
+# Seconds that admin changelist facet choices stay cached
+ADMIN_FACET_CACHE_TIMEOUT = 600
+
+# Number of top leaderboard entries pushed over /api/leaderboard/stream/
+LEADERBOARD_STREAM_SIZE = 100
+
+# Seconds an Idempotency-Key is remembered; applied to the TTL index when
+# the idempotency_keys collection is migrated
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+# Seconds after which a retry may take over a key whose request never
+# finished, e.g. because its worker was killed mid-request
+IDEMPOTENCY_LEASE_SECONDS = 60
+
+# Directory for state shared by worker processes on this host
+OCTOFIT_RUNTIME_DIR = os.environ.get('OCTOFIT_RUNTIME_DIR', os.path.join(tempfile.gettempdir(), 'octofit'))
+
+# Write-behind mode for activity creation: writes are acknowledged once
+# appended to a local journal and group-committed to Mongo in batches
+ACTIVITY_WRITE_BEHIND = os.environ.get('ACTIVITY_WRITE_BEHIND', '').lower() in ('1', 'true', 'yes')
+# Seconds between group commits, and the most activities per commit
+ACTIVITY_JOURNAL_FLUSH_INTERVAL = 0.005
+ACTIVITY_JOURNAL_BATCH_SIZE = 1000
+# A fully flushed journal is truncated once it grows past this many bytes
+ACTIVITY_JOURNAL_COMPACT_BYTES = 1024 * 1024
+
+# Seconds after which a gap in the /api/sync/ change feed is treated as a
+# failed write rather than one still in progress
+CHANGE_FEED_SETTLE_SECONDS = 5
+
+# Serve the leaderboard and workout catalog from memory-mapped segments
+# shared by every worker on the host; when off, or when the segment
+# directory is unusable, each worker caches them itself. Point the
+# directory at a tmpfs such as /dev/shm to keep segments off disk. Always
+# off with in-memory storage, whose data is private to each process.
+SHARED_CACHE = (
+    os.environ.get('SHARED_CACHE', 'true').lower() in ('1', 'true', 'yes')
+    and OCTOFIT_STORAGE != 'memory'
+)
+SHARED_CACHE_DIR = os.environ.get('SHARED_CACHE_DIR')
+
+# How long a worker may serve its leaderboard segment (milliseconds) before
+# picking up changes made by activity writes; edits made through the ORM
+# show up at once in the worker that made them
+LEADERBOARD_MAX_STALENESS_MS = int(os.environ.get('LEADERBOARD_MAX_STALENESS_MS', 1000))
+
+# Slow query log: Mongo commands slower than the threshold are grouped by
+# query shape in slow_queries with the view that issued them, and each
+# group's explain() plan is refreshed at most once per interval (seconds).
+# Review with `manage.py slow_queries`.
+SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG', 'true').lower() in ('1', 'true', 'yes')
+SLOW_QUERY_THRESHOLD_MS = int(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 100))
+SLOW_QUERY_EXPLAIN_INTERVAL = 600
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
@@ -0,0 +1,158 @@
+import fcntl
+import glob
+import json
+import logging
+import mmap
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from . import versions
+
+
+logger = logging.getLogger(__name__)
+
+
+def _directory():
+    base = settings.SHARED_CACHE_DIR or os.path.join(settings.OCTOFIT_RUNTIME_DIR, 'shm')
+    # Keyed by database so, for example, a test run never maps production segments
+    return os.path.join(base, connection.settings_dict['NAME'])
+
+
+class Segment:
+    """
+    One version of a cached dataset: its JSON encoding and, decoded on
+    first use, its value
+
+    ``payload`` is a read-only view of the shared mapping, or plain bytes
+    when caching per process. A mapping stays valid after its file is
+    replaced, for as long as it is referenced.
+    """
+
+    def __init__(self, version, payload):
+        self.version = version
+        self.payload = payload
+        self._value = None
+
+    def value(self):
+        if self._value is None:
+            self._value = json.loads(bytes(self.payload))
+        return self._value
+
+
+class SharedCache:
+    """
+    A JSON-encoded dataset shared by the worker processes on a host
+
+    Each version is written once to a file that every worker maps
+    read-only, so the page cache holds one copy however many workers
+    serve it. The first worker to need a missing version builds it under
+    a file lock; workers that find the lock taken keep serving the version
+    they have mapped until the new one lands. Versions are the shared
+    stamps of versions.py, bumped by writers after they change the data.
+
+    With SHARED_CACHE off, or when the segment directory cannot be used,
+    each worker builds and caches the dataset itself.
+
+    ``max_age`` returns how many seconds a worker may keep serving its
+    segment before checking the stamp again, so a dataset that changes on
+    every write is rebuilt at most once per interval rather than on
+    nearly every read.
+    """
+
+    def __init__(self, name, build, max_age=None):
+        self.name = name
+        self.build = build
+        self.max_age = max_age or (lambda: 0)
+        self._segment = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self._warned = False
+
+    def get(self):
+        segment = self._segment
+        if segment is not None and time.monotonic() - self._checked < self.max_age():
+            return segment
+        version = versions.current(self.name)
+        if segment is not None and segment.version == version:
+            self._checked = time.monotonic()
+            return segment
+        if not self._lock.acquire(blocking=segment is None):
+            return segment  # another thread is loading the new version
+        try:
+            segment = self._segment
+            if segment is None or segment.version != version:
+                segment = self._segment = self._load(version)
+            self._checked = time.monotonic()
+        finally:
+            self._lock.release()
+        return segment
+
+    def changed(self, immediate=True):
+        """
+        Publish a change to the data to every worker
+
+        Other workers see it once their max age has passed. This worker
+        sees it on its next read, unless ``immediate`` is False, as for
+        changes that arrive with every write.
+        """
+        versions.bump(self.name)
+        if immediate:
+            self._segment = None
+
+    def _load(self, version):
+        if not settings.SHARED_CACHE:
+            return Segment(version, self.build())
+        try:
+            return self._shared(version)
+        except OSError as exc:
+            if not self._warned:
+                logger.warning('Shared cache for %s unavailable, caching per process: %s', self.name, exc)
+                self._warned = True
+            return Segment(version, self.build())
+
+    def _shared(self, version):
+        directory = _directory()
+        path = os.path.join(directory, f'{self.name}.{version or "initial"}.segment')
+        segment = self._map(version, path)
+        if segment is not None:
+            return segment
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f'{self.name}.lock'), 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                if self._segment is not None:
+                    return self._segment
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            segment = self._map(version, path)
+            if segment is None:
+                self._write(path, self.build())
+                segment = self._map(version, path)
+        return segment
+
+    def _write(self, path, payload):
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as segment:
+            segment.write(payload)
+        os.replace(temporary, path)
+        # Workers still mapping an older version keep it until they move on
+        for stale in glob.glob(os.path.join(os.path.dirname(path), f'{self.name}.*.segment')):
+            if stale != path:
+                try:
+                    os.unlink(stale)
+                except FileNotFoundError:
+                    pass
+
+    @staticmethod
+    def _map(version, path):
+        try:
+            segment = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        with segment:
+            mapped = mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ)
+        return Segment(version, memoryview(mapped))
@@ -0,0 +1,113 @@
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from . import badges, challenges, changes, leaderboard, search
+from .models import User, Team, Activity, Leaderboard, Workout, Challenge, ChallengeProgress
+from .catalog import catalog
+from .streaming import broadcaster
+
+
+def _invalidate_analytics(email):
+    # Imported on first use to keep NumPy out of worker start-up
+    from .analytics import invalidate
+    invalidate(email)
+
+
+@receiver(pre_save, sender=Activity)
+def activity_saving(sender, instance, **kwargs):
+    instance._previous = None
+    if instance.pk is not None:
+        instance._previous = (
+            Activity.objects.filter(pk=instance.pk)
+            .values('user_email', 'activity_type', 'duration', 'calories_burned', 'date')
+            .first()
+        )
+
+
+@receiver(post_save, sender=Activity)
+def activity_saved(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous', None)
+    if previous is not None:
+        previous_email, previous_calories = previous['user_email'], previous['calories_burned']
+        if previous_email != instance.user_email:
+            leaderboard.apply_activity(previous_email, -previous_calories, -1)
+            _invalidate_analytics(previous_email)
+            leaderboard.apply_activity(instance.user_email, instance.calories_burned)
+            badges.refresh(previous_email)
+        elif previous_calories != instance.calories_burned:
+            leaderboard.apply_activity(instance.user_email, instance.calories_burned - previous_calories, 0)
+        badges.refresh(instance.user_email)
+        challenges.apply_activities([previous], sign=-1)
+        challenges.apply_activities([challenges.activity_fields(instance)])
+    else:
+        leaderboard.apply_activity(instance.user_email, instance.calories_burned)
+        badges.apply_activity(instance)
+        challenges.apply_activities([challenges.activity_fields(instance)])
+    _invalidate_analytics(instance.user_email)
+    broadcaster.notify()
+
+
+@receiver(post_delete, sender=Activity)
+def activity_deleted(sender, instance, **kwargs):
+    leaderboard.apply_activity(instance.user_email, -instance.calories_burned, -1)
+    badges.refresh(instance.user_email)
+    challenges.apply_activities([challenges.activity_fields(instance)], sign=-1)
+    _invalidate_analytics(instance.user_email)
+    broadcaster.notify()
+
+
+@receiver(post_save, sender=Challenge)
+def challenge_saved(sender, instance, **kwargs):
+    challenges.index.changed()
+    challenges.rebuild(instance)
+
+
+# Before the delete, while the instance still has its pk
+@receiver(pre_delete, sender=Challenge)
+def challenge_deleting(sender, instance, **kwargs):
+    challenges.index.changed()
+    ChallengeProgress.objects.mongo_delete_many({'challenge_id': str(instance.pk)})
+
+
+@receiver(post_save, sender=Workout)
+@receiver(post_delete, sender=Workout)
+def workout_changed(sender, instance, **kwargs):
+    catalog.changed()
+
+
+@receiver(post_save, sender=Leaderboard)
+@receiver(post_delete, sender=Leaderboard)
+def leaderboard_changed(sender, instance, **kwargs):
+    leaderboard.board.changed()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Team)
+@receiver(post_save, sender=Workout)
+def searchable_saved(sender, instance, **kwargs):
+    search.index_for_model[sender].update(instance)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Team)
+@receiver(post_delete, sender=Workout)
+def searchable_deleted(sender, instance, **kwargs):
+    search.index_for_model[sender].remove(instance)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Team)
+@receiver(post_save, sender=Activity)
+@receiver(post_save, sender=Leaderboard)
+@receiver(post_save, sender=Workout)
+def tracked_saved(sender, instance, **kwargs):
+    changes.record(sender, [instance.pk], changes.UPSERT)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Team)
+@receiver(post_delete, sender=Activity)
+@receiver(post_delete, sender=Leaderboard)
+@receiver(post_delete, sender=Workout)
+def tracked_deleted(sender, instance, **kwargs):
+    changes.record(sender, [instance.pk], changes.DELETE)
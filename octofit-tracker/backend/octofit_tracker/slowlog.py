@@ -0,0 +1,274 @@
+import contextvars
+import hashlib
+import logging
+import queue
+import threading
+from datetime import timedelta
+
+from bson import json_util
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from pymongo import ReturnDocument, monitoring
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from .models import SlowQuery
+
+
+logger = logging.getLogger(__name__)
+
+# Commands whose plan explain() can show, and where each keeps its filter and sort
+EXPLAINABLE = {
+    'find': ('filter', 'sort'),
+    'count': ('query', None),
+    'distinct': ('query', None),
+    'findAndModify': ('query', 'sort'),
+    'aggregate': (None, None),
+    'update': (None, None),
+    'delete': (None, None),
+}
+IGNORED_COMMANDS = {'explain', 'getMore', 'killCursors', 'endSessions', 'isMaster', 'hello', 'ping', 'buildInfo'}
+# Driver fields that are not part of the query itself
+SESSION_FIELDS = {'$db', 'lsid', 'txnNumber', '$clusterTime', '$readPreference', 'readConcern', 'writeConcern'}
+QUEUE_SIZE = 1000
+SAMPLE_LENGTH = 2000
+
+# The viewset action (or other view) whose request issued a command.
+# The recorder thread sets it to IGNORE so its own writes are not logged.
+_source = contextvars.ContextVar('slow_query_source', default=None)
+IGNORE = object()
+
+
+def current_source():
+    return _source.get()
+
+
+def view_source(request, view_func):
+    """``ViewSet.action`` for DRF views, the URL name for other views"""
+    cls = getattr(view_func, 'cls', None)
+    if cls is not None:
+        method = request.method.lower()
+        return f'{cls.__name__}.{(getattr(view_func, "actions", None) or {}).get(method, method)}'
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None and match.view_name else view_func.__qualname__
+
+
+class SlowQueryMiddleware:
+    """Attributes the Mongo commands of a request to the view handling it"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _source.set(None)
+        try:
+            return self.get_response(request)
+        finally:
+            _source.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        _source.set(view_source(request, view_func))
+
+
+def _shape(value):
+    """A query with its values replaced, so queries differing only in values match"""
+    if isinstance(value, dict):
+        return {key: _shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if all(not isinstance(item, (dict, list, tuple)) for item in value):
+            return '?'
+        return [_shape(item) for item in value]
+    return '?'
+
+
+def _query_parts(command_name, command):
+    """The filter and sort of a command, for grouping and index advice"""
+    if command_name == 'aggregate':
+        pipeline = command.get('pipeline', [])
+        match = next((stage['$match'] for stage in pipeline[:1] if '$match' in stage), {})
+        sort = next((stage['$sort'] for stage in pipeline[1:2] if '$sort' in stage), None)
+        return match, sort
+    if command_name in ('update', 'delete'):
+        statements = command.get(f'{command_name}s', [])
+        return (statements[0].get('q', {}) if statements else {}), None
+    filter_field, sort_field = EXPLAINABLE.get(command_name, (None, None))
+    return command.get(filter_field, {}) if filter_field else {}, command.get(sort_field) if sort_field else None
+
+
+def _find(document, key):
+    """The first value of ``key`` anywhere in a nested explain document"""
+    if isinstance(document, dict):
+        if key in document:
+            return document[key]
+        children = document.values()
+    elif isinstance(document, list):
+        children = document
+    else:
+        return None
+    for child in children:
+        found = _find(child, key)
+        if found is not None:
+            return found
+    return None
+
+
+def summarise_plan(explain):
+    """
+    The winning plan's stages (outermost first), the indexes it reads and
+    its execution counts
+    """
+    stages = []
+    indexes = []
+    pending = [_find(explain, 'winningPlan') or {}]
+    while pending:
+        stage = pending.pop(0)
+        stage = stage.get('queryPlan', stage)
+        if 'stage' in stage:
+            stages.append(stage['stage'])
+        if 'indexName' in stage:
+            indexes.append(stage['indexName'])
+        if 'inputStage' in stage:
+            pending.append(stage['inputStage'])
+        pending.extend(stage.get('inputStages', []))
+    stats = _find(explain, 'executionStats') or {}
+    return {
+        'plan': ' > '.join(stages),
+        'indexes_used': indexes,
+        'keys_examined': stats.get('totalKeysExamined'),
+        'docs_examined': stats.get('totalDocsExamined'),
+        'returned': stats.get('nReturned'),
+    }
+
+
+def suggest_index(shape, sort=None):
+    """
+    Index keys for a query shape: equality fields, then sort fields, then
+    range fields
+    """
+    equality, ranges = [], []
+    for field, condition in (shape or {}).items():
+        if field.startswith('$'):
+            continue
+        operators = condition.keys() if isinstance(condition, dict) else ()
+        if operators and any(op in ('$gt', '$gte', '$lt', '$lte', '$ne', '$nin', '$regex') for op in operators):
+            ranges.append((field, 1))
+        else:
+            equality.append((field, 1))
+    keys = equality + [(field, direction) for field, direction in (sort or {}).items() if field not in dict(equality)]
+    return keys + [key for key in ranges if key[0] not in dict(keys)]
+
+
+def _explain(database_name, command):
+    connection.ensure_connection()
+    database = connection.connection.client[database_name]
+    return database.command('explain', command, verbosity='executionStats')
+
+
+class SlowQueryRecorder(monitoring.CommandListener):
+    """
+    Logs Mongo commands slower than SLOW_QUERY_THRESHOLD_MS
+
+    Commands are grouped by collection, operation and query shape. A
+    background thread updates each group's counts and, at most once per
+    SLOW_QUERY_EXPLAIN_INTERVAL, stores the plan explain() reports for it,
+    so a slow request pays only for a queue put. When the queue is full
+    new entries are dropped.
+    """
+
+    def __init__(self):
+        self._started = {}
+        self._queue = queue.Queue(QUEUE_SIZE)
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self.dropped = 0
+
+    def started(self, event):
+        source = _source.get()
+        if source is IGNORE or event.command_name in IGNORED_COMMANDS or not settings.SLOW_QUERY_LOG:
+            return
+        self._started[event.connection_id, event.request_id] = (event.database_name, event.command, source)
+
+    def succeeded(self, event):
+        started = self._started.pop((event.connection_id, event.request_id), None)
+        if started is None:
+            return
+        milliseconds = event.duration_micros / 1000
+        if milliseconds >= settings.SLOW_QUERY_THRESHOLD_MS:
+            self.enqueue(event.command_name, milliseconds, *started)
+
+    def failed(self, event):
+        self._started.pop((event.connection_id, event.request_id), None)
+
+    def enqueue(self, command_name, milliseconds, database_name, command, source):
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait((command_name, milliseconds, database_name, command, source))
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='slow-query-recorder', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        _source.set(IGNORE)
+        while True:
+            entry = self._queue.get()
+            try:
+                self.record(*entry)
+            except Exception:
+                logger.exception('Could not record slow query')
+            finally:
+                self._queue.task_done()
+
+    def drain(self):
+        """Wait until every queued entry is recorded"""
+        self._queue.join()
+
+    def record(self, command_name, milliseconds, database_name, command, source):
+        command = {key: value for key, value in command.items() if key not in SESSION_FIELDS}
+        collection = command.get(command_name)
+        query, sort = _query_parts(command_name, command)
+        shape = json_util.dumps({'filter': _shape(query), 'sort': sort}, sort_keys=True)
+        fingerprint = hashlib.sha1(f'{collection}:{command_name}:{shape}'.encode()).hexdigest()
+        now = timezone.now().replace(tzinfo=None)
+        update = {
+            '$inc': {'count': 1, 'total_ms': milliseconds},
+            '$max': {'max_ms': milliseconds, 'last_seen': now},
+            '$set': {'sample': json_util.dumps(command)[:SAMPLE_LENGTH]},
+            '$setOnInsert': {
+                'collection': collection, 'operation': command_name, 'shape': shape, 'first_seen': now,
+                'plan': '', 'indexes_used': [], 'explained_at': None,
+            },
+        }
+        if source is not None:
+            update['$addToSet'] = {'sources': source}
+        else:
+            update['$setOnInsert']['sources'] = []
+        try:
+            previous = SlowQuery.objects.mongo_find_one_and_update(
+                {'fingerprint': fingerprint}, update, upsert=True,
+                projection={'explained_at': 1}, return_document=ReturnDocument.BEFORE,
+            )
+        except DuplicateKeyError:
+            # Another worker logged the same shape first
+            previous = SlowQuery.objects.mongo_find_one_and_update(
+                {'fingerprint': fingerprint}, update, projection={'explained_at': 1},
+                return_document=ReturnDocument.BEFORE,
+            )
+        explained_at = previous and previous.get('explained_at')
+        interval = timedelta(seconds=settings.SLOW_QUERY_EXPLAIN_INTERVAL)
+        if command_name in EXPLAINABLE and (explained_at is None or explained_at < now - interval):
+            try:
+                plan = summarise_plan(_explain(database_name, command))
+            except PyMongoError as exc:
+                logger.info('Could not explain %s on %s: %s', command_name, collection, exc)
+                return
+            SlowQuery.objects.mongo_update_one({'fingerprint': fingerprint}, {'$set': dict(plan, explained_at=now)})
+
+
+recorder = SlowQueryRecorder()
@@ -0,0 +1,243 @@
+import gzip
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bson
+from bson import json_util
+from django.db import connection
+from django.utils import timezone
+from pymongo import IndexModel
+
+from . import badges, challenges, changes, leaderboard, search
+from .catalog import catalog
+from .models import Activity, BadgeState, BadgeAward, Challenge, ChallengeProgress, Leaderboard
+
+
+FORMAT_VERSION = 1
+MANIFEST = 'manifest.json'
+COLLECTIONS = list(changes.TRACKED_MODELS)
+CHUNK_DOCUMENTS = 20000
+INSERT_BATCH = 5000
+# Fast compression: snapshots are written far more often than they are kept
+COMPRESS_LEVEL = 1
+# Index options that describe the server's copy rather than the index
+INDEX_META_FIELDS = {'v', 'ns', 'key', 'name'}
+# Collections whose restore invalidates badge state and challenge progress,
+# and the leaderboard when it is not restored with them
+DERIVED_FROM = {'users', 'activities'}
+RECONCILE_BATCH = 5000
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class Throughput:
+    """Documents and uncompressed bytes moved per collection, and the time taken"""
+
+    def __init__(self, collections):
+        self.documents = dict.fromkeys(collections, 0)
+        self.bytes = dict.fromkeys(collections, 0)
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, collection, documents, size):
+        with self._lock:
+            self.documents[collection] += documents
+            self.bytes[collection] += size
+
+    def lines(self):
+        lines = [
+            f'{collection}: {self.documents[collection]} documents, {self.bytes[collection] / 1e6:.1f} MB'
+            for collection in self.documents
+        ]
+        total_documents = sum(self.documents.values())
+        total_bytes = sum(self.bytes.values())
+        seconds = max(self.seconds, 1e-6)
+        lines.append(
+            f'{total_documents} documents, {total_bytes / 1e6:.1f} MB in {self.seconds:.2f}s '
+            f'({total_documents / seconds:,.0f} documents/s, {total_bytes / 1e6 / seconds:.1f} MB/s)'
+        )
+        return lines
+
+
+def _database():
+    connection.ensure_connection()
+    return connection.connection
+
+
+def _chunk_name(collection, number):
+    return f'{collection}.{number:05d}.bson.gz'
+
+
+def _write_chunk(path, encoded):
+    with gzip.open(path, 'wb', compresslevel=COMPRESS_LEVEL) as chunk:
+        chunk.write(b''.join(encoded))
+
+
+def _check_jobs(jobs):
+    if jobs < 1:
+        raise SnapshotError('jobs must be at least 1')
+
+
+def _rebuild_derived():
+    """Recompute badge state, awards and challenge progress from the restored activities"""
+    BadgeState.objects.mongo_delete_many({})
+    BadgeAward.objects.mongo_delete_many({})
+    ChallengeProgress.objects.mongo_delete_many({})
+    badges.rebuild_all()
+    for challenge in Challenge.objects.all():
+        challenges.rebuild(challenge)
+
+
+def _reconcile_leaderboard():
+    """Bring leaderboard totals and ranks in line with the restored activities"""
+    emails = set(Activity.objects.mongo_distinct('user_email'))
+    emails.update(Leaderboard.objects.mongo_distinct('user_email'))
+    emails = sorted(emails)
+    for start in range(0, len(emails), RECONCILE_BATCH):
+        leaderboard.reconcile(emails[start:start + RECONCILE_BATCH])
+    leaderboard.rerank()
+
+
+def _index_specs(collection):
+    return [
+        {'key': list(index['key'].items()), 'name': index['name'],
+         'options': {key: value for key, value in index.items() if key not in INDEX_META_FIELDS}}
+        for index in collection.list_indexes()
+        if index['name'] != '_id_'
+    ]
+
+
+def dump(directory, collections=COLLECTIONS, jobs=4, chunk_documents=CHUNK_DOCUMENTS):
+    """
+    Write collections and their index definitions to ``directory``
+
+    Each collection is read by its own thread and cut into gzip-compressed
+    chunks of concatenated BSON, compressed and written by a pool of
+    ``jobs`` threads. The snapshot is not a point-in-time copy across
+    collections; take it from a quiet database.
+    """
+    _check_jobs(jobs)
+    os.makedirs(directory, exist_ok=True)
+    if os.path.exists(os.path.join(directory, MANIFEST)):
+        raise SnapshotError(f'{directory} already holds a snapshot')
+    database = _database()
+    throughput = Throughput(collections)
+    started = time.monotonic()
+
+    def read(name, writers):
+        collection = database[name]
+        chunks, pending, encoded, count = [], [], [], 0
+        for document in collection.find(batch_size=chunk_documents):
+            encoded.append(bson.encode(document))
+            if len(encoded) == chunk_documents:
+                chunks.append(_chunk_name(name, len(chunks)))
+                pending.append(writers.submit(_write_chunk, os.path.join(directory, chunks[-1]), encoded))
+                throughput.add(name, len(encoded), sum(map(len, encoded)))
+                count += len(encoded)
+                encoded = []
+        if encoded:
+            chunks.append(_chunk_name(name, len(chunks)))
+            pending.append(writers.submit(_write_chunk, os.path.join(directory, chunks[-1]), encoded))
+            throughput.add(name, len(encoded), sum(map(len, encoded)))
+            count += len(encoded)
+        for future in pending:
+            future.result()
+        return {'documents': count, 'chunks': chunks, 'indexes': _index_specs(collection)}
+
+    with ThreadPoolExecutor(max_workers=jobs) as writers, ThreadPoolExecutor(max_workers=len(collections)) as readers:
+        results = {name: readers.submit(read, name, writers) for name in collections}
+        manifest = {
+            'format': FORMAT_VERSION,
+            'created_at': timezone.now(),
+            'database': database.name,
+            'collections': {name: future.result() for name, future in results.items()},
+        }
+    with open(os.path.join(directory, MANIFEST), 'w') as out:
+        out.write(json_util.dumps(manifest, indent=2))
+    throughput.seconds = time.monotonic() - started
+    return manifest, throughput
+
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST)) as source:
+            manifest = json_util.loads(source.read())
+    except FileNotFoundError:
+        raise SnapshotError(f'{directory} holds no snapshot manifest')
+    if manifest.get('format') != FORMAT_VERSION:
+        raise SnapshotError(f"unsupported snapshot format {manifest.get('format')}")
+    return manifest
+
+
+def restore(directory, collections=None, jobs=4, drop=False):
+    """
+    Load a snapshot written by ``dump``
+
+    Chunks of every collection are decompressed and bulk inserted by a
+    pool of ``jobs`` threads into emptied collections; indexes are built
+    once all documents are in, which is much faster than maintaining them
+    during the load. Sync tokens issued before the restore are expired;
+    the shared leaderboard and workout caches, and the search indexes of
+    restored collections, are invalidated. Restoring users or activities
+    rebuilds badge state and challenge progress, which describe the
+    replaced data, and, unless the leaderboard is restored with them,
+    reconciles its totals and ranks.
+    """
+    _check_jobs(jobs)
+    manifest = read_manifest(directory)
+    available = manifest['collections']
+    collections = list(available) if collections is None else collections
+    unknown = [name for name in collections if name not in available]
+    if unknown:
+        raise SnapshotError(f"not in snapshot: {', '.join(unknown)}")
+    database = _database()
+    if not drop:
+        occupied = [name for name in collections if database[name].estimated_document_count()]
+        if occupied:
+            raise SnapshotError(f"not empty: {', '.join(occupied)}; drop them to replace their contents")
+    for name in collections:
+        database[name].drop()
+
+    throughput = Throughput(collections)
+    started = time.monotonic()
+
+    def load(name, chunk):
+        with gzip.open(os.path.join(directory, chunk), 'rb') as source:
+            data = source.read()
+        documents = bson.decode_all(data)
+        for start in range(0, len(documents), INSERT_BATCH):
+            database[name].insert_many(documents[start:start + INSERT_BATCH], ordered=False)
+        throughput.add(name, len(documents), len(data))
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        loads = [pool.submit(load, name, chunk) for name in collections for chunk in available[name]['chunks']]
+        for future in loads:
+            future.result()
+        builds = [
+            pool.submit(database[name].create_indexes, [
+                IndexModel(spec['key'], name=spec['name'], **spec['options'])
+                for spec in available[name]['indexes']
+            ])
+            for name in collections
+            if available[name]['indexes']
+        ]
+        for future in builds:
+            future.result()
+    if DERIVED_FROM.intersection(collections):
+        _rebuild_derived()
+        if 'leaderboard' not in collections:
+            _reconcile_leaderboard()
+    throughput.seconds = time.monotonic() - started
+
+    changes.expire_all()
+    leaderboard.board.changed()
+    catalog.changed()
+    for name in collections:
+        index = search.index_for_model.get(changes.TRACKED_MODELS[name])
+        if index is not None:
+            index.changed()
+    return throughput
@@ -0,0 +1,161 @@
+import asyncio
+import json
+import logging
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from pymongo.errors import PyMongoError
+
+from .models import Leaderboard
+
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_STREAM_PATH = '/api/leaderboard/stream/'
+KEEPALIVE_SECONDS = 15
+COALESCE_SECONDS = 0.05
+SNAPSHOT_FIELDS = ['user_email', 'user_name', 'team', 'total_calories', 'total_activities', 'rank']
+
+
+def load_snapshot(size=None):
+    """The top of the leaderboard keyed by user email"""
+    size = size or settings.LEADERBOARD_STREAM_SIZE
+    entries = Leaderboard.objects.order_by('rank').values(*SNAPSHOT_FIELDS)[:size]
+    return {entry['user_email']: entry for entry in entries}
+
+
+def diff_snapshots(before, after):
+    """Entries that changed or entered the board, and emails that left it"""
+    changed = [entry for email, entry in after.items() if before.get(email) != entry]
+    removed = [email for email in before if email not in after]
+    changed.sort(key=lambda entry: entry['rank'])
+    return {'changed': changed, 'removed': removed}
+
+
+class LeaderboardBroadcaster:
+    """
+    Fans leaderboard rank changes out to every open stream
+
+    Change notifications are coalesced and the board is read and diffed
+    once per burst, however many clients are subscribed.
+    """
+
+    def __init__(self):
+        self._subscribers = set()
+        self._loop = None
+        self._snapshot = None
+        self._refresh_pending = False
+
+    def subscribe(self):
+        self._loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+        if not self._subscribers:
+            self._snapshot = None
+
+    async def snapshot(self):
+        if self._snapshot is None:
+            self._snapshot = await sync_to_async(load_snapshot)()
+        return list(self._snapshot.values())
+
+    def notify(self):
+        """Signal that the leaderboard changed; safe to call from any thread"""
+        loop = self._loop
+        if loop is None or not self._subscribers or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self._schedule_refresh)
+
+    def _schedule_refresh(self):
+        if not self._refresh_pending:
+            self._refresh_pending = True
+            asyncio.ensure_future(self._refresh())
+
+    async def _refresh(self):
+        await asyncio.sleep(COALESCE_SECONDS)
+        self._refresh_pending = False
+        before = self._snapshot or {}
+        after = await sync_to_async(load_snapshot)()
+        self._snapshot = after
+        delta = diff_snapshots(before, after)
+        if delta['changed'] or delta['removed']:
+            for queue in self._subscribers:
+                queue.put_nowait(delta)
+
+
+broadcaster = LeaderboardBroadcaster()
+
+
+def watch_change_stream():
+    """
+    Feed the broadcaster from a Mongo change stream on the leaderboard
+    collection, so writes made by other processes are pushed too
+
+    Change streams need a replica set. On a standalone mongod the watcher
+    exits and activity signals in this process remain the only feed.
+    """
+
+    def run():
+        try:
+            with Leaderboard.objects.mongo_watch() as stream:
+                for _ in stream:
+                    broadcaster.notify()
+        except PyMongoError as exc:
+            logger.info('Leaderboard change stream unavailable, using local signals: %s', exc)
+
+    thread = threading.Thread(target=run, name='leaderboard-change-stream', daemon=True)
+    thread.start()
+    return thread
+
+
+def _event(name, data):
+    return f'event: {name}\ndata: {json.dumps(data, default=str)}\n\n'.encode()
+
+
+async def _wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def leaderboard_stream(scope, receive, send):
+    """ASGI app streaming leaderboard rank changes as Server-Sent Events"""
+    queue = broadcaster.subscribe()
+    disconnect = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'access-control-allow-origin', b'*'),
+            ],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': _event('snapshot', await broadcaster.snapshot()),
+            'more_body': True,
+        })
+        while True:
+            update = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait(
+                {update, disconnect}, timeout=KEEPALIVE_SECONDS, return_when=asyncio.FIRST_COMPLETED
+            )
+            if disconnect in done:
+                update.cancel()
+                break
+            if update in done:
+                body = _event('ranks', update.result())
+            else:
+                update.cancel()
+                body = b': keepalive\n\n'
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+    finally:
+        broadcaster.unsubscribe(queue)
+        disconnect.cancel()
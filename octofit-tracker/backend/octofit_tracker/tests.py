@@ -1,8 +1,39 @@
-from django.test import TestCase
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.utils import load_backend
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from pymongo import monitoring
+from pymongo.errors import AutoReconnect, DuplicateKeyError
 from rest_framework.test import APITestCase
 from rest_framework import status
-from datetime import date, timedelta
-from .models import User, Team, Activity, Leaderboard, Workout
+from datetime import date, datetime, timedelta
+from bson import ObjectId, json_util
+from .models import (
+    User, Team, Activity, Leaderboard, Workout, BadgeState, BadgeAward, Challenge, ChallengeProgress, IdempotencyKey,
+    SlowQuery,
+)
+from . import badges, changes, idempotency, leaderboard, roster, search, settings_api, slowlog, versions, warmup
+from .catalog import catalog
+from .journal import ActivityJournal, activity_journal
+from .loaders import UserLoader
+from .memorydb import base as memorydb, indexes
+from .paginators import KeysetPaginator
+from .recommendations import UserProfile
+from .sharedcache import SharedCache
+from .throttling import ClientWriteThrottle, EndpointWriteThrottle, pool_monitor
+from .views import ActivityViewSet
 
 
 class UserModelTest(TestCase):
@@ -340,3 +371,1515 @@ class APIRootTest(APITestCase):
         self.assertIn('activities', response.data)
         self.assertIn('leaderboard', response.data)
         self.assertIn('workouts', response.data)
+
+
+class BinaryFormatAPITest(APITestCase):
+    """Test cases for MessagePack and Arrow content negotiation"""
+    
+    def setUp(self):
+        for day in range(3):
+            Activity.objects.create(
+                user_email='test@hero.com',
+                activity_type='Running',
+                duration=30 + day,
+                calories_burned=300 + day,
+                date=date.today() - timedelta(days=day)
+            )
+    
+    def test_activities_as_msgpack(self):
+        """Test that activities can be negotiated as MessagePack"""
+        import msgpack
+        response = self.client.get('/api/activities/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        rows = msgpack.unpackb(response.content, raw=False)
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['user_email'], 'test@hero.com')
+    
+    def test_activities_as_arrow_stream(self):
+        """Test that the activity list streams as Arrow record batches"""
+        import pyarrow as pa
+        response = self.client.get('/api/activities/?format=arrow')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        table = pa.ipc.open_stream(b''.join(response.streaming_content)).read_all()
+        self.assertEqual(table.num_rows, 3)
+        self.assertEqual(table.schema.field('duration').type, pa.int64())
+        self.assertEqual(sorted(table.column('calories_burned').to_pylist()), [300, 301, 302])
+    
+    def test_leaderboard_as_arrow_stream(self):
+        """Test that the leaderboard streams as Arrow in rank order"""
+        import pyarrow as pa
+        response = self.client.get('/api/leaderboard/', HTTP_ACCEPT='application/vnd.apache.arrow.stream')
+        table = pa.ipc.open_stream(b''.join(response.streaming_content)).read_all()
+        self.assertEqual(table.column('total_calories').to_pylist(), [903])
+
+
+class AnalyticsAPITest(APITestCase):
+    """Test cases for Analytics API endpoints"""
+    
+    def setUp(self):
+        cache.clear()
+        User.objects.create(name='Test Hero', email='test@hero.com', team='Test Team')
+        User.objects.create(name='Other Hero', email='other@hero.com', team='Other Team')
+        for day, activity_type in enumerate(['Running', 'Running', 'Yoga']):
+            Activity.objects.create(
+                user_email='test@hero.com',
+                activity_type=activity_type,
+                duration=30,
+                calories_burned=300 + day * 30,
+                date=date.today() - timedelta(days=day)
+            )
+        Activity.objects.create(
+            user_email='other@hero.com',
+            activity_type='Cycling',
+            duration=20,
+            calories_burned=100,
+            date=date.today() - timedelta(days=10)
+        )
+    
+    def test_user_analytics(self):
+        """Test per-type averages, streaks and percentile for a user"""
+        response = self.client.get('/api/analytics/user/?email=test@hero.com')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_calories'], 990)
+        by_type = {row['activity_type']: row for row in response.data['by_type']}
+        self.assertEqual(by_type['Running']['count'], 2)
+        self.assertEqual(by_type['Running']['avg_calories'], 315.0)
+        self.assertEqual(response.data['streaks'], {'current': 3, 'longest': 3})
+        self.assertEqual(response.data['percentile'], 75.0)
+        self.assertEqual(len(response.data['weekly_trend']), 8)
+    
+    def test_team_analytics(self):
+        """Test analytics aggregated over team members"""
+        response = self.client.get('/api/analytics/team/?team=Other Team')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['members'], 1)
+        self.assertEqual(response.data['total_calories'], 100)
+        self.assertEqual(response.data['streaks']['current'], 0)
+        self.assertEqual(response.data['percentile'], 25.0)
+    
+    def test_percentiles_do_not_aggregate_activities(self):
+        """Test that percentiles come from the leaderboard rather than a pass over every activity"""
+        with mock.patch.object(Activity.objects, 'mongo_aggregate') as aggregate:
+            user = self.client.get('/api/analytics/user/?email=other@hero.com')
+            team = self.client.get('/api/analytics/team/?team=Test Team')
+        aggregate.assert_not_called()
+        self.assertEqual(user.data['percentile'], 25.0)
+        self.assertEqual(team.data['percentile'], 75.0)
+    
+    def test_analytics_cache_invalidated_on_write(self):
+        """Test that a new activity invalidates the cached user analytics"""
+        self.client.get('/api/analytics/user/?email=other@hero.com')
+        Activity.objects.create(
+            user_email='other@hero.com',
+            activity_type='Cycling',
+            duration=20,
+            calories_burned=150,
+            date=date.today()
+        )
+        response = self.client.get('/api/analytics/user/?email=other@hero.com')
+        self.assertEqual(response.data['total_calories'], 250)
+    
+    def test_analytics_requires_email(self):
+        """Test that user analytics requires an email parameter"""
+        response = self.client.get('/api/analytics/user/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class WorkoutRecommendationTest(APITestCase):
+    """Test cases for workout recommendations"""
+    
+    def setUp(self):
+        Workout.objects.create(
+            name='Easy Stretch', description='Gentle yoga', activity_type='Yoga',
+            difficulty='Beginner', estimated_calories=150, duration=30
+        )
+        Workout.objects.create(
+            name='Tempo Run', description='Steady running', activity_type='Running',
+            difficulty='Intermediate', estimated_calories=400, duration=40
+        )
+        Workout.objects.create(
+            name='Ultra Run', description='Very long run', activity_type='Running',
+            difficulty='Expert', estimated_calories=1200, duration=150
+        )
+        for day in range(4):
+            Activity.objects.create(
+                user_email='runner@hero.com',
+                activity_type='Running',
+                duration=40,
+                calories_burned=380,
+                date=date.today() - timedelta(days=day)
+            )
+    
+    def test_recommendations_match_recent_activity(self):
+        """Test that workouts similar to recent activity rank first"""
+        response = self.client.get('/api/workouts/recommended/?email=runner@hero.com&k=2')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([w['name'] for w in response.data], ['Tempo Run', 'Ultra Run'])
+        self.assertGreater(response.data[0]['score'], response.data[1]['score'])
+    
+    def test_cold_start_prefers_beginner_workouts(self):
+        """Test that users without history get approachable workouts"""
+        response = self.client.get('/api/workouts/recommended/?email=new@hero.com&k=1')
+        self.assertEqual(response.data[0]['name'], 'Easy Stretch')
+    
+    def test_profile_reads_only_recent_activities(self):
+        """Test that the recent window is applied by the activity query"""
+        for day in range(5):
+            Activity.objects.create(
+                user_email='runner@hero.com', activity_type='Yoga', duration=60,
+                calories_burned=150, date=date.today() - timedelta(days=60 + day)
+            )
+        with mock.patch.object(Activity.objects, 'mongo_find', wraps=Activity.objects.mongo_find) as find:
+            profile = UserProfile.for_user('runner@hero.com')
+        self.assertEqual(profile.type_counts, {'Running': 4})
+        self.assertEqual(profile.avg_calories, 380.0)
+        self.assertIn('$gte', find.call_args.args[0]['date'])
+    
+    def test_index_rebuilt_when_catalog_changes(self):
+        """Test that new workouts are picked up by the index"""
+        self.client.get('/api/workouts/recommended/?email=runner@hero.com')
+        Workout.objects.create(
+            name='Perfect Run', description='Exactly right', activity_type='Running',
+            difficulty='Intermediate', estimated_calories=380, duration=40
+        )
+        response = self.client.get('/api/workouts/recommended/?email=runner@hero.com&k=1')
+        self.assertEqual(response.data[0]['name'], 'Perfect Run')
+
+
+class SearchAPITest(APITestCase):
+    """Test cases for Search API endpoint"""
+    
+    def setUp(self):
+        for index in search.indexes.values():
+            index.reset()
+        User.objects.create(name='Tony Stark', email='ironman@marvel.com', team='Team Marvel')
+        User.objects.create(name='Steve Rogers', email='captain@marvel.com', team='Team Marvel')
+        Team.objects.create(name='Team Marvel', description='Mightiest heroes')
+        Workout.objects.create(
+            name='Speed Force Sprint', description='Interval training', activity_type='Running',
+            difficulty='Intermediate', estimated_calories=400, duration=30
+        )
+    
+    def test_prefix_search_across_types(self):
+        """Test that prefixes match users, teams and workouts"""
+        response = self.client.get('/api/search/?q=sta')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([u['name'] for u in response.data['users']], ['Tony Stark'])
+        self.assertEqual(response.data['teams'], [])
+        response = self.client.get('/api/search/?q=mar&type=teams')
+        self.assertEqual([t['name'] for t in response.data['teams']], ['Team Marvel'])
+    
+    def test_all_terms_must_match(self):
+        """Test that multi-term queries intersect"""
+        response = self.client.get('/api/search/?q=marvel cap&type=users')
+        self.assertEqual([u['email'] for u in response.data['users']], ['captain@marvel.com'])
+    
+    def test_index_updated_on_save_and_delete(self):
+        """Test that the index follows saves and deletes"""
+        self.client.get('/api/search/?q=sprint')
+        workout = Workout.objects.get(name='Speed Force Sprint')
+        workout.name = 'Lightning Dash'
+        workout.save()
+        response = self.client.get('/api/search/?q=sprint&type=workouts')
+        self.assertEqual(response.data['workouts'], [])
+        response = self.client.get('/api/search/?q=light&type=workouts')
+        self.assertEqual(len(response.data['workouts']), 1)
+        workout.delete()
+        response = self.client.get('/api/search/?q=light&type=workouts')
+        self.assertEqual(response.data['workouts'], [])
+    
+    def test_write_during_build_is_kept(self):
+        """Test that an update landing while the index is being built is applied to it"""
+        index = search.indexes['users']
+        values_list = User.objects.values_list
+        late = User(_id=ObjectId(), name='Bruce Banner', email='hulk@marvel.com', team='Team Marvel')
+        writers = []
+        
+        def read_then_write(*fields):
+            rows = list(values_list(*fields))
+            writer = threading.Thread(target=index.update, args=(late,))
+            writer.start()
+            writer.join(0.1)
+            writers.append(writer)
+            return rows
+        
+        with mock.patch.object(User.objects, 'values_list', side_effect=read_then_write):
+            index.search('tony')
+        writers[0].join()
+        self.assertEqual([u['email'] for u in index.search('bruce')], ['hulk@marvel.com'])
+    
+    def test_writes_from_other_workers_are_picked_up(self):
+        """Test that a write published by another process rebuilds the index"""
+        index = search.indexes['users']
+        index.search('tony')
+        User.objects.mongo_insert_one(
+            {'_id': ObjectId(), 'name': 'Bruce Banner', 'email': 'hulk@marvel.com', 'team': 'Team Marvel'}
+        )
+        self.assertEqual(index.search('bruce'), [])
+        # What the other process's index publishes after its write
+        versions.advance(index.version_name, None)
+        self.assertEqual([u['email'] for u in index.search('bruce')], ['hulk@marvel.com'])
+    
+    def test_own_writes_do_not_rebuild(self):
+        """Test that a write made in this process is applied without rereading the collection"""
+        index = search.indexes['users']
+        index.search('tony')
+        with mock.patch.object(User.objects, 'values_list', wraps=User.objects.values_list) as values_list:
+            User.objects.create(name='Bruce Banner', email='hulk@marvel.com', team='Team Marvel')
+            self.assertEqual([u['email'] for u in index.search('bruce')], ['hulk@marvel.com'])
+        values_list.assert_not_called()
+    
+    def test_limit_must_be_positive(self):
+        """Test that zero and negative limits are rejected"""
+        for limit in (0, -1):
+            response = self.client.get(f'/api/search/?q=sta&limit={limit}')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        with self.assertRaises(ValueError):
+            search.indexes['users'].search('sta', 0)
+    
+    def test_admin_search_uses_index(self):
+        """Test that the admin search backend resolves results from the index"""
+        from django.contrib import admin as django_admin
+        model_admin = django_admin.site._registry[User]
+        queryset, may_have_duplicates = model_admin.get_search_results(None, User.objects.all(), 'tony')
+        self.assertFalse(may_have_duplicates)
+        self.assertEqual([u.email for u in queryset], ['ironman@marvel.com'])
+
+
+class LargeCollectionAdminTest(TestCase):
+    """Test cases for the large-collection admin mode"""
+    
+    def setUp(self):
+        cache.clear()
+        for i in range(12):
+            Activity.objects.create(
+                user_email=f'hero{i}@hero.com',
+                activity_type=['Running', 'Yoga'][i % 2],
+                duration=30,
+                calories_burned=300,
+                date=date.today() - timedelta(days=i // 3)
+            )
+    
+    def test_keyset_pages_match_offset_pages(self):
+        """Test that keyset pages return the same rows as offset pages"""
+        queryset = Activity.objects.order_by('-date', '-pk')
+        expected = [a.pk for a in queryset]
+        paginator = KeysetPaginator(queryset, 5, client='a')
+        pages = [[a.pk for a in paginator.page(n)] for n in (1, 2, 3)]
+        self.assertEqual(pages[0] + pages[1] + pages[2], expected)
+        self.assertEqual(cache.get(paginator._anchor_key(2))[1], pages[1][-1])
+        self.assertEqual(paginator.count, 12)
+    
+    def test_anchors_are_not_shared_between_clients(self):
+        """Test that one client's anchor does not change another client's page"""
+        queryset = Activity.objects.order_by('-date', '-pk')
+        first = [a.pk for a in KeysetPaginator(queryset, 5, client='a').page(1)]
+        for i in range(3):
+            Activity.objects.create(
+                user_email=f'late{i}@hero.com',
+                activity_type='Running',
+                duration=30,
+                calories_burned=300,
+                date=date.today()
+            )
+        expected = [a.pk for a in queryset][5:10]
+        self.assertEqual([a.pk for a in KeysetPaginator(queryset, 5, client='b').page(2)], expected)
+        self.assertEqual([a.pk for a in KeysetPaginator(queryset, 5).page(2)], expected)
+        # The client that saw page 1 continues right after its last row
+        second = [a.pk for a in KeysetPaginator(queryset, 5, client='a').page(2)]
+        self.assertEqual(second, [a.pk for a in queryset][8:13])
+        self.assertFalse(set(first) & set(second))
+    
+    def test_changelist_uses_cached_facets(self):
+        """Test that the activity changelist renders with cached facet choices"""
+        from django.contrib.auth import get_user_model
+        admin_user = get_user_model().objects.create_superuser('admin', 'admin@hero.com', 'password')
+        self.client.force_login(admin_user)
+        response = self.client.get('/admin/octofit_tracker/activity/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(cache.get('admin-facets:activities:activity_type'), ['Running', 'Yoga'])
+        response = self.client.get('/admin/octofit_tracker/activity/?activity_type=Yoga')
+        self.assertEqual(response.context['cl'].result_count, 6)
+
+
+class LeaderboardMaintenanceTest(TestCase):
+    """Test cases for leaderboard maintenance on activity writes"""
+    
+    def setUp(self):
+        User.objects.create(name='Tony Stark', email='ironman@marvel.com', team='Team Marvel')
+        User.objects.create(name='Bruce Wayne', email='batman@dc.com', team='Team DC')
+    
+    def log(self, email, calories):
+        return Activity.objects.create(
+            user_email=email,
+            activity_type='Running',
+            duration=30,
+            calories_burned=calories,
+            date=date.today()
+        )
+    
+    def ranks(self):
+        return {e.user_email: (e.rank, e.total_calories) for e in Leaderboard.objects.all()}
+    
+    def test_activity_creates_ranked_entry(self):
+        """Test that the first activity creates a leaderboard entry"""
+        self.log('ironman@marvel.com', 300)
+        entry = Leaderboard.objects.get(user_email='ironman@marvel.com')
+        self.assertEqual(entry.user_name, 'Tony Stark')
+        self.assertEqual(entry.team, 'Team Marvel')
+        self.assertEqual((entry.rank, entry.total_calories, entry.total_activities), (1, 300, 1))
+    
+    def test_ranks_follow_totals(self):
+        """Test that overtaking, editing and deleting activities move ranks"""
+        self.log('ironman@marvel.com', 300)
+        activity = self.log('batman@dc.com', 200)
+        self.assertEqual(self.ranks(), {'ironman@marvel.com': (1, 300), 'batman@dc.com': (2, 200)})
+        activity.calories_burned = 500
+        activity.save()
+        self.assertEqual(self.ranks(), {'ironman@marvel.com': (2, 300), 'batman@dc.com': (1, 500)})
+        activity.delete()
+        self.assertEqual(self.ranks(), {'ironman@marvel.com': (1, 300), 'batman@dc.com': (2, 0)})
+    
+    def test_equal_totals_share_rank(self):
+        """Test competition ranking for tied totals"""
+        self.log('ironman@marvel.com', 300)
+        self.log('batman@dc.com', 300)
+        self.assertEqual(self.ranks(), {'ironman@marvel.com': (1, 300), 'batman@dc.com': (1, 300)})
+    
+    def test_racing_first_activity_adds_to_existing_entry(self):
+        """Test that an upsert losing the race for a new entry increments the winner's"""
+        self.log('batman@dc.com', 100)
+        increment = leaderboard._increment
+        calls = []
+        
+        def racing(email, calories, activities, upsert=False, users=None):
+            # The entry appears between the first lookup and the upsert
+            calls.append(upsert)
+            if len(calls) == 1:
+                return None
+            if upsert:
+                raise DuplicateKeyError('E11000 duplicate key error')
+            return increment(email, calories, activities)
+        
+        with mock.patch.object(leaderboard, '_increment', side_effect=racing):
+            leaderboard.apply_activity('batman@dc.com', 50)
+        self.assertEqual(calls, [False, True, False])
+        with self.assertRaises(DuplicateKeyError):
+            Leaderboard.objects.mongo_insert_one({'user_email': 'batman@dc.com', 'total_calories': 0})
+        self.assertEqual(Leaderboard.objects.filter(user_email='batman@dc.com').count(), 1)
+        self.assertEqual(self.ranks(), {'batman@dc.com': (1, 150)})
+    
+    def test_batch_looks_up_new_users_together(self):
+        """Test that a batch creating several entries resolves their users with one query"""
+        with CaptureQueriesContext(connection) as queries:
+            leaderboard.apply_activities({
+                'ironman@marvel.com': (300, 1), 'batman@dc.com': (200, 1), 'ghost@dc.com': (100, 1),
+            })
+        self.assertEqual(len([q for q in queries.captured_queries if 'users' in q['sql']]), 1)
+        entries = {e.user_email: (e.user_name, e.rank) for e in Leaderboard.objects.all()}
+        self.assertEqual(entries, {
+            'ironman@marvel.com': ('Tony Stark', 1), 'batman@dc.com': ('Bruce Wayne', 2),
+            'ghost@dc.com': ('ghost@dc.com', 3),
+        })
+    
+    def test_rerank_corrects_drift(self):
+        """Test that rerank_leaderboard recomputes ranks from totals"""
+        self.log('ironman@marvel.com', 300)
+        self.log('batman@dc.com', 200)
+        self.log('flash@dc.com', 200)
+        Leaderboard.objects.mongo_update_many({}, {'$set': {'rank': 7}})
+        out = io.StringIO()
+        call_command('rerank_leaderboard', stdout=out)
+        self.assertIn('Corrected 3 ranks', out.getvalue())
+        self.assertEqual(self.ranks(), {
+            'ironman@marvel.com': (1, 300), 'batman@dc.com': (2, 200), 'flash@dc.com': (2, 200),
+        })
+        self.assertEqual(leaderboard.rerank(), 0)
+
+
+class LeaderboardStreamTest(TestCase):
+    """Test cases for the leaderboard Server-Sent Events stream"""
+    
+    def setUp(self):
+        Leaderboard.objects.create(
+            user_email='test@hero.com', user_name='Test Hero', team='Test Team',
+            total_calories=100, total_activities=1, rank=1
+        )
+    
+    def test_stream_pushes_snapshot_and_rank_changes(self):
+        """Test that subscribers get a snapshot, then a delta after an activity write"""
+        import asyncio
+        import json
+        from asgiref.sync import async_to_sync, sync_to_async
+        from .streaming import leaderboard_stream, broadcaster
+        
+        async def scenario():
+            sent = []
+            disconnect = asyncio.Event()
+            
+            async def receive():
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+            
+            async def send(message):
+                sent.append(message)
+            
+            stream = asyncio.ensure_future(leaderboard_stream({'type': 'http'}, receive, send))
+            while len(sent) < 2:
+                await asyncio.sleep(0.01)
+            await sync_to_async(Activity.objects.create)(
+                user_email='new@hero.com', activity_type='Running',
+                duration=30, calories_burned=500, date=date.today()
+            )
+            while len(sent) < 3:
+                await asyncio.sleep(0.01)
+            disconnect.set()
+            await stream
+            return sent
+        
+        sent = async_to_sync(scenario)()
+        self.assertEqual(sent[0]['headers'][0], (b'content-type', b'text/event-stream'))
+        self.assertTrue(sent[1]['body'].startswith(b'event: snapshot\n'))
+        event, data = sent[2]['body'].decode().strip().split('\n')
+        self.assertEqual(event, 'event: ranks')
+        delta = json.loads(data[len('data: '):])
+        self.assertEqual(
+            [(e['user_email'], e['rank']) for e in delta['changed']],
+            [('new@hero.com', 1), ('test@hero.com', 2)]
+        )
+        self.assertEqual(broadcaster._subscribers, set())
+
+
+class IdempotentActivityAPITest(APITestCase):
+    """Test cases for Idempotency-Key handling on activity creation"""
+    
+    def setUp(self):
+        self.activity = {
+            'user_email': 'retry@hero.com',
+            'activity_type': 'Running',
+            'duration': 30,
+            'calories_burned': 300,
+            'date': str(date.today())
+        }
+    
+    def post(self, data, key):
+        return self.client.post('/api/activities/', data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+    
+    def test_retry_replays_response_without_duplicate(self):
+        """Test that a retried request does not create a second activity"""
+        first = self.post(self.activity, 'key-1')
+        second = self.post(self.activity, 'key-1')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.data['_id'], first.data['_id'])
+        self.assertEqual(Activity.objects.count(), 1)
+        self.assertEqual(Leaderboard.objects.get(user_email='retry@hero.com').total_calories, 300)
+    
+    def test_key_reused_with_different_body(self):
+        """Test that reusing a key for another payload is rejected"""
+        self.post(self.activity, 'key-2')
+        response = self.post(dict(self.activity, duration=45), 'key-2')
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Activity.objects.count(), 1)
+    
+    def test_key_in_progress_conflicts(self):
+        """Test that a concurrent retry of an unfinished request conflicts"""
+        idempotency.claim('activities.create', 'key-3', idempotency.fingerprint(self.activity))
+        response = self.post(self.activity, 'key-3')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Activity.objects.count(), 0)
+    
+    def test_abandoned_claim_is_taken_over(self):
+        """Test that a retry takes over a claim whose request never finished"""
+        fingerprint = idempotency.fingerprint(self.activity)
+        abandoned, _ = idempotency.claim('activities.create', 'key-5', fingerprint)
+        IdempotencyKey.objects.mongo_update_one(
+            {'key': 'activities.create:key-5'},
+            {'$set': {'leased_at': datetime.utcnow() - timedelta(seconds=settings.IDEMPOTENCY_LEASE_SECONDS + 1)}},
+        )
+        self.assertEqual(
+            self.post(dict(self.activity, duration=45), 'key-5').status_code, status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+        response = self.post(self.activity, 'key-5')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        # The original request finishing late does not overwrite the retry's response
+        idempotency.complete('activities.create', 'key-5', abandoned, 500, {})
+        replayed = self.post(self.activity, 'key-5')
+        self.assertEqual(replayed['Idempotent-Replayed'], 'true')
+        self.assertEqual(replayed.data['_id'], response.data['_id'])
+        self.assertEqual(Activity.objects.count(), 1)
+    
+    def test_validation_failure_is_replayed(self):
+        """Test that validation failures are replayed too"""
+        invalid = dict(self.activity, duration='abc')
+        self.assertEqual(self.post(invalid, 'key-4').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.post(invalid, 'key-4').status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class WriteAdmissionControlTest(APITestCase):
+    """Test cases for write throttling and load shedding"""
+    
+    def setUp(self):
+        caches['throttle'].clear()
+        self.activity = {
+            'user_email': 'busy@hero.com',
+            'activity_type': 'Running',
+            'duration': 30,
+            'calories_burned': 300,
+            'date': str(date.today())
+        }
+    
+    def test_token_bucket_limits_writes_not_reads(self):
+        """Test that a burst past the bucket is throttled while reads pass"""
+        rates = {'writes': '100/min', 'activities': '2/min'}
+        with mock.patch.object(EndpointWriteThrottle, 'THROTTLE_RATES', rates):
+            for _ in range(2):
+                response = self.client.post('/api/activities/', self.activity, format='json')
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            response = self.client.post('/api/activities/', self.activity, format='json')
+            self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            self.assertIn('Retry-After', response)
+            self.assertEqual(self.client.get('/api/activities/').status_code, status.HTTP_200_OK)
+    
+    def test_concurrent_writes_cannot_overdraw_limit(self):
+        """Test that a client flooding from many threads gets exactly its rate"""
+        self.addCleanup(sys.setswitchinterval, sys.getswitchinterval())
+        sys.setswitchinterval(1e-6)
+        request = RequestFactory().post('/api/activities/', REMOTE_ADDR='10.0.0.1')
+        request.user = None
+        admitted = []
+        start = threading.Barrier(16)
+        
+        def flood():
+            start.wait()
+            for _ in range(5):
+                admitted.append(ClientWriteThrottle().allow_request(request, None))
+        
+        with mock.patch.object(ClientWriteThrottle, 'THROTTLE_RATES', {'writes': '20/min'}):
+            threads = [threading.Thread(target=flood) for _ in range(16)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(admitted.count(True), 20)
+    
+    def test_concurrency_cap_rejects_excess_writes(self):
+        """Test that writes beyond the per-viewset cap are rejected"""
+        slots = ActivityViewSet._get_write_slots()
+        held = 0
+        while slots.acquire(blocking=False):
+            held += 1
+        try:
+            response = self.client.post('/api/activities/', self.activity, format='json')
+            self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+            self.assertIn('Retry-After', response)
+        finally:
+            for _ in range(held):
+                slots.release()
+        response = self.client.post('/api/activities/', self.activity, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+    
+    def test_writes_shed_when_pool_wait_is_high(self):
+        """Test load shedding on Mongo pool wait time"""
+        with mock.patch.object(pool_monitor, '_sample', (10.0, time.monotonic())):
+            response = self.client.post('/api/activities/', self.activity, format='json')
+            self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+            self.assertEqual(self.client.get('/api/activities/').status_code, status.HTTP_200_OK)
+        self.assertEqual(Activity.objects.count(), 0)
+    
+    def test_pool_wait_decays_without_checkouts(self):
+        """Test that writes are admitted again once the pool has been idle a while"""
+        idle = 10 * settings.MONGO_POOL_WAIT_HALF_LIFE
+        with mock.patch.object(pool_monitor, '_sample', (10.0, time.monotonic() - idle)):
+            self.assertLess(pool_monitor.average_wait, settings.MONGO_POOL_WAIT_SHED_THRESHOLD)
+            response = self.client.post('/api/activities/', self.activity, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+
+class WorkoutCatalogTest(APITestCase):
+    """Test cases for the in-memory workout catalog snapshot"""
+    
+    def setUp(self):
+        Workout.objects.create(
+            name='Tempo Run', description='Steady running', activity_type='Running',
+            difficulty='Intermediate', estimated_calories=400, duration=40
+        )
+        Workout.objects.create(
+            name='Easy Stretch', description='Gentle yoga', activity_type='Yoga',
+            difficulty='Beginner', estimated_calories=150, duration=30
+        )
+    
+    def test_catalog_endpoints_skip_database(self):
+        """Test that list and lookup actions make no database queries"""
+        catalog.snapshot()
+        with CaptureQueriesContext(connection) as queries:
+            listed = self.client.get('/api/workouts/')
+            by_type = self.client.get('/api/workouts/by_type/?type=Yoga')
+            by_difficulty = self.client.get('/api/workouts/by_difficulty/?difficulty=Expert')
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(len(listed.data), 2)
+        self.assertEqual([w['name'] for w in by_type.data], ['Easy Stretch'])
+        self.assertEqual(by_difficulty.data, [])
+    
+    def test_snapshot_swapped_on_save_and_delete(self):
+        """Test that saves and deletes publish a new snapshot"""
+        before = catalog.snapshot()
+        workout = Workout.objects.get(name='Tempo Run')
+        workout.difficulty = 'Advanced'
+        workout.save()
+        self.assertIsNot(catalog.snapshot(), before)
+        self.assertEqual(before.by_difficulty['Intermediate'][0]['name'], 'Tempo Run')
+        self.assertEqual(catalog.snapshot().by_difficulty['Advanced'][0]['name'], 'Tempo Run')
+        workout.delete()
+        self.assertEqual(len(self.client.get('/api/workouts/').data), 1)
+    
+    def test_reload_when_another_process_bumps_version(self):
+        """Test that a version bump from another worker triggers a reload"""
+        catalog.snapshot()
+        Workout.objects.mongo_update_one({'name': 'Easy Stretch'}, {'$set': {'duration': 20}})
+        versions.bump('workouts')
+        response = self.client.get('/api/workouts/by_type/?type=Yoga')
+        self.assertEqual(response.data[0]['duration'], 20)
+
+
+class APIProfileTest(APITestCase):
+    """Test cases for the API-only runtime profile"""
+    
+    def test_profile_drops_admin_and_sessions(self):
+        """Test that the API profile installs no admin, session or template machinery"""
+        self.assertNotIn('django.contrib.admin', settings_api.INSTALLED_APPS)
+        self.assertNotIn('django.contrib.sessions', settings_api.INSTALLED_APPS)
+        self.assertFalse(any('Session' in name or 'Csrf' in name for name in settings_api.MIDDLEWARE))
+        self.assertEqual(settings_api.TEMPLATES, [])
+        self.assertNotIn(
+            'rest_framework.renderers.BrowsableAPIRenderer',
+            settings_api.REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'],
+        )
+    
+    def test_warm_preloads_catalog(self):
+        """Test that warm-up loads the workout catalog before the first request"""
+        Workout.objects.create(
+            name='Warm Up', description='Light jog', activity_type='Running',
+            difficulty='Beginner', estimated_calories=100, duration=10
+        )
+        warmup.warm()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/workouts/')
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(response.data[0]['name'], 'Warm Up')
+
+
+class UserExpansionAPITest(APITestCase):
+    """Test cases for ?expand=user on activities and leaderboard"""
+    
+    def setUp(self):
+        for i in range(3):
+            User.objects.create(name=f'Hero {i}', email=f'hero{i}@marvel.com', team='Team Marvel')
+            for day in range(2):
+                Activity.objects.create(
+                    user_email=f'hero{i}@marvel.com', activity_type='Running',
+                    duration=30, calories_burned=100 + i, date=date.today() - timedelta(days=day)
+                )
+        Activity.objects.create(
+            user_email='ghost@marvel.com', activity_type='Yoga',
+            duration=20, calories_burned=50, date=date.today()
+        )
+    
+    def test_list_expands_users_with_one_query(self):
+        """Test that expanding a list resolves all users with a single query"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/activities/?expand=user')
+        user_queries = [q for q in queries.captured_queries if 'users' in q['sql']]
+        self.assertEqual(len(user_queries), 1)
+        self.assertEqual(len(response.data), 7)
+        by_email = {item['user_email']: item['user'] for item in response.data}
+        self.assertEqual(by_email['hero1@marvel.com']['name'], 'Hero 1')
+        self.assertIsNone(by_email['ghost@marvel.com'])
+    
+    def test_leaderboard_expand_and_default(self):
+        """Test that leaderboard entries expand only when asked"""
+        expanded = self.client.get('/api/leaderboard/?expand=user')
+        self.assertEqual(expanded.data[0]['user']['email'], 'hero2@marvel.com')
+        plain = self.client.get('/api/leaderboard/')
+        self.assertNotIn('user', plain.data[0])
+    
+    def test_loader_identity_map(self):
+        """Test that the loader fetches each email once and returns the same instance"""
+        loader = UserLoader()
+        with CaptureQueriesContext(connection) as queries:
+            users = loader.load_many(['hero0@marvel.com', 'hero1@marvel.com', 'nobody@marvel.com'])
+            again = loader.load('hero0@marvel.com')
+            missing = loader.load('nobody@marvel.com')
+        self.assertEqual(len(queries), 1)
+        self.assertIs(again, users['hero0@marvel.com'])
+        self.assertIsNone(missing)
+
+
+class ActivityWriteBehindTest(APITestCase):
+    """Test cases for the activity write-behind journal"""
+    
+    def setUp(self):
+        self.runtime_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.runtime_dir.cleanup)
+        override = self.settings(ACTIVITY_WRITE_BEHIND=True, OCTOFIT_RUNTIME_DIR=self.runtime_dir.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(activity_journal.close)
+        self.journal_dir = os.path.join(self.runtime_dir.name, 'journal')
+    
+    def _activity(self, email, calories):
+        return {
+            'user_email': email, 'activity_type': 'Running', 'duration': 30,
+            'calories_burned': calories, 'date': str(date.today()),
+        }
+    
+    def test_writes_acknowledged_then_group_committed(self):
+        """Test that journaled writes reach Mongo with merged leaderboard updates"""
+        ids = []
+        for calories in (100, 200, 300):
+            response = self.client.post('/api/activities/', self._activity('thor@marvel.com', calories), format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            ids.append(response.data['_id'])
+        activity_journal.close()
+        self.assertEqual(
+            sorted(str(pk) for pk in Activity.objects.values_list('_id', flat=True)), sorted(ids)
+        )
+        entry = Leaderboard.objects.get(user_email='thor@marvel.com')
+        self.assertEqual((entry.total_calories, entry.total_activities, entry.rank), (600, 3, 1))
+        self.assertEqual(os.listdir(self.journal_dir), [])
+    
+    def test_replay_recovers_unflushed_entries(self):
+        """Test that a crashed worker's journal is replayed and totals reconciled"""
+        first = Activity.objects.create(
+            user_email='hulk@marvel.com', activity_type='Running', duration=30,
+            calories_burned=100, date=date.today()
+        )
+        os.makedirs(self.journal_dir)
+        lines = []
+        for seq, calories in ((1, 100), (2, 250), (3, 50)):
+            document = {
+                '_id': first._id if seq == 1 else ObjectId(), 'user_email': 'hulk@marvel.com',
+                'activity_type': 'Running', 'duration': 30, 'calories_burned': calories,
+                'date': datetime(2026, 1, 1), 'created_at': datetime(2026, 1, 1),
+            }
+            lines.append(json_util.dumps({'seq': seq, 'doc': document}))
+            if seq == 1:
+                lines.append(json_util.dumps({'flushed': 1}))
+        with open(os.path.join(self.journal_dir, 'activities-1-dead.journal'), 'w') as journal:
+            journal.write('\n'.join(lines) + '\n{"seq": 4, "doc"')
+        self.assertEqual(ActivityJournal().replay_orphans(self.journal_dir), 2)
+        self.assertEqual(Activity.objects.filter(user_email='hulk@marvel.com').count(), 3)
+        entry = Leaderboard.objects.get(user_email='hulk@marvel.com')
+        self.assertEqual((entry.total_calories, entry.total_activities), (400, 3))
+        self.assertEqual(os.listdir(self.journal_dir), [])
+    
+    def test_partially_written_batch_is_reconciled(self):
+        """Test that activities written before a failed insert still reach the leaderboard"""
+        insert_many = Activity.objects.mongo_insert_many
+        
+        def fail_midway(documents, **kwargs):
+            insert_many(documents[:1], **kwargs)
+            raise AutoReconnect('connection lost')
+        
+        activity_journal.open()
+        with activity_journal._flush_lock:
+            for calories in (100, 200):
+                activity_journal.append(dict(self._activity('thor@marvel.com', calories), date=date.today()))
+            with mock.patch.object(Activity.objects, 'mongo_insert_many', side_effect=fail_midway):
+                with self.assertRaises(AutoReconnect):
+                    activity_journal._flush()
+        activity_journal.close()
+        self.assertEqual(Activity.objects.filter(user_email='thor@marvel.com').count(), 2)
+        entry = Leaderboard.objects.get(user_email='thor@marvel.com')
+        self.assertEqual((entry.total_calories, entry.total_activities), (300, 2))
+
+
+class LeaderboardStandingAPITest(APITestCase):
+    """Test cases for /api/leaderboard/me/"""
+    
+    def setUp(self):
+        for i, (team, calories) in enumerate([
+            ('Team Marvel', 500), ('Team DC', 400), ('Team Marvel', 300),
+            ('Team DC', 300), ('Team Marvel', 200), ('Team DC', 100),
+        ]):
+            User.objects.create(name=f'Hero {i}', email=f'hero{i}@heroes.com', team=team)
+            Activity.objects.create(
+                user_email=f'hero{i}@heroes.com', activity_type='Running',
+                duration=30, calories_burned=calories, date=date.today()
+            )
+    
+    def test_global_and_team_standing(self):
+        """Test rank, percentile and neighbours on the board and within the team"""
+        response = self.client.get('/api/leaderboard/me/?email=hero2@heroes.com&k=1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        board = response.data['global']
+        self.assertEqual((board['rank'], board['size'], board['percentile']), (3, 6, 66.7))
+        self.assertEqual([e['user_email'] for e in board['above']], ['hero1@heroes.com'])
+        self.assertEqual([e['user_email'] for e in board['below']], ['hero3@heroes.com'])
+        team = response.data['team']
+        self.assertEqual((team['name'], team['rank'], team['size']), ('Team Marvel', 2, 3))
+        self.assertEqual([e['user_email'] for e in team['above']], ['hero0@heroes.com'])
+        self.assertEqual([e['user_email'] for e in team['below']], ['hero4@heroes.com'])
+    
+    def test_edges_of_board(self):
+        """Test that the top and bottom entries have no neighbours past the edge"""
+        top = self.client.get('/api/leaderboard/me/?email=hero0@heroes.com&k=2').data['global']
+        self.assertEqual((top['rank'], top['percentile'], top['above']), (1, 100.0, []))
+        self.assertEqual(len(top['below']), 2)
+        bottom = self.client.get('/api/leaderboard/me/?email=hero5@heroes.com&k=10').data['global']
+        self.assertEqual(len(bottom['above']), 5)
+        self.assertEqual(bottom['below'], [])
+    
+    def test_zero_neighbours(self):
+        """Test that k=0 returns the standing with no neighbours rather than the whole board"""
+        response = self.client.get('/api/leaderboard/me/?email=hero2@heroes.com&k=0')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['global']['rank'], 3)
+        self.assertEqual((response.data['global']['above'], response.data['global']['below']), ([], []))
+        self.assertEqual((response.data['team']['above'], response.data['team']['below']), ([], []))
+    
+    def test_position_indexes_follow_board_order(self):
+        """Test that the neighbour and rerank sorts match the position index keys"""
+        indexes = Leaderboard.objects.mongo_index_information()
+        self.assertEqual(indexes['leaderboard_position_idx']['key'], leaderboard.POSITION_ORDER)
+        self.assertEqual(
+            indexes['leaderboard_team_position_idx']['key'], [('team', 1)] + leaderboard.POSITION_ORDER
+        )
+    
+    def test_validation(self):
+        """Test errors for a missing email, bad k and unknown users"""
+        self.assertEqual(self.client.get('/api/leaderboard/me/').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            self.client.get('/api/leaderboard/me/?email=hero0@heroes.com&k=x').status_code,
+            status.HTTP_400_BAD_REQUEST,
+        )
+        self.assertEqual(
+            self.client.get('/api/leaderboard/me/?email=nobody@heroes.com').status_code,
+            status.HTTP_404_NOT_FOUND,
+        )
+
+
+class SyncAPITest(APITestCase):
+    """Test cases for the /api/sync/ change feed"""
+    
+    def setUp(self):
+        self.user = User.objects.create(name='Tony Stark', email='ironman@marvel.com', team='Team Marvel')
+        self.token = self.client.get('/api/sync/').data['next']
+    
+    def test_sync_returns_only_changes_since_token(self):
+        """Test that inserts, updates and deletes after the token are returned"""
+        team = Team.objects.create(name='Team Marvel', description='Avengers')
+        self.user.name = 'Iron Man'
+        self.user.save()
+        team_id = str(team.pk)
+        team.delete()
+        Activity.objects.create(
+            user_email='ironman@marvel.com', activity_type='Flying',
+            duration=30, calories_burned=300, date=date.today()
+        )
+        response = self.client.get(f'/api/sync/?since={self.token}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data
+        self.assertFalse(data['reset'])
+        self.assertGreater(data['next'], self.token)
+        self.assertEqual([u['name'] for u in data['changes']['users']['upserted']], ['Iron Man'])
+        self.assertEqual(data['changes']['teams'], {'upserted': [], 'deleted': [team_id]})
+        self.assertEqual(len(data['changes']['activities']['upserted']), 1)
+        self.assertEqual(data['changes']['leaderboard']['upserted'][0]['total_calories'], 300)
+        self.assertNotIn('workouts', data['changes'])
+        again = self.client.get(f"/api/sync/?since={data['next']}").data
+        self.assertEqual(again['changes'], {})
+        self.assertEqual(again['next'], data['next'])
+    
+    def test_rank_shifts_recorded(self):
+        """Test that entries moved by another user's activity appear in the feed"""
+        for email, calories in (('a@marvel.com', 100), ('b@marvel.com', 200)):
+            Activity.objects.create(
+                user_email=email, activity_type='Running', duration=10, calories_burned=calories, date=date.today()
+            )
+        token = self.client.get('/api/sync/').data['next']
+        Activity.objects.create(
+            user_email='a@marvel.com', activity_type='Running', duration=10, calories_burned=500, date=date.today()
+        )
+        entries = self.client.get(f'/api/sync/?since={token}').data['changes']['leaderboard']['upserted']
+        self.assertEqual({(e['user_email'], e['rank']) for e in entries}, {('a@marvel.com', 1), ('b@marvel.com', 2)})
+    
+    def test_limit_pages_through_changes(self):
+        """Test that a limited sync reports more and resumes from its token"""
+        for i in range(3):
+            Team.objects.create(name=f'Team {i}', description='')
+        first = self.client.get(f'/api/sync/?since={self.token}&limit=2').data
+        self.assertTrue(first['more'])
+        second = self.client.get(f"/api/sync/?since={first['next']}&limit=2").data
+        self.assertFalse(second['more'])
+        names = [t['name'] for page in (first, second) for t in page['changes']['teams']['upserted']]
+        self.assertEqual(names, ['Team 0', 'Team 1', 'Team 2'])
+    
+    def test_gap_waits_for_in_flight_write(self):
+        """Test that reading stops at a fresh gap in the sequence"""
+        changes.allocate(changes.SEQUENCE_NAME)
+        Team.objects.create(name='Team Late', description='')
+        with self.settings(CHANGE_FEED_SETTLE_SECONDS=60):
+            blocked = self.client.get(f'/api/sync/?since={self.token}').data
+        self.assertEqual((blocked['next'], blocked['more']), (self.token, True))
+        with self.settings(CHANGE_FEED_SETTLE_SECONDS=0):
+            settled = self.client.get(f'/api/sync/?since={self.token}').data
+        self.assertEqual(settled['changes']['teams']['upserted'][0]['name'], 'Team Late')
+    
+    def test_pruned_token_requires_reset(self):
+        """Test that a token older than the retained feed asks for a full reload"""
+        Team.objects.create(name='Team Old', description='')
+        changes.prune(timedelta(0))
+        response = self.client.get(f'/api/sync/?since={self.token}')
+        self.assertTrue(response.data['reset'])
+        self.assertEqual(self.client.get('/api/sync/?since=abc').status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RosterImportTest(APITestCase):
+    """Test cases for bulk roster imports"""
+    
+    def setUp(self):
+        search.indexes['users'].reset()
+        search.indexes['teams'].reset()
+        User.objects.create(name='Tony Stark', email='ironman@marvel.com', team='Team Marvel')
+        Team.objects.create(name='Team Marvel', description='Avengers')
+    
+    def _report(self, response):
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        return lines[:-1], lines[-1]['summary']
+    
+    def test_csv_user_import(self):
+        """Test that a CSV import reports every row and creates missing teams"""
+        search.indexes['users'].search('x')
+        body = (
+            'name,email,team\n'
+            'Peter Parker,spiderman@marvel.com,Team Marvel\n'
+            'Tony Stark,ironman@marvel.com,Team Marvel\n'
+            'Nobody,not-an-email,Team Marvel\n'
+            'Bruce Wayne,batman@dc.com,Team DC\n'
+            'Bruce Again,batman@dc.com,Team DC\n'
+        )
+        response = self.client.generic('POST', '/api/roster/users/', body, content_type='text/csv')
+        rows, summary = self._report(response)
+        self.assertEqual(
+            [(row['line'], row['status']) for row in rows],
+            [(2, 'created'), (3, 'exists'), (4, 'invalid'), (5, 'created'), (6, 'duplicate')],
+        )
+        self.assertEqual(summary, {'created': 2, 'exists': 1, 'invalid': 1, 'duplicate': 1})
+        self.assertEqual(User.objects.get(email='batman@dc.com').name, 'Bruce Wayne')
+        self.assertEqual(Team.objects.filter(name='Team DC').count(), 1)
+        self.assertEqual(search.indexes['users'].search('spider')[0]['email'], 'spiderman@marvel.com')
+    
+    def test_csv_fields_may_span_lines(self):
+        """Test that quoted CSV fields keep their line breaks"""
+        body = 'name,description\r\n"Team DC","Justice League\r\nof America"\r\nTeam X,Mutants\r\n'
+        rows, summary = self._report(
+            self.client.generic('POST', '/api/roster/teams/', body, content_type='text/csv')
+        )
+        self.assertEqual(summary, {'created': 2})
+        self.assertEqual(Team.objects.get(name='Team DC').description, 'Justice League\r\nof America')
+    
+    def test_ordered_ndjson_team_import_stops_at_failure(self):
+        """Test that an ordered import skips the rows after an insert failure"""
+        body = '\n'.join([
+            json.dumps({'name': 'Team DC', 'description': 'Justice League'}),
+            '{not json',
+            json.dumps({'name': 'Team X', 'description': 'Mutants'}),
+        ])
+        with mock.patch.object(roster, '_insert', return_value=([], {0: {'code': 2, 'errmsg': 'boom'}})):
+            rows, summary = self._report(self.client.generic(
+                'POST', '/api/roster/teams/?ordered=true', body, content_type='application/x-ndjson'
+            ))
+        self.assertEqual([row['status'] for row in rows], ['failed', 'invalid', 'skipped'])
+        self.assertEqual(rows[0]['error'], 'boom')
+    
+    def test_unsupported_content_type(self):
+        """Test that bodies other than CSV and NDJSON are rejected"""
+        response = self.client.post('/api/roster/users/', {'name': 'x'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+    
+    def test_management_command(self):
+        """Test that import_roster loads a file and prints a summary"""
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as roster_file:
+            roster_file.write('name,email,team\n')
+            for i in range(25):
+                roster_file.write(f'Student {i},student{i}@school.edu,Class A\n')
+        self.addCleanup(os.unlink, roster_file.name)
+        output = io.StringIO()
+        call_command('import_roster', roster_file.name, stdout=output)
+        self.assertIn('25 created', output.getvalue())
+        self.assertEqual(User.objects.filter(team='Class A').count(), 25)
+
+
+class BadgeEngineTest(APITestCase):
+    """Test cases for incremental badge evaluation"""
+    
+    def _log(self, days_ago, activity_type='Running', calories=300, duration=30):
+        return Activity.objects.create(
+            user_email='flash@dc.com', activity_type=activity_type, duration=duration,
+            calories_burned=calories, date=date.today() - timedelta(days=days_ago)
+        )
+    
+    def _badges(self):
+        return {award['slug'] for award in self.client.get('/api/badges/user/?email=flash@dc.com').data}
+    
+    def test_engine_only_checks_crossed_thresholds(self):
+        """Test that crossing evaluates the touched metrics by threshold"""
+        engine = badges.BadgeEngine([
+            badges.Rule('a', 'A', '', 'calories', 100),
+            badges.Rule('b', 'B', '', 'calories', 200),
+            badges.Rule('c', 'C', '', 'type_count', 1, 'Yoga'),
+        ])
+        before = badges.new_state()
+        after, keys = badges.advance(before, [
+            {'activity_type': 'Running', 'calories_burned': 250, 'duration': 10, 'date': date.today()}
+        ])
+        self.assertEqual([rule.slug for rule in engine.crossed(before, after, keys)], ['a', 'b'])
+        with self.assertRaises(ValueError):
+            badges.Rule('d', 'D', '', 'type_count', 1)
+    
+    def test_awards_on_activity_writes(self):
+        """Test that streak, calorie and count badges are awarded as activities arrive"""
+        self._log(2)
+        self.assertEqual(self._badges(), {'first-steps'})
+        self._log(1, calories=400)
+        self._log(0, calories=400, duration=10)
+        self.assertEqual(self._badges(), {'first-steps', 'on-a-roll', 'spark', 'hour-of-power'})
+        state = BadgeState.objects.get(user_email='flash@dc.com')
+        self.assertEqual((state.activities, state.calories, state.streak, state.type_counts), (3, 1100, 3, [{'type': 'Running', 'count': 3}]))
+    
+    def test_backdated_and_deleted_activities_rebuild_state(self):
+        """Test that out-of-order days and deletes recompute the state from history"""
+        self._log(0)
+        self._log(2)
+        self._log(1)
+        state = BadgeState.objects.get(user_email='flash@dc.com')
+        self.assertEqual(state.longest_streak, 3)
+        self.assertIn('on-a-roll', self._badges())
+        Activity.objects.filter(user_email='flash@dc.com').first().delete()
+        self.assertEqual(BadgeState.objects.get(user_email='flash@dc.com').activities, 2)
+        self.assertIn('on-a-roll', self._badges())
+    
+    def test_activity_types_are_not_field_names(self):
+        """Test that activity types with dots or dollars are stored and counted"""
+        self._log(1, activity_type='Run 5.5km')
+        self._log(0, activity_type='$x')
+        self._log(0, activity_type='Run 5.5km')
+        state = badges._load_states(['flash@dc.com'])['flash@dc.com'][0]
+        self.assertEqual(state['type_counts'], {'Run 5.5km': 2, '$x': 1})
+    
+    def test_badge_catalog(self):
+        """Test that the rule catalog and parameter validation are served"""
+        response = self.client.get('/api/badges/')
+        self.assertEqual(len(response.data), len(badges.RULES))
+        self.assertEqual(self.client.get('/api/badges/user/').status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ChallengeEngineTest(APITestCase):
+    """Test cases for fitness challenges and their standings"""
+    
+    def setUp(self):
+        User.objects.create(name='Flash', email='flash@dc.com', team='Team DC')
+        User.objects.create(name='Diana', email='diana@dc.com', team='Team DC')
+        User.objects.create(name='Tony', email='tony@marvel.com', team='Team Marvel')
+    
+    def _challenge(self, **fields):
+        data = dict(
+            name='October burn', start=date.today() - timedelta(days=7), end=date.today() + timedelta(days=7),
+            metric='calories',
+        )
+        data.update(fields)
+        return Challenge.objects.create(**data)
+    
+    def _log(self, email, calories=100, days_ago=0, activity_type='Running'):
+        return Activity.objects.create(
+            user_email=email, activity_type=activity_type, duration=30,
+            calories_burned=calories, date=date.today() - timedelta(days=days_ago)
+        )
+    
+    def _standings(self, challenge, query=''):
+        return self.client.get(f'/api/challenges/{challenge.pk}/standings/{query}').data
+    
+    def test_progress_follows_activity_writes(self):
+        """Test that creates, edits and deletes adjust progress incrementally"""
+        challenge = self._challenge()
+        first = self._log('flash@dc.com', 300)
+        self._log('diana@dc.com', 200)
+        self._log('flash@dc.com', 500, days_ago=30)
+        first.calories_burned = 100
+        first.save()
+        self._log('tony@marvel.com', 400).delete()
+        standings = self._standings(challenge)
+        self.assertEqual(
+            [(entry['rank'], entry['participant'], entry['value']) for entry in standings['results']],
+            [(1, 'diana@dc.com', 200), (2, 'flash@dc.com', 100)],
+        )
+        self.assertEqual(standings['participants'], 2)
+    
+    def test_type_count_and_team_scopes(self):
+        """Test that type_count counts one type and team challenges sum members"""
+        yoga = self._challenge(metric='type_count', activity_type='Yoga')
+        teams = self._challenge(metric='activities', scope='team')
+        self._log('flash@dc.com', activity_type='Yoga')
+        self._log('diana@dc.com')
+        self._log('tony@marvel.com', activity_type='Yoga')
+        self.assertEqual([entry['participant'] for entry in self._standings(yoga)['results']], ['flash@dc.com', 'tony@marvel.com'])
+        self.assertEqual(
+            [(entry['participant'], entry['value']) for entry in self._standings(teams)['results']],
+            [('Team DC', 2), ('Team Marvel', 1)],
+        )
+    
+    def test_new_challenge_is_built_from_history(self):
+        """Test that a challenge created mid-window counts earlier activities"""
+        self._log('flash@dc.com', 300, days_ago=3)
+        self._log('flash@dc.com', 200, days_ago=20)
+        challenge = self._challenge()
+        self.assertEqual(self._standings(challenge)['results'][0]['value'], 300)
+        challenge.start = date.today() - timedelta(days=30)
+        challenge.save()
+        self.assertEqual(self._standings(challenge)['results'][0]['value'], 500)
+        challenge_id = str(challenge.pk)
+        challenge.delete()
+        self.assertEqual(ChallengeProgress.objects.filter(challenge_id=challenge_id).count(), 0)
+    
+    def test_rebuild_overwrites_in_place(self):
+        """Test that an edit keeps live entries and drops participants no longer counted"""
+        self._log('flash@dc.com', 300, days_ago=3)
+        self._log('diana@dc.com', 200, days_ago=20)
+        challenge = self._challenge(start=date.today() - timedelta(days=30))
+        kept = ChallengeProgress.objects.get(challenge_id=str(challenge.pk), participant='flash@dc.com')
+        challenge.start = date.today() - timedelta(days=7)
+        challenge.save()
+        progress = ChallengeProgress.objects.filter(challenge_id=str(challenge.pk))
+        self.assertEqual([(entry.pk, entry.value) for entry in progress], [(kept.pk, 300)])
+    
+    def test_standings_pages_share_tied_ranks(self):
+        """Test that a later page ranks its first row by counting higher values"""
+        challenge = self._challenge()
+        for email, calories in [('flash@dc.com', 300), ('diana@dc.com', 200), ('tony@marvel.com', 200)]:
+            self._log(email, calories)
+        page = self._standings(challenge, '?offset=2&limit=1')['results']
+        self.assertEqual([(entry['rank'], entry['participant']) for entry in page], [(2, 'tony@marvel.com')])
+        self.assertEqual(self.client.get(f'/api/challenges/{challenge.pk}/standings/?limit=0').status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_challenge_validation_and_active_list(self):
+        """Test that windows and type_count definitions are validated"""
+        today = date.today()
+        response = self.client.post('/api/challenges/', {
+            'name': 'Backwards', 'start': str(today), 'end': str(today - timedelta(days=1)), 'metric': 'calories',
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post('/api/challenges/', {
+            'name': 'Yoga week', 'start': str(today), 'end': str(today + timedelta(days=6)), 'metric': 'type_count',
+        }, format='json')
+        self.assertIn('activity_type', response.data)
+        self._challenge(name='Finished', start=today - timedelta(days=20), end=today - timedelta(days=10))
+        self._challenge()
+        self.assertEqual([row['name'] for row in self.client.get('/api/challenges/active/').data], ['October burn'])
+
+
+class SharedCacheTest(APITestCase):
+    """Test cases for the cross-worker shared-memory cache"""
+    
+    def setUp(self):
+        self.runtime_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.runtime_dir.cleanup)
+        override = self.settings(OCTOFIT_RUNTIME_DIR=self.runtime_dir.name, SHARED_CACHE=True)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.builds = 0
+    
+    def _build(self):
+        self.builds += 1
+        return json.dumps([{'build': self.builds}]).encode()
+    
+    def test_workers_share_one_build_per_version(self):
+        """Test that a second worker maps the segment the first one built"""
+        first, second = SharedCache('things', self._build), SharedCache('things', self._build)
+        segment = first.get()
+        self.assertIsInstance(segment.payload, memoryview)
+        self.assertEqual(second.get().value(), [{'build': 1}])
+        self.assertIs(first.get(), segment)
+        second.changed()
+        self.assertEqual(first.get().value(), [{'build': 2}])
+        self.assertEqual(second.get().value(), [{'build': 2}])
+        self.assertEqual(self.builds, 2)
+    
+    def test_falls_back_to_per_process_cache(self):
+        """Test that a disabled or unusable segment directory caches per process"""
+        with self.settings(SHARED_CACHE=False):
+            self.assertIsInstance(SharedCache('things', self._build).get().payload, bytes)
+        blocker = os.path.join(self.runtime_dir.name, 'blocker')
+        open(blocker, 'w').close()
+        with self.settings(SHARED_CACHE_DIR=blocker):
+            with self.assertLogs('octofit_tracker.sharedcache', 'WARNING'):
+                local = SharedCache('things', self._build)
+                self.assertEqual(local.get().value(), [{'build': 2}])
+            self.assertIs(local.get().payload, local.get().payload)
+    
+    def test_leaderboard_served_from_segment(self):
+        """Test that the leaderboard list reads the segment until its max age passes after a write"""
+        override = self.settings(LEADERBOARD_MAX_STALENESS_MS=60000)
+        override.enable()
+        self.addCleanup(override.disable)
+        leaderboard.apply_activity('flash@dc.com', 300)
+        leaderboard.board.changed()
+        self.client.get('/api/leaderboard/')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/leaderboard/')
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(json.loads(response.content), response.data)
+        self.assertEqual(response.content, bytes(leaderboard.board.get().payload))
+        leaderboard.apply_activity('diana@dc.com', 500)
+        response = self.client.get('/api/leaderboard/')
+        self.assertEqual([entry['user_email'] for entry in response.data], ['flash@dc.com'])
+        with self.settings(LEADERBOARD_MAX_STALENESS_MS=0):
+            response = self.client.get('/api/leaderboard/')
+        self.assertEqual([entry['user_email'] for entry in response.data], ['diana@dc.com', 'flash@dc.com'])
+    
+    def test_batch_bumps_board_once(self):
+        """Test that a batch of leaderboard deltas publishes one new board version"""
+        with mock.patch.object(versions, 'bump', wraps=versions.bump) as bump:
+            leaderboard.apply_activities({'flash@dc.com': (300, 1), 'diana@dc.com': (500, 2), 'tony@marvel.com': (0, 0)})
+        self.assertEqual(bump.call_count, 1)
+
+
+class SlowQueryLogTest(APITestCase):
+    """Test cases for the slow query log"""
+    
+    plan = {
+        'queryPlanner': {'winningPlan': {'stage': 'SORT', 'inputStage': {'stage': 'COLLSCAN'}}},
+        'executionStats': {'nReturned': 3, 'totalKeysExamined': 0, 'totalDocsExamined': 5000},
+    }
+    
+    def setUp(self):
+        SlowQuery.objects.mongo_delete_many({})
+        override = self.settings(SLOW_QUERY_LOG=True, SLOW_QUERY_THRESHOLD_MS=100)
+        override.enable()
+        self.addCleanup(override.disable)
+        explain = mock.patch.object(slowlog, '_explain', return_value=self.plan)
+        self.explain = explain.start()
+        self.addCleanup(explain.stop)
+    
+    def _run(self, command, milliseconds, source, request_id=1):
+        token = slowlog._source.set(source)
+        try:
+            slowlog.recorder.started(monitoring.CommandStartedEvent(
+                dict(command, **{'$db': 'octofit_db', 'lsid': {'id': 1}}), 'octofit_db', request_id, ('localhost', 27017), request_id
+            ))
+        finally:
+            slowlog._source.reset(token)
+        slowlog.recorder.succeeded(monitoring.CommandSucceededEvent(
+            timedelta(milliseconds=milliseconds), {'ok': 1}, next(iter(command)), request_id, ('localhost', 27017), request_id
+        ))
+        slowlog.recorder.drain()
+    
+    def test_requests_attributed_to_view_action(self):
+        """Test that commands are attributed to the viewset action or admin view"""
+        factory = RequestFactory()
+        for path, expected in [
+            ('/api/activities/by_type/', 'ActivityViewSet.by_type'),
+            ('/admin/octofit_tracker/activity/', 'admin:octofit_tracker_activity_changelist'),
+        ]:
+            match = resolve(path)
+            
+            def handler(request):
+                middleware.process_view(request, match.func, (), {})
+                return slowlog.current_source()
+            
+            middleware = slowlog.SlowQueryMiddleware(handler)
+            request = factory.get(path)
+            request.resolver_match = match
+            self.assertEqual(middleware(request), expected)
+        self.assertIsNone(slowlog.current_source())
+    
+    def test_slow_commands_grouped_by_shape_and_explained_once(self):
+        """Test that queries differing only in values share one entry and one explain"""
+        query = {'find': 'activities', 'filter': {'user_email': 'a@dc.com', 'calories_burned': {'$gte': 500}}, 'sort': {'date': -1}}
+        self._run(query, 250, 'ActivityViewSet.by_user')
+        self._run(dict(query, filter={'user_email': 'b@dc.com', 'calories_burned': {'$gte': 10}}), 150, 'ActivityViewSet.list', 2)
+        self._run(dict(query, filter={'user_email': 'c@dc.com'}), 5, 'ActivityViewSet.list', 3)
+        entry = SlowQuery.objects.get(operation='find')
+        self.assertEqual((entry.count, entry.max_ms, entry.total_ms), (2, 250, 400))
+        self.assertEqual(sorted(entry.sources), ['ActivityViewSet.by_user', 'ActivityViewSet.list'])
+        self.assertEqual((entry.plan, entry.docs_examined, entry.returned), ('SORT > COLLSCAN', 5000, 3))
+        self.assertNotIn('lsid', entry.sample)
+        self.assertEqual(self.explain.call_count, 1)
+    
+    def test_report_lists_missing_indexes(self):
+        """Test that the report flags scans and skips shapes an index already serves"""
+        self._run({'find': 'activities', 'filter': {'user_email': 'a@dc.com', 'calories_burned': {'$gte': 500}}, 'sort': {'date': -1}}, 400, 'ActivityViewSet.list')
+        self._run({'find': 'activities', 'filter': {'activity_type': 'Yoga'}}, 200, 'ActivityViewSet.by_type', 2)
+        output = io.StringIO()
+        call_command('slow_queries', stdout=output)
+        report = output.getvalue()
+        self.assertIn('1. find activities from ActivityViewSet.list', report)
+        self.assertIn('missing index {user_email: 1, date: -1, calories_burned: 1}', report)
+        self.assertEqual(report.count('missing index'), 1)
+        call_command('slow_queries', '--clear', stdout=io.StringIO())
+        self.assertEqual(SlowQuery.objects.count(), 0)
+
+
+class SnapshotRestoreTest(APITestCase):
+    """Test cases for the snapshot and restore commands"""
+    
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        for i in range(5):
+            User.objects.create(name=f'Hero {i}', email=f'hero{i}@dc.com', team='Team DC')
+            Activity.objects.create(
+                user_email=f'hero{i}@dc.com', activity_type='Running', duration=30,
+                calories_burned=100 * i, date=date.today()
+            )
+        Team.objects.create(name='Team DC', description='Justice League')
+    
+    def _snapshot(self, *args):
+        output = io.StringIO()
+        call_command('snapshot', self.directory.name, '--chunk-documents', '2', *args, stdout=output)
+        return output.getvalue()
+    
+    def test_round_trip_restores_documents_and_indexes(self):
+        """Test that a restore brings back every document and index definition"""
+        report = self._snapshot()
+        self.assertIn('users: 5 documents', report)
+        files = os.listdir(self.directory.name)
+        self.assertIn('users.00002.bson.gz', files)
+        with self.assertRaises(CommandError):
+            call_command('restore', self.directory.name, stdout=io.StringIO())
+        token = changes.current()
+        User.objects.filter(email='hero0@dc.com').delete()
+        User.objects.create(name='Intruder', email='intruder@dc.com', team='Team DC')
+        self.assertEqual(len(search.indexes['users'].search('intruder')), 1)
+        output = io.StringIO()
+        call_command('restore', self.directory.name, '--drop', '--jobs', '3', stdout=output)
+        self.assertEqual(search.indexes['users'].search('intruder'), [])
+        self.assertEqual(len(search.indexes['users'].search('hero0')), 1)
+        self.assertIn('documents/s', output.getvalue())
+        self.assertEqual(
+            sorted(User.objects.values_list('email', flat=True)), [f'hero{i}@dc.com' for i in range(5)]
+        )
+        self.assertEqual(Activity.objects.get(user_email='hero4@dc.com').calories_burned, 400)
+        self.assertIn('activity_type_idx', Activity.objects.mongo_index_information())
+        self.assertTrue(any(index.get('unique') for index in User.objects.mongo_index_information().values()))
+        self.assertTrue(changes.is_expired(token))
+    
+    def test_restore_rebuilds_badges_and_challenges(self):
+        """Test that badge state and challenge progress follow the restored activities"""
+        challenge = Challenge.objects.create(
+            name='Sprint week', start=date.today() - timedelta(days=3), end=date.today() + timedelta(days=3),
+            metric='calories',
+        )
+        self._snapshot()
+        Activity.objects.create(
+            user_email='hero1@dc.com', activity_type='Running', duration=30,
+            calories_burned=5000, date=date.today()
+        )
+        self.assertIn('spark', {award['badge'] for award in BadgeAward.objects.mongo_find({'user_email': 'hero1@dc.com'})})
+        call_command('restore', self.directory.name, '--drop', stdout=io.StringIO())
+        state = BadgeState.objects.get(user_email='hero1@dc.com')
+        self.assertEqual((state.activities, state.calories), (1, 100))
+        self.assertEqual(BadgeAward.objects.filter(user_email='hero1@dc.com', badge='spark').count(), 0)
+        progress = ChallengeProgress.objects.get(challenge_id=str(challenge.pk), participant='hero1@dc.com')
+        self.assertEqual(progress.value, 100)
+    
+    def test_partial_restore_reconciles_leaderboard(self):
+        """Test that restoring activities alone brings leaderboard totals and ranks back in line"""
+        self._snapshot('--collection', 'activities')
+        Activity.objects.create(
+            user_email='hero1@dc.com', activity_type='Running', duration=30,
+            calories_burned=5000, date=date.today()
+        )
+        self.assertEqual(Leaderboard.objects.get(user_email='hero1@dc.com').rank, 1)
+        with mock.patch.object(badges, '_history', wraps=badges._history) as history:
+            call_command('restore', self.directory.name, '--drop', stdout=io.StringIO())
+        history.assert_not_called()
+        entries = {entry.user_email: entry for entry in Leaderboard.objects.all()}
+        self.assertEqual(entries['hero1@dc.com'].total_calories, 100)
+        self.assertEqual(entries['hero1@dc.com'].total_activities, 1)
+        self.assertEqual([entries[f'hero{i}@dc.com'].rank for i in range(5)], [5, 4, 3, 2, 1])
+        self.assertEqual(BadgeState.objects.get(user_email='hero4@dc.com').calories, 400)
+    
+    def test_subset_and_errors(self):
+        """Test that single collections restore and bad requests are refused"""
+        self._snapshot('--collection', 'teams')
+        with self.assertRaises(CommandError):
+            self._snapshot()
+        with self.assertRaises(CommandError):
+            call_command('restore', self.directory.name, '--collection', 'users', stdout=io.StringIO())
+        with self.assertRaises(CommandError):
+            call_command('restore', self.directory.name, '--drop', '--jobs', '0', stdout=io.StringIO())
+        Team.objects.all().delete()
+        call_command('restore', self.directory.name, stdout=io.StringIO())
+        self.assertEqual(list(Team.objects.values_list('name', flat=True)), ['Team DC'])
+
+
+class MemoryStorageTest(TestCase):
+    """Test cases for the in-process storage engine"""
+    
+    def _wrapper(self):
+        settings_dict = dict(connection.settings_dict, ENGINE='octofit_tracker.memorydb', NAME='octofit_memory_test')
+        wrapper = memorydb.DatabaseWrapper(settings_dict, alias='memory')
+        self.addCleanup(wrapper.close)
+        return wrapper
+    
+    def test_connections_share_process_store(self):
+        """Test that every connection reads the same in-memory data, even after closing"""
+        first, second = self._wrapper(), self._wrapper()
+        first.ensure_connection()
+        self.addCleanup(memorydb.client().drop_database, 'octofit_memory_test')
+        first.connection['things'].insert_one({'name': 'kept'})
+        first.close()
+        second.ensure_connection()
+        self.assertIs(second.connection.client, memorydb.client())
+        self.assertEqual(second.connection['things'].find_one({}, {'_id': 0}), {'name': 'kept'})
+    
+    def test_concurrent_updates_are_atomic(self):
+        """Test that $inc updates from many threads are all applied"""
+        wrapper = self._wrapper()
+        wrapper.ensure_connection()
+        self.addCleanup(memorydb.client().drop_database, 'octofit_memory_test')
+        counters = wrapper.connection['counters']
+        # Switch threads often enough to interleave unguarded updates
+        self.addCleanup(sys.setswitchinterval, sys.getswitchinterval())
+        sys.setswitchinterval(1e-6)
+        
+        def bump():
+            for _ in range(200):
+                counters.update_one({'name': 'hits'}, {'$inc': {'value': 1}}, upsert=True)
+        
+        threads = [threading.Thread(target=bump) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(list(counters.find({}, {'_id': 0}).sort('name').limit(5)), [{'name': 'hits', 'value': 1600}])
+    
+    def test_queries_read_through_indexes(self):
+        """Test that indexed queries only test matching documents and follow updates"""
+        wrapper = self._wrapper()
+        wrapper.ensure_connection()
+        self.addCleanup(memorydb.client().drop_database, 'octofit_memory_test')
+        entries = wrapper.connection['entries']
+        entries.create_index('email', unique=True)
+        entries.create_index([('total', -1), ('email', 1)])
+        entries.insert_many([{'email': f'user{i}@example.com', 'total': i * 10} for i in range(100)])
+        entries.update_one({'email': 'user5@example.com'}, {'$set': {'total': 5000}})
+        entries.delete_one({'email': 'user6@example.com'})
+        with mock.patch.object(indexes, 'filter_applies', wraps=indexes.filter_applies) as applies:
+            self.assertEqual(entries.find_one({'email': 'user7@example.com'})['total'], 70)
+            top = entries.find({'total': {'$gte': 950}}, {'_id': 0}).sort('total', -1)
+            self.assertEqual([row['email'] for row in top], ['user5@example.com', 'user99@example.com', 'user98@example.com', 'user97@example.com', 'user96@example.com', 'user95@example.com'])
+            self.assertEqual(entries.count_documents({'total': {'$in': [50, 60, 70]}}), 1)
+        self.assertEqual(applies.call_count, 1 + 6 + 1)
+        with self.assertRaises(DuplicateKeyError):
+            entries.insert_one({'email': 'user8@example.com', 'total': 0})
+    
+    def test_storage_setting_selects_engine(self):
+        """Test that the memory storage engine loads as a djongo backend"""
+        from . import settings as project_settings
+        backend = load_backend(project_settings.STORAGE_ENGINES['memory'])
+        self.assertIs(backend.DatabaseWrapper, memorydb.DatabaseWrapper)
+        self.assertEqual(backend.DatabaseWrapper.vendor, 'djongo')
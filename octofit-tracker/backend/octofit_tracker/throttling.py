@@ -0,0 +1,189 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from pymongo import monitoring
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class SlidingWindowThrottle(SimpleRateThrottle):
+    """
+    Sliding window limit on writes, kept in the shared throttle cache
+
+    A rate of ``N/period`` admits a write while the writes counted in the
+    current period, plus the previous period's count weighted by how much
+    of it still overlaps the window, stay within N. Counts only change
+    through the cache's atomic add/incr/decr, so concurrent requests from
+    one client cannot all pass on the same reading. Safe methods are never
+    throttled, so reads keep their latency while a client floods writes.
+    """
+
+    def __init__(self):
+        self.cache = caches[settings.THROTTLE_CACHE]
+        super().__init__()
+
+    def allow_request(self, request, view):
+        if request.method in SAFE_METHODS or self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        now = self.timer()
+        window, elapsed = divmod(now, self.duration)
+        current = f'{self.key}:{int(window)}'
+        self.cache.add(current, 0, self.duration * 2)
+        count = self.cache.incr(current)
+        previous = self.cache.get(f'{self.key}:{int(window) - 1}', 0)
+        if previous * (1 - elapsed / self.duration) + count <= self.num_requests:
+            return True
+        self.cache.decr(current)
+        # Admitted once the previous period's weight leaves room for one more
+        room = self.num_requests - count
+        if room >= 0 and previous:
+            self._wait = max(self.duration * (1 - room / previous) - elapsed, 0)
+        else:
+            self._wait = self.duration - elapsed
+        return False
+
+    def wait(self):
+        return self._wait
+
+
+class ClientWriteThrottle(SlidingWindowThrottle):
+    """Limits each user (or anonymous address) across all endpoints"""
+    scope = 'writes'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class EndpointWriteThrottle(ClientWriteThrottle):
+    """Limits each client on views that declare a ``throttle_scope``"""
+
+    def __init__(self):
+        # The scope comes from the view, so the rate is resolved per request
+        self.cache = caches[settings.THROTTLE_CACHE]
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, 'throttle_scope', None)
+        if not self.scope:
+            return True
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return super().allow_request(request, view)
+
+
+class PoolWaitMonitor(monitoring.ConnectionPoolListener):
+    """
+    Tracks how long requests wait to check a connection out of the Mongo
+    pool, as an exponentially weighted moving average in seconds
+
+    Between checkouts the average halves every MONGO_POOL_WAIT_HALF_LIFE
+    seconds. Shed writes never reach the pool, so without the decay a
+    worker receiving only writes would keep shedding on its last sample.
+    """
+    smoothing = 0.2
+
+    def __init__(self):
+        # The average and when it was last sampled, replaced together
+        self._sample = (0.0, time.monotonic())
+        self._started = threading.local()
+
+    @property
+    def average_wait(self):
+        average, at = self._sample
+        return average * 0.5 ** ((time.monotonic() - at) / settings.MONGO_POOL_WAIT_HALF_LIFE)
+
+    def record(self, seconds):
+        average = self.average_wait
+        self._sample = (average + self.smoothing * (seconds - average), time.monotonic())
+
+    def connection_check_out_started(self, event):
+        self._started.at = time.monotonic()
+
+    def connection_checked_out(self, event):
+        started = getattr(self._started, 'at', None)
+        if started is not None:
+            self.record(time.monotonic() - started)
+            self._started.at = None
+
+    def connection_check_out_failed(self, event):
+        started = getattr(self._started, 'at', None)
+        if started is not None:
+            self.record(time.monotonic() - started)
+            self._started.at = None
+
+    def pool_created(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
+
+
+pool_monitor = PoolWaitMonitor()
+
+
+class Overloaded(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Server is busy, retry later.'
+    default_code = 'overloaded'
+
+    def __init__(self, wait, detail=None):
+        super().__init__(detail)
+        self.wait = wait
+
+
+class AdmissionControlMixin:
+    """
+    Caps concurrent writes per viewset and sheds writes with 503 and
+    Retry-After while Mongo pool wait time is above the threshold
+    """
+    _write_slots = None
+    _write_slots_lock = threading.Lock()
+
+    @classmethod
+    def _get_write_slots(cls):
+        if cls.__dict__.get('_write_slots') is None:
+            with cls._write_slots_lock:
+                if cls.__dict__.get('_write_slots') is None:
+                    cls._write_slots = threading.BoundedSemaphore(settings.WRITE_CONCURRENCY_LIMIT)
+        return cls._write_slots
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            return
+        if pool_monitor.average_wait > settings.MONGO_POOL_WAIT_SHED_THRESHOLD:
+            raise Overloaded(wait=settings.OVERLOAD_RETRY_AFTER)
+        if not self._get_write_slots().acquire(blocking=False):
+            raise Overloaded(wait=settings.OVERLOAD_RETRY_AFTER)
+        request._holds_write_slot = True
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if getattr(request, '_holds_write_slot', False):
+            request._holds_write_slot = False
+            self._get_write_slots().release()
+        return super().finalize_response(request, response, *args, **kwargs)
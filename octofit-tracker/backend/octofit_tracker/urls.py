@@ -14,13 +14,14 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 import os
-from django.contrib import admin
+from django.apps import apps
 from django.urls import path, include
+from django.views.generic import RedirectView
 from rest_framework.routers import DefaultRouter
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
-from .views import UserViewSet, TeamViewSet, ActivityViewSet, LeaderboardViewSet, WorkoutViewSet
+from .views import UserViewSet, TeamViewSet, ActivityViewSet, LeaderboardViewSet, WorkoutViewSet, AnalyticsViewSet, SearchViewSet, SyncViewSet, RosterViewSet, BadgeViewSet, ChallengeViewSet
 
 # Get codespace environment variable for dynamic URL construction
 codespace_name = os.environ.get('CODESPACE_NAME')
@@ -40,6 +41,12 @@ def api_root(request, format=None):
         'activities': f"{base_url}/api/activities/",
         'leaderboard': f"{base_url}/api/leaderboard/",
         'workouts': f"{base_url}/api/workouts/",
+        'analytics': f"{base_url}/api/analytics/",
+        'search': f"{base_url}/api/search/",
+        'sync': f"{base_url}/api/sync/",
+        'roster': f"{base_url}/api/roster/",
+        'badges': f"{base_url}/api/badges/",
+        'challenges': f"{base_url}/api/challenges/",
     })
 
 # Create a router and register viewsets
@@ -49,9 +56,21 @@ router.register(r'teams', TeamViewSet)
 router.register(r'activities', ActivityViewSet)
 router.register(r'leaderboard', LeaderboardViewSet)
 router.register(r'workouts', WorkoutViewSet)
+router.register(r'analytics', AnalyticsViewSet, basename='analytics')
+router.register(r'search', SearchViewSet, basename='search')
+router.register(r'sync', SyncViewSet, basename='sync')
+router.register(r'roster', RosterViewSet, basename='roster')
+router.register(r'badges', BadgeViewSet, basename='badges')
+router.register(r'challenges', ChallengeViewSet)
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
+    path('', RedirectView.as_view(url='/api/', permanent=False)),
     path('api/', api_root, name='api-root'),
     path('api/', include(router.urls)),
 ]
+
+# The API-only profile (settings_api) runs without the admin site
+if apps.is_installed('django.contrib.admin'):
+    from django.contrib import admin
+
+    urlpatterns.insert(0, path('admin/', admin.site.urls))
@@ -0,0 +1,46 @@
+import fcntl
+import os
+import uuid
+
+from django.conf import settings
+
+
+def _path(name):
+    return os.path.join(settings.OCTOFIT_RUNTIME_DIR, f'{name}.version')
+
+
+def current(name):
+    """The version stamp of a named dataset, shared by all worker processes"""
+    try:
+        with open(_path(name)) as stamp:
+            return stamp.read()
+    except FileNotFoundError:
+        return ''
+
+
+def bump(name):
+    """Give a dataset a new version stamp and return it"""
+    os.makedirs(settings.OCTOFIT_RUNTIME_DIR, exist_ok=True)
+    version = uuid.uuid4().hex
+    path = _path(name)
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'w') as stamp:
+        stamp.write(version)
+    os.replace(temporary, path)
+    return version
+
+
+def advance(name, seen):
+    """
+    Bump a stamp; returns the new stamp if it was still ``seen``, else None
+
+    The check and the bump hold a file lock, so between processes that
+    advance the same stamp a caller holding ``seen`` knows no other write
+    was published since.
+    """
+    os.makedirs(settings.OCTOFIT_RUNTIME_DIR, exist_ok=True)
+    with open(f'{_path(name)}.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        unchanged = current(name) == seen
+        version = bump(name)
+    return version if unchanged else None
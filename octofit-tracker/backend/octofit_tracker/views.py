@@ -1,11 +1,93 @@
+import io
+import json
+from datetime import date
+
+from bson import ObjectId
+from django.conf import settings
+from django.http import Http404, StreamingHttpResponse
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from .models import User, Team, Activity, Leaderboard, Workout
-from .serializers import UserSerializer, TeamSerializer, ActivitySerializer, LeaderboardSerializer, WorkoutSerializer
+from rest_framework.reverse import reverse
+from .models import User, Team, Activity, Leaderboard, Workout, Challenge
+from .serializers import (
+    UserSerializer, TeamSerializer, ActivitySerializer, LeaderboardSerializer, WorkoutSerializer, ChallengeSerializer,
+)
+from .renderers import ArrowStreamRenderer, PrerenderedResponse, arrow_stream_response
+from . import badges, challenges, changes, idempotency, leaderboard, roster, search
+from .catalog import catalog
+from .journal import activity_journal
+from .throttling import AdmissionControlMixin
+
+
+class ArrowStreamMixin:
+    """
+    Streams list responses as Arrow record batches read directly from
+    the Mongo cursor when the client negotiates the arrow format
+    """
+
+    def list(self, request, *args, **kwargs):
+        if getattr(request.accepted_renderer, 'format', None) != ArrowStreamRenderer.format:
+            return super().list(request, *args, **kwargs)
+        queryset = self.get_queryset()
+        sort = [
+            (name.lstrip('-'), -1 if name.startswith('-') else 1)
+            for name in (queryset.query.order_by or queryset.model._meta.ordering)
+        ]
+        return arrow_stream_response(
+            queryset.model,
+            self.get_serializer_class().Meta.fields,
+            sort=sort or None,
+        )
+
+
+class IdempotentCreateMixin:
+    """
+    Makes create safe to retry: a request carrying an Idempotency-Key that
+    was already used replays the stored response instead of writing again
+    """
+    idempotency_scope = None
 
+    def create(self, request, *args, **kwargs):
+        key = request.headers.get(idempotency.IDEMPOTENCY_HEADER)
+        if key is None:
+            return super().create(request, *args, **kwargs)
+        if not key or len(key) > idempotency.MAX_KEY_LENGTH:
+            return Response(
+                {'error': f'{idempotency.IDEMPOTENCY_HEADER} must be 1-{idempotency.MAX_KEY_LENGTH} characters'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        request_hash = idempotency.fingerprint(request.data)
+        lease, record = idempotency.claim(self.idempotency_scope, key, request_hash)
+        if lease is None:
+            if record['request_hash'] != request_hash:
+                return Response(
+                    {'error': f'{idempotency.IDEMPOTENCY_HEADER} was already used with a different request'},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            if record['status_code'] is None:
+                return Response(
+                    {'error': f'a request with this {idempotency.IDEMPOTENCY_HEADER} is still in progress'},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            return Response(
+                json.loads(record['response_body']),
+                status=record['status_code'],
+                headers={'Idempotent-Replayed': 'true'},
+            )
+        try:
+            response = super().create(request, *args, **kwargs)
+        except Exception:
+            idempotency.release(self.idempotency_scope, key, lease)
+            raise
+        if response.status_code >= 500:
+            idempotency.release(self.idempotency_scope, key, lease)
+        else:
+            idempotency.complete(self.idempotency_scope, key, lease, response.status_code, response.data)
+        return response
 
-class UserViewSet(viewsets.ModelViewSet):
+
+class UserViewSet(AdmissionControlMixin, viewsets.ModelViewSet):
     """
     API endpoint for users
     """
@@ -22,7 +104,7 @@ class UserViewSet(viewsets.ModelViewSet):
         return Response({'error': 'team parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class TeamViewSet(viewsets.ModelViewSet):
+class TeamViewSet(AdmissionControlMixin, viewsets.ModelViewSet):
     """
     API endpoint for teams
     """
@@ -30,12 +112,20 @@ class TeamViewSet(viewsets.ModelViewSet):
     serializer_class = TeamSerializer
 
 
-class ActivityViewSet(viewsets.ModelViewSet):
+class ActivityViewSet(AdmissionControlMixin, IdempotentCreateMixin, ArrowStreamMixin, viewsets.ModelViewSet):
     """
     API endpoint for activities
     """
     queryset = Activity.objects.all()
     serializer_class = ActivitySerializer
+    idempotency_scope = 'activities.create'
+    throttle_scope = 'activities'
+
+    def perform_create(self, serializer):
+        if not settings.ACTIVITY_WRITE_BEHIND:
+            return super().perform_create(serializer)
+        # Acknowledged once journaled; the group commit inserts it shortly after
+        serializer.instance = activity_journal.append(serializer.validated_data)
 
     @action(detail=False, methods=['get'])
     def by_user(self, request):
@@ -56,13 +146,20 @@ class ActivityViewSet(viewsets.ModelViewSet):
         return Response({'error': 'type parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class LeaderboardViewSet(viewsets.ModelViewSet):
+class LeaderboardViewSet(AdmissionControlMixin, ArrowStreamMixin, viewsets.ModelViewSet):
     """
     API endpoint for leaderboard
     """
     queryset = Leaderboard.objects.all().order_by('rank')
     serializer_class = LeaderboardSerializer
 
+    def list(self, request, *args, **kwargs):
+        # Expansion and non-JSON formats render per request
+        if request.query_params or getattr(request.accepted_renderer, 'format', None) == ArrowStreamRenderer.format:
+            return super().list(request, *args, **kwargs)
+        segment = leaderboard.board.get()
+        return PrerenderedResponse(segment.payload, segment.value)
+
     @action(detail=False, methods=['get'])
     def by_team(self, request):
         team_name = request.query_params.get('team', None)
@@ -72,28 +169,285 @@ class LeaderboardViewSet(viewsets.ModelViewSet):
             return Response(serializer.data)
         return Response({'error': 'team parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['get'])
+    def me(self, request):
+        user_email = request.query_params.get('email', None)
+        if not user_email:
+            return Response({'error': 'email parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            k = int(request.query_params.get('k', leaderboard.DEFAULT_NEIGHBOURS))
+        except ValueError:
+            return Response({'error': 'k must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 <= k <= leaderboard.MAX_NEIGHBOURS:
+            return Response(
+                {'error': f'k must be between 0 and {leaderboard.MAX_NEIGHBOURS}'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        standing = leaderboard.standing(user_email, k)
+        if standing is None:
+            return Response({'error': 'no leaderboard entry for this email'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(standing)
+
 
-class WorkoutViewSet(viewsets.ModelViewSet):
+class WorkoutViewSet(AdmissionControlMixin, viewsets.ModelViewSet):
     """
     API endpoint for workouts
+
+    List and lookup actions are served from the in-memory catalog snapshot.
     """
     queryset = Workout.objects.all()
     serializer_class = WorkoutSerializer
 
+    def list(self, request, *args, **kwargs):
+        snapshot = catalog.snapshot()
+        return PrerenderedResponse(snapshot.payload, lambda: list(snapshot.workouts))
+
     @action(detail=False, methods=['get'])
     def by_difficulty(self, request):
         difficulty = request.query_params.get('difficulty', None)
         if difficulty:
-            workouts = Workout.objects.filter(difficulty=difficulty)
-            serializer = self.get_serializer(workouts, many=True)
-            return Response(serializer.data)
+            return Response(list(catalog.snapshot().by_difficulty.get(difficulty, ())))
         return Response({'error': 'difficulty parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
 
     @action(detail=False, methods=['get'])
     def by_type(self, request):
         activity_type = request.query_params.get('type', None)
         if activity_type:
-            workouts = Workout.objects.filter(activity_type=activity_type)
-            serializer = self.get_serializer(workouts, many=True)
-            return Response(serializer.data)
+            return Response(list(catalog.snapshot().by_type.get(activity_type, ())))
         return Response({'error': 'type parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['get'])
+    def recommended(self, request):
+        from .recommendations import DEFAULT_K, UserProfile, workout_index
+        user_email = request.query_params.get('email', None)
+        if not user_email:
+            return Response({'error': 'email parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            k = int(request.query_params.get('k', DEFAULT_K))
+        except ValueError:
+            return Response({'error': 'k must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if k < 1:
+            return Response({'error': 'k must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+        results = workout_index.recommend(UserProfile.for_user(user_email), k)
+        return Response([dict(workout, score=score) for workout, score in results])
+
+
+class AnalyticsViewSet(viewsets.ViewSet):
+    """
+    API endpoint for activity analytics
+
+    The NumPy-backed modules are imported on first use so they stay out of
+    worker start-up.
+    """
+
+    def list(self, request):
+        return Response({
+            'user': reverse('analytics-user', request=request),
+            'team': reverse('analytics-team', request=request),
+        })
+
+    @action(detail=False, methods=['get'])
+    def user(self, request):
+        email = request.query_params.get('email', None)
+        if email:
+            from .analytics import user_analytics
+            return Response(user_analytics(email))
+        return Response({'error': 'email parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['get'])
+    def team(self, request):
+        team_name = request.query_params.get('team', None)
+        if team_name:
+            from .analytics import team_analytics
+            return Response(team_analytics(team_name))
+        return Response({'error': 'team parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class BadgeViewSet(viewsets.ViewSet):
+    """
+    API endpoint for achievement badges
+    """
+
+    def list(self, request):
+        return Response([rule.as_dict() for rule in badges.engine.rules.values()])
+
+    @action(detail=False, methods=['get'])
+    def user(self, request):
+        user_email = request.query_params.get('email', None)
+        if user_email:
+            return Response(badges.awards_for(user_email))
+        return Response({'error': 'email parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class ChallengeViewSet(AdmissionControlMixin, viewsets.ModelViewSet):
+    """
+    API endpoint for fitness challenges
+    """
+    queryset = Challenge.objects.all()
+    serializer_class = ChallengeSerializer
+
+    def get_object(self):
+        # djongo only matches _id against an ObjectId, not its string form
+        lookup = self.kwargs[self.lookup_field]
+        if not ObjectId.is_valid(lookup):
+            raise Http404
+        self.kwargs[self.lookup_field] = ObjectId(lookup)
+        return super().get_object()
+
+    @action(detail=False, methods=['get'])
+    def active(self, request):
+        today = date.today()
+        serializer = self.get_serializer(Challenge.objects.filter(start__lte=today, end__gte=today), many=True)
+        return Response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def standings(self, request, pk=None):
+        challenge = self.get_object()
+        try:
+            offset = int(request.query_params.get('offset', 0))
+            limit = int(request.query_params.get('limit', challenges.DEFAULT_LIMIT))
+        except ValueError:
+            return Response({'error': 'offset and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if offset < 0 or not 1 <= limit <= challenges.MAX_LIMIT:
+            return Response(
+                {'error': f'offset must not be negative and limit must be between 1 and {challenges.MAX_LIMIT}'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(dict(challenges.standings(challenge, offset, limit), challenge=str(challenge.pk)))
+
+
+class SearchViewSet(viewsets.ViewSet):
+    """
+    API endpoint for prefix search over users, teams and workouts
+    """
+
+    def list(self, request):
+        query = request.query_params.get('q', '')
+        if not query.strip():
+            return Response({'error': 'q parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit', search.DEFAULT_LIMIT))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({'error': 'limit must be at least 1'}, status=status.HTTP_400_BAD_REQUEST)
+        kinds = request.query_params.get('type', None)
+        kinds = kinds.split(',') if kinds else list(search.indexes)
+        unknown = [kind for kind in kinds if kind not in search.indexes]
+        if unknown:
+            return Response({'error': f"unknown type: {', '.join(unknown)}"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({kind: search.indexes[kind].search(query, limit) for kind in kinds})
+
+
+class SyncViewSet(viewsets.ViewSet):
+    """
+    API endpoint for delta sync
+
+    ``?since=<token>`` returns the current state of every user, team,
+    activity, leaderboard entry and workout changed after the token, the
+    ids of those deleted, and the token to sync from next. Without a token,
+    or with one older than the retained feed, the response asks the client
+    to reload the full lists and sync from the returned token.
+    """
+    serializers = {
+        User: UserSerializer,
+        Team: TeamSerializer,
+        Activity: ActivitySerializer,
+        Leaderboard: LeaderboardSerializer,
+        Workout: WorkoutSerializer,
+    }
+    default_limit = 1000
+    max_limit = 5000
+
+    def list(self, request):
+        since = request.query_params.get('since', None)
+        try:
+            limit = int(request.query_params.get('limit', self.default_limit))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= limit <= self.max_limit:
+            return Response({'error': f'limit must be between 1 and {self.max_limit}'}, status=status.HTTP_400_BAD_REQUEST)
+        if since is None:
+            return Response({'reset': True, 'next': changes.current(), 'more': False, 'changes': {}})
+        try:
+            since = int(since)
+        except ValueError:
+            return Response({'error': 'since must be a sync token'}, status=status.HTTP_400_BAD_REQUEST)
+        if since < 0 or changes.is_expired(since):
+            return Response({'reset': True, 'next': changes.current(), 'more': False, 'changes': {}})
+
+        entries, more = changes.read(since, limit)
+        latest = {}
+        for entry in entries:
+            latest[entry['collection'], entry['object_id']] = entry['op']
+        upserted, deleted = {}, {}
+        for (collection, object_id), op in latest.items():
+            target = upserted if op == changes.UPSERT else deleted
+            target.setdefault(collection, []).append(object_id)
+
+        result = {}
+        for collection, object_ids in upserted.items():
+            model = changes.TRACKED_MODELS[collection]
+            objects = model.objects.filter(pk__in=[ObjectId(object_id) for object_id in object_ids])
+            data = self.serializers[model](objects, many=True, context={'request': request}).data
+            found = {str(item['_id']) for item in data}
+            result[collection] = {
+                'upserted': data,
+                # Deleted since this change was recorded
+                'deleted': [object_id for object_id in object_ids if object_id not in found],
+            }
+        for collection, object_ids in deleted.items():
+            result.setdefault(collection, {'upserted': [], 'deleted': []})['deleted'].extend(object_ids)
+        return Response({
+            'reset': False,
+            'next': entries[-1]['seq'] if entries else since,
+            'more': more,
+            'changes': result,
+        })
+
+
+class RosterViewSet(viewsets.ViewSet):
+    """
+    API endpoint for bulk roster imports
+
+    POST a CSV (``text/csv``) or NDJSON (``application/x-ndjson``) body to
+    ``users/`` or ``teams/``; ``?ordered=true`` stops at the first row that
+    fails to insert. The response streams one NDJSON report line per row
+    followed by a summary line.
+    """
+
+    def list(self, request):
+        return Response({
+            'users': reverse('roster-users', request=request),
+            'teams': reverse('roster-teams', request=request),
+        })
+
+    def _import(self, request, kind):
+        content_type = request.content_type.split(';')[0].strip().lower()
+        format = roster.CONTENT_TYPES.get(content_type)
+        if format is None:
+            return Response(
+                {'error': f"Content-Type must be one of {', '.join(roster.CONTENT_TYPES)}"},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            )
+        try:
+            text = request.body.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            return Response({'error': 'body must be UTF-8'}, status=status.HTTP_400_BAD_REQUEST)
+        ordered = request.query_params.get('ordered', 'false').lower() in ('1', 'true', 'yes')
+        importer = roster.RosterImport(kind, ordered=ordered)
+
+        def report():
+            for entry in importer.run(roster.read_rows(io.StringIO(text, newline=''), format)):
+                yield json.dumps(entry) + '\n'
+            yield json.dumps({'summary': dict(importer.summary)}) + '\n'
+
+        return StreamingHttpResponse(report(), content_type='application/x-ndjson')
+
+    @action(detail=False, methods=['post'])
+    def users(self, request):
+        return self._import(request, 'users')
+
+    @action(detail=False, methods=['post'])
+    def teams(self, request):
+        return self._import(request, 'teams')
@@ -0,0 +1,39 @@
+import logging
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.urls import get_resolver
+from pymongo.errors import PyMongoError
+
+from . import leaderboard, memorydb
+from .catalog import catalog
+from .journal import activity_journal
+
+
+logger = logging.getLogger(__name__)
+
+
+def warm():
+    """
+    Do the work of a first request before the worker accepts traffic: load
+    the URLconf, open the Mongo connection, map the shared workout catalog
+    and leaderboard segments and, in write-behind mode, replay journals
+    left by crashed workers. With the in-memory storage engine, whose
+    store starts empty in every process, the migrations are applied first.
+
+    A database failure is logged rather than raised so the worker still
+    starts; the connection and catalog are then set up on first use.
+    """
+    get_resolver().url_patterns
+    try:
+        connection.ensure_connection()
+        connection.connection.command('ping')
+        if memorydb.in_use(connection):
+            call_command('migrate', interactive=False, verbosity=0)
+        catalog.load()
+        leaderboard.board.get()
+        if settings.ACTIVITY_WRITE_BEHIND:
+            activity_journal.open()
+    except (DatabaseError, PyMongoError) as exc:
+        logger.warning('Start-up warm-up incomplete: %s', exc)
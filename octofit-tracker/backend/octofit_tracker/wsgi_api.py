@@ -0,0 +1,19 @@
+"""
+WSGI config for the API-only runtime profile of octofit_tracker.
+
+It exposes the WSGI callable as a module-level variable named ``application``
+using ``octofit_tracker.settings_api``, and warms the Mongo connection and
+in-memory caches before the worker takes its first request.
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'octofit_tracker.settings_api')
+
+application = get_wsgi_application()
+
+from .warmup import warm  # noqa: E402
+
+warm()